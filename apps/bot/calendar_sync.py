@@ -0,0 +1,89 @@
+import datetime
+
+from events_calendar import get_events_window, get_modified_events
+from models import Event
+from settings import CalendarConfiguration
+from utils import logger
+
+
+class CalendarSync:
+    """Local copy of the Teamup calendar window kept current with delta queries.
+
+    The first sync, and any sync after the cursor is lost or the window rolls
+    over to a new day, downloads the whole window. Every other sync asks
+    Teamup only for events modified since the last cursor and merges inserts,
+    updates and deletions into the local copy.
+    """
+
+    def __init__(self, days: "int | None" = None):
+        self.days = CalendarConfiguration.sync_days if days is None else days
+        self.window_start: "datetime.date | None" = None
+        self.cursor: "int | None" = None
+        self.events: dict[str, Event] = {}
+        self.full_syncs = 0
+        self.delta_syncs = 0
+
+    @property
+    def window_end(self) -> "datetime.date | None":
+        if self.window_start is None:
+            return None
+        return self.window_start + datetime.timedelta(days=self.days - 1)
+
+    def in_window(self, event: Event) -> bool:
+        return (
+            event.start.date() <= self.window_end
+            and event.end.date() >= self.window_start
+        )
+
+    def snapshot(self) -> "list[Event]":
+        return sorted(self.events.values(), key=lambda event: event.start)
+
+    async def sync(self) -> "list[Event] | None":
+        """Bring the local copy up to date. Returns None on API failure."""
+        today = datetime.date.today()
+        if self.cursor is None or self.window_start != today:
+            return await self.full_sync(today)
+        return await self.delta_sync()
+
+    async def full_sync(self, start: datetime.date) -> "list[Event] | None":
+        window = await get_events_window(
+            start, start + datetime.timedelta(days=self.days - 1)
+        )
+        if window is None:
+            return None
+        events, cursor = window
+        self.window_start = start
+        self.cursor = cursor
+        self.events = {str(event.event_id): event for event in events}
+        self.full_syncs += 1
+        logger.info(f"Full calendar sync loaded {len(events)} events")
+        return self.snapshot()
+
+    async def delta_sync(self) -> "list[Event] | None":
+        delta = await get_modified_events(self.cursor)
+        if delta is None:
+            # The cursor may have been rejected (Teamup only accepts recent ones);
+            # drop it so the next sync starts again from a full window.
+            self.cursor = None
+            return None
+        if delta["recurring"]:
+            logger.info("Recurring event changed, falling back to full calendar sync")
+            return await self.full_sync(self.window_start)
+
+        for event_id in delta["deleted"]:
+            self.events.pop(event_id, None)
+        for event in delta["changed"]:
+            event_id = str(event.event_id)
+            if self.in_window(event):
+                self.events[event_id] = event
+            else:
+                # Moved out of the window, or was never in it.
+                self.events.pop(event_id, None)
+
+        self.cursor = delta["timestamp"]
+        self.delta_syncs += 1
+        logger.info(
+            f"Delta calendar sync: {len(delta['changed'])} changed, "
+            f"{len(delta['deleted'])} deleted"
+        )
+        return self.snapshot()
@@ -0,0 +1,239 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+from telegram.ext import CallbackContext
+
+from sharding import shard_key
+from utils import logger
+
+DEADLINES_KEY = "onboarding_deadlines"
+
+# Heap entry layout: [due, sequence, kind, chat_id, user_id, data]
+DUE, SEQUENCE, KIND, CHAT_ID, USER_ID, DATA = range(6)
+
+# Chats whose due deadlines are worked through at the same time
+MAX_CONCURRENT_CHATS = 8
+
+
+class DeadlineScheduler:
+    """Onboarding deadlines in one min-heap, run by a single sweeper task.
+
+    The heap lives in ``bot_data`` so pending warnings, kicks and kick message
+    deletions survive a restart; deadlines that passed while the bot was down
+    run as soon as the sweeper starts. Each (kind, chat, user) has at most one
+    pending deadline. Cancelling marks the heap entry as dead instead of
+    removing it, and dead entries are compacted away once they make up half of
+    the heap. Each shard keeps its own heap under ``key``.
+
+    The sweeper does not run callbacks itself: due deadlines are handed to a
+    queue per chat, worked through in order by one task per chat, with at most
+    ``max_concurrent_chats`` chats at a time. A join raid throttled in one
+    group then does not hold back warnings and kicks elsewhere. Queued
+    deadlines can still be cancelled until they start.
+    """
+
+    def __init__(
+        self, key: str = DEADLINES_KEY, max_concurrent_chats: int = MAX_CONCURRENT_CHATS
+    ):
+        self.key = key
+        self.callbacks = {}
+        self._heap: list[list] = []
+        self._entries: dict[tuple, list] = {}
+        # Due entries waiting in a chat queue, by (kind, chat_id, user_id)
+        self._queued: dict[tuple, list] = {}
+        self._queues: dict[int, deque] = {}
+        self._workers: set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(max_concurrent_chats)
+        self._dead = 0
+        self._sequence = itertools.count()
+        self._application = None
+        self._task: "asyncio.Task | None" = None
+        self._wakeup = asyncio.Event()
+        self.completed = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._queued)
+
+    def register(self, kind: str, callback):
+        """Run ``callback(context, chat_id, user_id, data)`` for deadlines of ``kind``."""
+        self.callbacks[kind] = callback
+
+    def schedule(
+        self, kind: str, chat_id: int, user_id: int, delay: float, data=None
+    ) -> list:
+        self.cancel(chat_id, user_id, kind)
+        entry = [
+            time.time() + delay,
+            next(self._sequence),
+            kind,
+            chat_id,
+            user_id,
+            data,
+        ]
+        heapq.heappush(self._heap, entry)
+        self._entries[(kind, chat_id, user_id)] = entry
+        if self._heap[0] is entry:
+            self._wakeup.set()
+        return entry
+
+    def cancel(self, chat_id: int, user_id: int, *kinds: str) -> bool:
+        """Cancel pending deadlines of the given kinds. Returns True if any existed."""
+        cancelled = False
+        for kind in kinds:
+            entry = self._entries.pop((kind, chat_id, user_id), None)
+            if entry is not None:
+                entry[KIND] = None
+                self._dead += 1
+                cancelled = True
+            entry = self._queued.pop((kind, chat_id, user_id), None)
+            if entry is not None:
+                # Already out of the heap; the chat worker skips it
+                entry[KIND] = None
+                cancelled = True
+        if self._dead > len(self._heap) // 2:
+            self._compact()
+        return cancelled
+
+    def due(self, kind: str, chat_id: int, user_id: int) -> "float | None":
+        key = (kind, chat_id, user_id)
+        entry = self._entries.get(key) or self._queued.get(key)
+        return entry[DUE] if entry is not None else None
+
+    def start(self, application):
+        """Adopt the deadlines persisted in ``bot_data`` and start sweeping."""
+        self._application = application
+        persisted = application.bot_data.setdefault(self.key, [])
+        restored = [list(entry) for entry in persisted if entry[KIND] is not None]
+        # Deadlines scheduled before startup are kept alongside restored ones
+        pending = restored + [entry for entry in self._heap if entry[KIND] is not None]
+        self._entries = {}
+        for entry in sorted(pending, key=lambda entry: (entry[DUE], entry[SEQUENCE])):
+            self._entries[(entry[KIND], entry[CHAT_ID], entry[USER_ID])] = entry
+        persisted[:] = self._entries.values()
+        heapq.heapify(persisted)
+        self._heap = persisted
+        self._dead = 0
+        self._sequence = itertools.count(
+            max((entry[SEQUENCE] for entry in persisted), default=-1) + 1
+        )
+        overdue = sum(1 for entry in persisted if entry[DUE] <= time.time())
+        logger.info(
+            f"Restored {len(persisted)} onboarding deadlines ({overdue} overdue)"
+        )
+        self._task = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        """Stop sweeping; deadlines not yet run go back into the persisted heap."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        workers = list(self._workers)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _sweep(self):
+        while True:
+            self.dispatch_due()
+            self._wakeup.clear()
+            delay = self._heap[0][DUE] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def dispatch_due(self):
+        """Queue every deadline that has passed on its chat, earliest first."""
+        while self._heap and self._heap[0][DUE] <= time.time():
+            entry = heapq.heappop(self._heap)
+            kind = entry[KIND]
+            if kind is None:
+                self._dead -= 1
+                continue
+            key = (kind, entry[CHAT_ID], entry[USER_ID])
+            del self._entries[key]
+            self._queued[key] = entry
+            chat_id = entry[CHAT_ID]
+            queue = self._queues.get(chat_id)
+            if queue is None:
+                queue = self._queues[chat_id] = deque()
+                worker = asyncio.create_task(self._run_chat(chat_id, queue))
+                self._workers.add(worker)
+                worker.add_done_callback(self._workers.discard)
+            queue.append(entry)
+
+    async def run_due(self):
+        """Run every deadline that has passed and wait until they are done."""
+        self.dispatch_due()
+        while self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def _run_chat(self, chat_id: int, queue: deque):
+        current = None
+        try:
+            async with self._slots:
+                while queue:
+                    current = queue.popleft()
+                    if current[KIND] is not None:
+                        del self._queued[(current[KIND], chat_id, current[USER_ID])]
+                        await self._run(current)
+                    current = None
+        except asyncio.CancelledError:
+            for entry in ([current] if current is not None else []) + list(queue):
+                self._restore(entry)
+            queue.clear()
+            raise
+        finally:
+            if self._queues.get(chat_id) is queue:
+                del self._queues[chat_id]
+
+    def _restore(self, entry: list):
+        """Put a dispatched deadline that did not finish back into the heap."""
+        if entry[KIND] is None:
+            return
+        key = (entry[KIND], entry[CHAT_ID], entry[USER_ID])
+        if self._queued.get(key) is entry:
+            del self._queued[key]
+        if key in self._entries:
+            # Rescheduled while it was running
+            return
+        heapq.heappush(self._heap, entry)
+        self._entries[key] = entry
+
+    async def _run(self, entry: list):
+        kind, chat_id, user_id = entry[KIND], entry[CHAT_ID], entry[USER_ID]
+        callback = self.callbacks.get(kind)
+        if callback is None:
+            logger.error(f"No callback registered for {kind} deadline, dropping it")
+            return
+        try:
+            context = CallbackContext(
+                self._application, chat_id=chat_id, user_id=user_id
+            )
+            await context.refresh_data()
+            await callback(context, chat_id, user_id, entry[DATA])
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(
+                f"{kind} deadline for user {user_id} in chat {chat_id} failed: {e}",
+                exc_info=e,
+            )
+        finally:
+            self._application.mark_data_for_update_persistence(chat_ids=chat_id)
+
+    def _compact(self):
+        self._heap[:] = [entry for entry in self._heap if entry[KIND] is not None]
+        heapq.heapify(self._heap)
+        self._dead = 0
+
+
+deadline_scheduler = DeadlineScheduler(shard_key(DEADLINES_KEY))
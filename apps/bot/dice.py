@@ -1,42 +1,89 @@
-import urllib.request
-import json
+import copy
+from html.parser import HTMLParser
+
 from bs4 import BeautifulSoup
 
+import http_client
+from dice_id_store import dice_id_store
+from fetch_cache import provider_cache
 from utils import logger, format_event_date
 from models import Event
 
+PAGE_HEADERS = {
+    "User-Agent": http_client.BROWSER_USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+ITEM_ID_PROPERTY = "product:retailer_item_id"
 
-def get_dice_event_id(url) -> str:
-    try:
-        req = urllib.request.Request(url)
-        req.add_header(
-            "User-Agent",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:106.0) Gecko/20100101 Firefox/106.0",
-        )
-        req.add_header(
-            "Accept",
-            "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-        )
-        req.add_header("Accept-Language", "en-US,en;q=0.5")
 
-        logger.info(f"Retrieving the URL: {url}")
+class RetailerItemIdParser(HTMLParser):
+    """Incremental tokenizer that records the Dice item ID meta tag.
+
+    Fed the page chunk by chunk, so the download can stop as soon as the tag,
+    which Dice puts in ``<head>``, has been seen.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.item_id = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "meta" or self.item_id is not None:
+            return
+        attrs = dict(attrs)
+        if attrs.get("property") == ITEM_ID_PROPERTY:
+            self.item_id = attrs.get("content")
+
+    handle_startendtag = handle_starttag
+
+
+def find_item_id(html: str) -> str:
+    """Full-document fallback for pages the streaming parser could not read."""
+    soup = BeautifulSoup(html, "html.parser")
+    meta_tag = soup.find("meta", attrs={"property": ITEM_ID_PROPERTY})
+    return meta_tag.get("content") if meta_tag else None
 
-        response = urllib.request.urlopen(req, timeout=30)
-        if response.status != 200:
-            logger.error(f"Failed to retrieve the URL. Status code: {response.status}")
-            return None
 
-        logger.info(f"URL retrieved successfully. Status code: {response.status}")
+async def get_dice_event_id(url) -> str:
+    try:
+        logger.info(f"Retrieving the URL: {url}")
 
-        html = response.read()
-        soup = BeautifulSoup(html, "html.parser")
+        async with http_client.stream(
+            "GET", url, headers=PAGE_HEADERS, follow_redirects=True
+        ) as response:
+            if response.status_code != 200:
+                logger.error(
+                    f"Failed to retrieve the URL. Status code: {response.status_code}"
+                )
+                return None
+
+            logger.info(
+                f"URL retrieved successfully. Status code: {response.status_code}"
+            )
 
-        meta_tag = soup.find("meta", attrs={"property": "product:retailer_item_id"})
-        if meta_tag:
-            content = meta_tag.get("content")
-            return content
+            parser = RetailerItemIdParser()
+            chunks = []
+            # aiter_text decompresses and decodes the body as it arrives.
+            async for chunk in response.aiter_text():
+                chunks.append(chunk)
+                if parser is None:
+                    continue
+                try:
+                    parser.feed(chunk)
+                except Exception as e:
+                    # Keep downloading so the fallback sees the whole page.
+                    logger.warning(f"Streaming parse of Dice page failed: {e}")
+                    parser = None
+                    continue
+                if parser.item_id is not None:
+                    return parser.item_id
+
+        item_id = find_item_id("".join(chunks))
+        if item_id:
+            return item_id
         else:
-            logger.error("No meta tag with property='product:retailer_item_id' found.")
+            logger.error(f"No meta tag with property='{ITEM_ID_PROPERTY}' found.")
             return None
 
     except Exception as e:
@@ -45,11 +92,28 @@ def get_dice_event_id(url) -> str:
 
 
 async def process_dice_event(url: str) -> Event:
-    event_id = get_dice_event_id(url)
+    # Item IDs never change, so a link seen before skips the page scrape.
+    event_id = await dice_id_store.get(url)
     if event_id is None:
-        return
+        event_id = await get_dice_event_id(url)
+        if event_id is None:
+            return
+        await dice_id_store.put(url, event_id)
+
+    event = await provider_cache.get_or_fetch(
+        ("dice", event_id), lambda: fetch_dice_event(url, event_id)
+    )
+    if event is None:
+        return None
+
+    # The cached event is shared; hand out a copy carrying the caller's link.
+    event = copy.copy(event)
+    event.url = url
+    return event
+
 
-    event_data = get_event_details(event_id)
+async def fetch_dice_event(url: str, event_id: str) -> Event:
+    event_data = await get_event_details(event_id)
     if event_data is None:
         return
 
@@ -60,21 +124,22 @@ async def process_dice_event(url: str) -> Event:
         start_time=event_data["start_date"],
         end_time=event_data["end_date"],
         location=event_data["venue_address"],
+        source_id=event_id,
     )
 
     return event
 
 
-def get_event_details(item_id: str) -> dict:
+async def get_event_details(item_id: str) -> dict:
     try:
         url = f"https://api.dice.fm/events/{item_id}/ticket_types"
-        response = urllib.request.urlopen(url, timeout=30)
-        if response.status != 200:
+        response = await http_client.get(url)
+        if response.status_code != 200:
             logger.error(
-                f"Failed to retrieve event details. Status code: {response.status}"
+                f"Failed to retrieve event details. Status code: {response.status_code}"
             )
             return None
-        data = json.loads(response.read())
+        data = response.json()
 
         # Use .get() to safely access nested dictionary keys
         about = data.get("about", {})
@@ -0,0 +1,136 @@
+import asyncio
+import functools
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from duplicate_index import canonicalize_event_url
+from settings import DiceConfiguration
+from utils import logger
+
+
+class DiceIdStore:
+    """Persistent, bounded map of Dice event URLs to their retailer item IDs.
+
+    A Dice page's item ID never changes, so once a link has been scraped the
+    next request for it can go straight to the ticket types API. Entries are
+    kept in a small SQLite file next to the bot's other state; the least
+    recently used ones are dropped once ``max_entries`` is exceeded.
+
+    Lookups only read; the time of each hit is kept in memory and written
+    together with the next ``put`` (which is when eviction needs it) or on
+    ``close``, so a cache hit never commits. The file is only used from one
+    worker thread, so lookups and commits never block the event loop.
+    """
+
+    def __init__(self, path: "str | None" = None, max_entries: "int | None" = None):
+        self.path = DiceConfiguration.id_store_path if path is None else path
+        self.max_entries = (
+            DiceConfiguration.id_store_max_entries
+            if max_entries is None
+            else max_entries
+        )
+        self.hits = 0
+        self.misses = 0
+        self._connection: "sqlite3.Connection | None" = None
+        # Canonical URL -> time of its latest hit not yet written
+        self._used: dict[str, float] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="dice-id-store"
+        )
+
+    async def _run(self, function, *args):
+        """Run ``function`` on the database thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args)
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS dice_item_ids ("
+                "url TEXT PRIMARY KEY, item_id TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def _count(self) -> int:
+        try:
+            return (
+                self._connect()
+                .execute("SELECT COUNT(*) FROM dice_item_ids")
+                .fetchone()[0]
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read Dice ID store: {e}")
+            return 0
+
+    def _get(self, url: str) -> "str | None":
+        key = canonicalize_event_url(url)
+        try:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT item_id FROM dice_item_ids WHERE url = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read Dice ID store: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used[key] = time.time()
+        return row[0]
+
+    def _write_used(self, connection: sqlite3.Connection):
+        connection.executemany(
+            "UPDATE dice_item_ids SET last_used = ? WHERE url = ?",
+            [(last_used, key) for key, last_used in self._used.items()],
+        )
+        self._used.clear()
+
+    def _put(self, url: str, item_id: str):
+        key = canonicalize_event_url(url)
+        self._used.pop(key, None)
+        try:
+            connection = self._connect()
+            self._write_used(connection)
+            connection.execute(
+                "INSERT OR REPLACE INTO dice_item_ids (url, item_id, last_used) "
+                "VALUES (?, ?, ?)",
+                (key, str(item_id), time.time()),
+            )
+            connection.execute(
+                "DELETE FROM dice_item_ids WHERE url NOT IN ("
+                "SELECT url FROM dice_item_ids ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write Dice ID store: {e}")
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._write_used(self._connection)
+                self._connection.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write Dice ID store: {e}")
+            self._connection.close()
+            self._connection = None
+
+    async def count(self) -> int:
+        return await self._run(self._count)
+
+    async def get(self, url: str) -> "str | None":
+        return await self._run(self._get, url)
+
+    async def put(self, url: str, item_id: str):
+        await self._run(self._put, url, item_id)
+
+    async def close(self):
+        await self._run(self._close)
+
+
+dice_id_store = DiceIdStore()
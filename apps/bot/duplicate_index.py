@@ -0,0 +1,114 @@
+import datetime
+import re
+from urllib.parse import urlparse, urlunparse
+
+from models import Event
+
+PROVIDERS = {"ra.co": "ra", "dice.fm": "dice"}
+RA_EVENT_ID_PATTERN = re.compile(r"^/events/(\d+)")
+
+
+def canonicalize_event_url(url: str) -> str:
+    """Normalise an event URL so trivially different links compare equal."""
+    parsed = urlparse(url.strip())
+    hostname = (parsed.hostname or "").lower()
+    if hostname.startswith("www."):
+        hostname = hostname[4:]
+    path = parsed.path.rstrip("/")
+    return urlunparse(("https", hostname, path, "", "", ""))
+
+
+def get_source_key(url: str, source_id: "str | None" = None) -> "tuple | None":
+    """Return the (provider, provider event ID) pair for an event URL.
+
+    RA IDs can be read from the URL. Dice item IDs are only known once the
+    event page has been resolved, so they have to be passed in.
+    """
+    parsed = urlparse(canonicalize_event_url(url))
+    provider = PROVIDERS.get(parsed.hostname or "")
+    if provider is None:
+        return None
+    if source_id is None and provider == "ra":
+        match = RA_EVENT_ID_PATTERN.match(parsed.path)
+        source_id = match.group(1) if match else None
+    if source_id is None:
+        return None
+    return (provider, str(source_id))
+
+
+class DuplicateIndex:
+    """In-memory lookup of calendar events by canonical URL and provider ID.
+
+    The index is rebuilt from the synced calendar window and extended with
+    every event the bot creates. A miss is only authoritative for events that
+    start inside the synced window; outside it, or while the index is cold,
+    callers have to fall back to a Teamup search.
+    """
+
+    def __init__(self):
+        self.by_url: dict[str, str] = {}
+        self.by_source: dict[tuple, str] = {}
+        self.window_start: "datetime.date | None" = None
+        self.window_end: "datetime.date | None" = None
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    @property
+    def warm(self) -> bool:
+        return self.window_start is not None
+
+    def __len__(self) -> int:
+        return len(self.by_url)
+
+    def rebuild(
+        self,
+        events: "list[Event]",
+        link_for,
+        window_start: datetime.date,
+        window_end: datetime.date,
+    ):
+        by_url = {}
+        by_source = {}
+        for event in events:
+            if not event.url:
+                continue
+            link = link_for(event.event_id)
+            by_url[canonicalize_event_url(event.url)] = link
+            source_key = get_source_key(event.url, event.source_id)
+            if source_key is not None:
+                by_source[source_key] = link
+        # Provider IDs learned from created events cannot be derived from the
+        # calendar (Dice item IDs), so keep those whose URL is still present.
+        links = set(by_url.values())
+        for source_key, link in self.by_source.items():
+            if source_key not in by_source and link in links:
+                by_source[source_key] = link
+        self.by_url = by_url
+        self.by_source = by_source
+        self.window_start = window_start
+        self.window_end = window_end
+
+    def add(self, event: Event, link: str):
+        self.by_url[canonicalize_event_url(event.url)] = link
+        source_key = get_source_key(event.url, event.source_id)
+        if source_key is not None:
+            self.by_source[source_key] = link
+
+    def lookup(self, url: str, source_id: "str | None" = None) -> "str | None":
+        link = self.by_url.get(canonicalize_event_url(url))
+        if link is None:
+            source_key = get_source_key(url, source_id)
+            if source_key is not None:
+                link = self.by_source.get(source_key)
+        if link is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return link
+
+    def covers(self, start: datetime.datetime) -> bool:
+        """Whether a miss for an event starting at ``start`` is authoritative."""
+        if not self.warm:
+            return False
+        return self.window_start <= start.date() <= self.window_end
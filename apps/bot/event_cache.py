@@ -0,0 +1,144 @@
+import asyncio
+import datetime
+
+from models import Cache
+from settings import CacheConfiguration
+from utils import logger
+
+
+class EventCache:
+    """Process-wide cache of the calendar window, shared by every chat.
+
+    Refreshes are single-flight: while one refresh is running, every other
+    caller awaits the same result instead of starting its own TeamUp request.
+
+    In stale-while-revalidate mode an outdated cache is served immediately and
+    refreshed in the background; callers only wait when nothing has been loaded
+    yet. A cache older than ``max_age_seconds`` is reported as expired so the
+    rendered message can say so.
+    """
+
+    def __init__(
+        self,
+        cache: "Cache | None" = None,
+        stale_while_revalidate: "bool | None" = None,
+        refresh_after_seconds: "int | None" = None,
+        max_age_seconds: "int | None" = None,
+        retry_after_seconds: "int | None" = None,
+    ):
+        self.cache = cache if cache is not None else Cache(datetime.datetime.now(), [])
+        self.loaded = cache is not None
+        self.stale_while_revalidate = (
+            CacheConfiguration.stale_while_revalidate
+            if stale_while_revalidate is None
+            else stale_while_revalidate
+        )
+        self.refresh_after_seconds = (
+            CacheConfiguration.refresh_after_seconds
+            if refresh_after_seconds is None
+            else refresh_after_seconds
+        )
+        self.max_age_seconds = (
+            CacheConfiguration.max_age_seconds
+            if max_age_seconds is None
+            else max_age_seconds
+        )
+        self.retry_after_seconds = (
+            CacheConfiguration.retry_after_seconds
+            if retry_after_seconds is None
+            else retry_after_seconds
+        )
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_attempt: "datetime.datetime | None" = None
+        self._refresh_task: "asyncio.Task | None" = None
+
+    @property
+    def age(self) -> datetime.timedelta:
+        return datetime.datetime.now() - self.cache.last_update
+
+    @property
+    def refresh_task(self) -> "asyncio.Task | None":
+        return self._refresh_task
+
+    def is_stale(self) -> bool:
+        if not self.loaded:
+            return True
+        now = datetime.datetime.now()
+        return (
+            now.date() != self.cache.last_update.date()
+            or self.age.total_seconds() >= self.refresh_after_seconds
+        )
+
+    def is_expired(self) -> bool:
+        return self.loaded and self.age.total_seconds() >= self.max_age_seconds
+
+    async def get(self, fetch) -> Cache:
+        """Return the cache, refreshing it when it is cold or outdated.
+
+        A cold cache is always refreshed before returning. An outdated one is
+        refreshed in the background when stale-while-revalidate is enabled.
+        """
+        if not self.loaded or (self.is_stale() and not self.stale_while_revalidate):
+            self.misses += 1
+            await self.refresh(fetch)
+        elif self.is_stale():
+            self.stale_hits += 1
+            self.refresh_in_background(fetch)
+        else:
+            self.hits += 1
+        return self.cache
+
+    async def refresh(self, fetch) -> bool:
+        """Refresh the cache with ``fetch``, joining a refresh already in flight.
+
+        Returns False when the fetch failed and the existing cache was kept.
+        """
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh(fetch))
+        # Shield so a cancelled caller does not cancel the refresh other chats wait on.
+        return await asyncio.shield(self._refresh_task)
+
+    def refresh_in_background(self, fetch) -> "asyncio.Task | None":
+        """Start a refresh without waiting for it.
+
+        After a failed attempt, background refreshes back off for
+        ``retry_after_seconds`` so a TeamUp outage is not hit on every /rave.
+        """
+        if self._refresh_task is not None:
+            return self._refresh_task
+        if (
+            self.last_attempt is not None
+            and (datetime.datetime.now() - self.last_attempt).total_seconds()
+            < self.retry_after_seconds
+        ):
+            return None
+        self._refresh_task = asyncio.create_task(self._refresh(fetch))
+        return self._refresh_task
+
+    async def _refresh(self, fetch) -> bool:
+        self.refreshes += 1
+        self.last_attempt = datetime.datetime.now()
+        try:
+            events = await fetch()
+        except Exception as e:
+            logger.error(f"Failed to refresh event cache: {e}")
+            events = None
+        finally:
+            self._refresh_task = None
+        if events is None:
+            self.failures += 1
+            logger.warning("API failure, keeping existing cache")
+            return False
+        self.cache.update(events)
+        self.loaded = True
+        logger.info(f"Cache updated with {len(events)} events")
+        return True
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.stale_hits + self.misses
+        return (self.hits + self.stale_hits) / lookups if lookups else 0.0
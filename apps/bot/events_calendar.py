@@ -1,11 +1,15 @@
 import datetime
-import requests
+import time
 import urllib.parse
+
+import httpx
 from dateutil import parser
 
+import http_client
 from utils import cut_string, logger
 from models import Event
 from settings import CalendarConfiguration
+from tracing import traced
 
 
 def _parse_event(data: dict) -> Event:
@@ -14,70 +18,148 @@ def _parse_event(data: dict) -> Event:
     end_dt = data.get("end_dt", "")
     if not start_dt or not end_dt:
         raise ValueError("Missing start_dt or end_dt in event data")
-    start_time = (
-        parser.parse(start_dt).replace(tzinfo=None).strftime("%Y-%m-%dT%H:%M:%S")
-    )
-    end_time = parser.parse(end_dt).replace(tzinfo=None).strftime("%Y-%m-%dT%H:%M:%S")
     custom_data = data.get("custom", {})
     url = custom_data.get("url", "")
+    # Notes are never rendered, so they are left out of the cached events
     return Event(
         event_id=data.get("id", ""),
         title=data.get("title", ""),
-        start_time=start_time,
-        end_time=end_time,
+        start_time=parser.parse(start_dt).replace(tzinfo=None),
+        end_time=parser.parse(end_dt).replace(tzinfo=None),
         location=data.get("location", ""),
         url=url,
-        description=data.get("notes", ""),
     )
 
 
-def get_events() -> "list[Event] | None":
-    """Fetch this week's events. Returns None on API failure, [] if no events."""
+def _parse_events(response_data: dict) -> "list[Event]":
+    events = []
+    for data in response_data.get("events", []):
+        try:
+            events.append(_parse_event(data))
+        except (KeyError, ValueError) as e:
+            logger.error(f"Failed to parse event data: {e}")
+            continue
+    return events
+
+
+def _response_timestamp(response_data: dict, requested_at: int) -> int:
+    """Sync cursor for the next modifiedSince query.
+
+    Teamup returns its own server timestamp; fall back to the local request
+    time if it is missing.
+    """
+    timestamp = response_data.get("timestamp")
+    return int(timestamp) if timestamp else requested_at
+
+
+async def _get_events_data(params: dict) -> "dict | None":
     api_key = CalendarConfiguration.api_key
     headers = {"TeamUp-Token": api_key}
-
-    today = datetime.date.today()
-    api_url = f'{CalendarConfiguration.api_url}/events?startDate={today.strftime("%Y-%m-%d")}&endDate={(today + datetime.timedelta(6)).strftime("%Y-%m-%d")}'
+    api_url = f"{CalendarConfiguration.api_url}/events?{urllib.parse.urlencode(params)}"
 
     try:
-        r = requests.get(api_url, headers=headers, timeout=30)
+        r = await http_client.get(api_url, headers=headers)
         r.raise_for_status()
-        response_data = r.json()
-    except requests.exceptions.RequestException as e:
+        return r.json()
+    except httpx.HTTPError as e:
         logger.error(f"Failed to fetch events from calendar API: {e}")
         return None
     except ValueError as e:
         logger.error(f"Failed to parse JSON response from calendar API: {e}")
         return None
 
-    events = []
+
+async def get_events() -> "list[Event] | None":
+    """Fetch this week's events. Returns None on API failure, [] if no events."""
+    today = datetime.date.today()
+    window = await get_events_window(today, today + datetime.timedelta(6))
+    if window is None:
+        return None
+    events, _ = window
+    return events
+
+
+@traced("teamup.get_events_window")
+async def get_events_window(
+    start_date: datetime.date, end_date: datetime.date
+) -> "tuple[list[Event], int] | None":
+    """Fetch all events between two dates together with a sync cursor.
+
+    Returns None on API failure.
+    """
+    requested_at = int(time.time())
+    response_data = await _get_events_data(
+        {
+            "startDate": start_date.strftime("%Y-%m-%d"),
+            "endDate": end_date.strftime("%Y-%m-%d"),
+        }
+    )
+    if response_data is None:
+        return None
+    return _parse_events(response_data), _response_timestamp(
+        response_data, requested_at
+    )
+
+
+@traced("teamup.get_modified_events")
+async def get_modified_events(since: int) -> "dict | None":
+    """Fetch events created, changed or deleted since a sync cursor.
+
+    Returns a dict with ``changed`` events, ``deleted`` event IDs, a
+    ``recurring`` flag set when a recurring series changed (its instances can
+    only be expanded by a full window query) and the next ``timestamp`` cursor.
+    Returns None on API failure.
+    """
+    requested_at = int(time.time())
+    response_data = await _get_events_data({"modifiedSince": since})
+    if response_data is None:
+        return None
+
+    changed = []
+    deleted = []
+    recurring = False
     for data in response_data.get("events", []):
+        if data.get("delete_dt"):
+            deleted.append(str(data.get("id", "")))
+            continue
+        if data.get("rrule"):
+            recurring = True
         try:
-            events.append(_parse_event(data))
+            changed.append(_parse_event(data))
         except (KeyError, ValueError) as e:
-            logger.error(f"Failed to parse event data: {e}")
+            logger.error(f"Failed to parse changed event data: {e}")
             continue
 
-    return events
+    return {
+        "changed": changed,
+        "deleted": deleted,
+        "recurring": recurring,
+        "timestamp": _response_timestamp(response_data, requested_at),
+    }
+
 
+@traced("teamup.search_event")
+async def search_event(event: Event) -> str:
+    return await search_event_url(event.url, event.start.date())
 
-def search_event(event: Event) -> str:
+
+@traced("teamup.search_event_url")
+async def search_event_url(url: str, start_date: datetime.date) -> str:
+    """Search for a calendar event with ``url`` starting on or after a date."""
     api_key = CalendarConfiguration.api_key
     headers = {"TeamUp-Token": api_key, "Content-Type": "application/json"}
 
     params = {
-        "startDate": datetime.datetime.strptime(
-            event.start_time, "%Y-%m-%dT%H:%M:%S"
-        ).strftime("%Y-%m-%d"),
-        "query": f'"{event.url}"',
+        "startDate": start_date.strftime("%Y-%m-%d"),
+        "query": f'"{url}"',
     }
     encoded_params = urllib.parse.urlencode(params)
     api_url = f"{CalendarConfiguration.api_url}/events?{encoded_params}"
     try:
-        r = requests.get(api_url, headers=headers, timeout=30)
+        r = await http_client.get(api_url, headers=headers)
         r.raise_for_status()
         response_data = r.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Failed to search event: {e}")
         return None
     except ValueError as e:
@@ -95,10 +177,11 @@ def search_event(event: Event) -> str:
     if not events:
         logger.warning("No events found")
         return None
-    return f"{CalendarConfiguration.reader_url}/events/{events[0].event_id}"
+    return get_event_link(events[0].event_id)
 
 
-def create_calendar_event(event: Event) -> bool:
+@traced("teamup.create_calendar_event")
+async def create_calendar_event(event: Event) -> bool:
     api_key = CalendarConfiguration.api_key
     headers = {"TeamUp-Token": api_key, "Content-Type": "application/json"}
 
@@ -116,15 +199,26 @@ def create_calendar_event(event: Event) -> bool:
     }
 
     try:
-        r = requests.post(api_url, headers=headers, json=payload, timeout=30)
+        r = await http_client.post(api_url, headers=headers, json=payload)
         if r.status_code != 201:
             logger.error(f"Failed to create event: {r.text}")
             return False
-        return True
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Failed to create event (network error): {e}")
         return False
 
+    try:
+        event.event_id = str(r.json()["event"]["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Created event but could not read its ID: {e}")
+    return True
+
+
+def get_event_link(event_id: "str | None") -> str:
+    if not event_id:
+        return CalendarConfiguration.reader_url
+    return f"{CalendarConfiguration.reader_url}/events/{event_id}"
+
 
 def get_calendar_link():
     return CalendarConfiguration.reader_url
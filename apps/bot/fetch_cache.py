@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from settings import ProviderCacheConfiguration
+from utils import logger
+
+
+class FetchCache:
+    """Bounded TTL cache for provider fetches with in-flight de-duplication.
+
+    Entries are evicted least-recently-used once ``max_entries`` is reached.
+    Concurrent requests for a key that is still being fetched share that
+    fetch, which is cancelled once every caller waiting for it has been.
+    Failed fetches (None) are not cached.
+    """
+
+    def __init__(
+        self, ttl_seconds: "int | None" = None, max_entries: "int | None" = None
+    ):
+        self.ttl_seconds = (
+            ProviderCacheConfiguration.ttl_seconds
+            if ttl_seconds is None
+            else ttl_seconds
+        )
+        self.max_entries = (
+            ProviderCacheConfiguration.max_entries
+            if max_entries is None
+            else max_entries
+        )
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: dict = {}
+        # Callers still waiting for each in-flight fetch task
+        self._waiters: dict[asyncio.Task, int] = {}
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.shared + self.misses
+        return (self.hits + self.shared) / lookups if lookups else 0.0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self._inflight.clear()
+
+    async def get_or_fetch(self, key, fetch):
+        """Return the cached value for ``key`` or fetch it once for all callers."""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._load(key, fetch))
+            self._inflight[key] = task
+        else:
+            self.shared += 1
+        # Shield so one caller giving up does not cancel the fetch for the
+        # others; the last one to give up cancels it.
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+
+    async def _load(self, key, fetch):
+        try:
+            value = await fetch()
+        finally:
+            self._inflight.pop(key, None)
+        if value is not None:
+            self.put(key, value)
+            logger.info(f"Cached provider event {key}")
+        return value
+
+
+# Shared by the RA and Dice providers; keys are (provider, provider event ID).
+provider_cache = FetchCache()
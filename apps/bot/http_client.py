@@ -0,0 +1,117 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+from metrics import (
+    external_request_duration,
+    external_requests,
+    get_endpoint,
+    get_provider,
+    get_status_outcome,
+)
+from tracing import span
+from utils import logger
+
+DEFAULT_TIMEOUT = 30
+BROWSER_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:106.0) Gecko/20100101 Firefox/106.0"
+)
+
+# Every upstream host gets its own keep-alive pool so a slow provider cannot
+# exhaust the connections another provider needs.
+POOL_LIMITS = httpx.Limits(
+    max_connections=10,
+    max_keepalive_connections=5,
+    keepalive_expiry=60,
+)
+
+
+class MeasuredTransport(httpx.AsyncHTTPTransport):
+    """Transport that records latency and outcome of every upstream request.
+
+    Requests are labelled by provider and endpoint, the method and path with
+    IDs replaced (see ``metrics.get_endpoint``).
+
+    Latency is measured until the response headers arrive, so streamed
+    downloads that are stopped early are still comparable.
+    """
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        provider = get_provider(request.url.host)
+        endpoint = get_endpoint(request.method, request.url.path)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with span(
+                f"http.{provider}", method=request.method, path=request.url.path
+            ) as current:
+                response = await super().handle_async_request(request)
+                if current is not None:
+                    current.set(status=response.status_code)
+            outcome = get_status_outcome(response.status_code)
+            return response
+        finally:
+            external_request_duration.observe(
+                time.perf_counter() - start, provider, endpoint
+            )
+            external_requests.inc(provider, endpoint, outcome)
+
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_client_loops: dict[str, asyncio.AbstractEventLoop] = {}
+
+
+def get_client(host: str) -> httpx.AsyncClient:
+    """Return the shared client for a host, creating it on first use.
+
+    Clients are bound to the running event loop; a closed client or one created
+    on another loop is replaced.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(host)
+    if client is None or client.is_closed or _client_loops.get(host) is not loop:
+        client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT, transport=MeasuredTransport(limits=POOL_LIMITS)
+        )
+        _clients[host] = client
+        _client_loops[host] = loop
+        logger.info(f"Opened HTTP connection pool for {host}")
+    return client
+
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a request through the pooled client for the URL's host."""
+    host = urlparse(url).netloc.lower()
+    return await get_client(host).request(method, url, **kwargs)
+
+
+def stream(method: str, url: str, **kwargs):
+    """Stream a response through the pooled client for the URL's host.
+
+    Use as ``async with http_client.stream(...) as response``; leaving the
+    block early stops the download.
+    """
+    host = urlparse(url).netloc.lower()
+    return get_client(host).stream(method, url, **kwargs)
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+async def aclose():
+    """Close every pooled client. Called on application shutdown."""
+    clients = list(_clients.values())
+    _clients.clear()
+    _client_loops.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except (httpx.HTTPError, RuntimeError) as e:
+            logger.warning(f"Failed to close HTTP client: {e}")
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import deque
+
+from settings import JoinAggregationConfiguration
+from utils import logger
+
+# Joins counted for flood detection
+FLOOD_RATE_WINDOW_SECONDS = 60
+
+
+class JoinAggregator:
+    """Buffers member joins per chat so one welcome greets a whole batch.
+
+    The first join in a quiet chat opens a batch that is flushed after
+    ``window_seconds``. While a chat sees more than ``flood_threshold`` joins
+    a minute it is in flood mode, and batches stay open for
+    ``flood_window_seconds`` instead, so a join raid produces a few large
+    welcomes rather than a burst of sends.
+    """
+
+    def __init__(
+        self,
+        window_seconds: "float | None" = None,
+        flood_threshold: "int | None" = None,
+        flood_window_seconds: "float | None" = None,
+    ):
+        self.window_seconds = (
+            JoinAggregationConfiguration.window_seconds
+            if window_seconds is None
+            else window_seconds
+        )
+        self.flood_threshold = (
+            JoinAggregationConfiguration.flood_threshold
+            if flood_threshold is None
+            else flood_threshold
+        )
+        self.flood_window_seconds = (
+            JoinAggregationConfiguration.flood_window_seconds
+            if flood_window_seconds is None
+            else flood_window_seconds
+        )
+        # chat_id -> (member IDs, flush callback, timer handle, flood mode)
+        self._batches: dict[int, tuple] = {}
+        self._joins: dict[int, deque] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.flood_batches = 0
+        self.members = 0
+
+    def __len__(self) -> int:
+        return sum(len(batch[0]) for batch in self._batches.values())
+
+    def is_flooded(self, chat_id: int) -> bool:
+        joins = self._joins.get(chat_id)
+        if not joins:
+            return False
+        cutoff = time.monotonic() - FLOOD_RATE_WINDOW_SECONDS
+        while joins and joins[0][0] <= cutoff:
+            joins.popleft()
+        if not joins:
+            del self._joins[chat_id]
+            return False
+        return sum(count for _, count in joins) > self.flood_threshold
+
+    def add(self, chat_id: int, member_ids: "list[int]", flush):
+        """Buffer joined members; ``flush(member_ids, flood)`` sends their welcome.
+
+        The most recent ``flush`` is used for the batch.
+        """
+        self._joins.setdefault(chat_id, deque()).append(
+            (time.monotonic(), len(member_ids))
+        )
+        flood = self.is_flooded(chat_id)
+        batch = self._batches.get(chat_id)
+        if batch is None:
+            delay = self.flood_window_seconds if flood else self.window_seconds
+            handle = asyncio.get_running_loop().call_later(
+                delay, self._flush_later, chat_id
+            )
+            self._batches[chat_id] = (list(member_ids), flush, handle, flood)
+            return
+        members, _, handle, batch_flood = batch
+        if flood and not batch_flood:
+            logger.warning(f"Join flood in chat {chat_id}, batching welcomes")
+            handle.cancel()
+            handle = asyncio.get_running_loop().call_later(
+                self.flood_window_seconds, self._flush_later, chat_id
+            )
+        members.extend(member_ids)
+        self._batches[chat_id] = (members, flush, handle, batch_flood or flood)
+
+    def _flush_later(self, chat_id: int):
+        task = asyncio.create_task(self.flush(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, chat_id: int):
+        """Send the pending welcome for ``chat_id`` now."""
+        batch = self._batches.pop(chat_id, None)
+        if batch is None:
+            return
+        members, flush, handle, flood = batch
+        handle.cancel()
+        # Drop repeated joins of the same member within the batch
+        members = list(dict.fromkeys(members))
+        self.batches += 1
+        self.members += len(members)
+        if flood:
+            self.flood_batches += 1
+        try:
+            await flush(members, flood)
+        except Exception as e:
+            logger.error(
+                f"Failed to welcome {len(members)} members in chat {chat_id}: {e}",
+                exc_info=e,
+            )
+
+    async def flush_all(self):
+        for chat_id in list(self._batches):
+            await self.flush(chat_id)
+
+
+join_aggregator = JoinAggregator()
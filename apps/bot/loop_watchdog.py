@@ -0,0 +1,190 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from settings import WatchdogConfiguration
+from utils import logger
+
+BOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Modules every update passes through on its way to the handler
+INFRASTRUCTURE_MODULES = {
+    "loop_watchdog.py",
+    "metrics.py",
+    "tracing.py",
+    "update_processor.py",
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples: "list[float]", value: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(len(ordered) * value / 100))
+    return ordered[index]
+
+
+def describe_frame(frame: traceback.FrameSummary) -> str:
+    return (
+        f"{os.path.relpath(frame.filename, BOT_DIRECTORY)}:{frame.lineno} "
+        f"in {frame.name}: {frame.line}"
+    )
+
+
+def is_loop_callback_frame(frame: traceback.FrameSummary) -> bool:
+    """Whether the frame is ``Handle._run``, where the loop steps a task."""
+    return frame.name == "_run" and frame.filename.endswith(
+        os.path.join("asyncio", "events.py")
+    )
+
+
+def find_blocking_frames(stack: traceback.StackSummary) -> "tuple[str, str, str]":
+    """Handler, bot call and innermost call of a stack captured during a stall.
+
+    Only frames below the loop callback being run are considered, so the
+    ``main.py`` module frame that started the loop is never reported. The
+    handler is the outermost of those frames in the bot's own modules outside
+    of the wrappers every update passes through; the call is the innermost
+    one, usually the line in ``ra.py``, ``dice.py`` or ``main.py`` that blocked.
+    """
+    frames = list(stack)
+    callbacks = [
+        index for index, frame in enumerate(frames) if is_loop_callback_frame(frame)
+    ]
+    if callbacks:
+        frames = frames[callbacks[-1] + 1 :]
+    own = [
+        frame
+        for frame in frames
+        if frame.filename.startswith(BOT_DIRECTORY)
+        and os.path.basename(frame.filename) not in INFRASTRUCTURE_MODULES
+        and frame.name != "<module>"
+    ]
+    handler = own[0].name if own else "unknown"
+    call = describe_frame(own[-1]) if own else "unknown"
+    innermost = describe_frame(stack[-1]) if stack else "unknown"
+    return handler, call, innermost
+
+
+class LoopWatchdog:
+    """Measures event loop lag and reports what is blocking the loop.
+
+    A heartbeat coroutine sleeps for ``interval_seconds`` and records how
+    late it wakes up. A helper thread watches the heartbeat; once it is more
+    than ``threshold_seconds`` overdue the loop is stuck in synchronous code,
+    so the thread captures the loop thread's stack and logs the handler and
+    the call that is blocking, once per stall.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: "float | None" = None,
+        threshold_seconds: "float | None" = None,
+        samples: "int | None" = None,
+    ):
+        self.interval_seconds = (
+            WatchdogConfiguration.interval_seconds
+            if interval_seconds is None
+            else interval_seconds
+        )
+        self.threshold_seconds = (
+            WatchdogConfiguration.threshold_seconds
+            if threshold_seconds is None
+            else threshold_seconds
+        )
+        self.lags: deque[float] = deque(
+            maxlen=WatchdogConfiguration.samples if samples is None else samples
+        )
+        self.stalls = 0
+        self.last_stall: "dict | None" = None
+        self._beat = time.monotonic()
+        self._loop_thread_id: "int | None" = None
+        self._task: "asyncio.Task | None" = None
+        self._thread: "threading.Thread | None" = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            self.lags.append(max(loop.time() - expected, 0.0))
+            self._beat = time.monotonic()
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.interval_seconds):
+            beat = self._beat
+            overdue = time.monotonic() - beat - self.interval_seconds
+            if overdue > self.threshold_seconds and beat != reported_beat:
+                reported_beat = beat
+                self.report_stall(overdue)
+
+    def capture_loop_stack(self) -> traceback.StackSummary:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return traceback.StackSummary()
+        return traceback.extract_stack(frame)
+
+    def report_stall(self, overdue: float):
+        stack = self.capture_loop_stack()
+        handler, call, innermost = find_blocking_frames(stack)
+        self.stalls += 1
+        self.last_stall = {
+            "lag_seconds": round(overdue, 3),
+            "handler": handler,
+            "call": call,
+            "innermost": innermost,
+            "timestamp": time.time(),
+        }
+        logger.warning(
+            f"Event loop blocked for over {overdue * 1000:.0f} ms in {handler}: {call}",
+            extra={
+                "fields": {
+                    "loop_stall": {
+                        **self.last_stall,
+                        "stack": "".join(stack.format()),
+                    }
+                }
+            },
+        )
+
+    def percentiles(self) -> "dict[int, float]":
+        samples = list(self.lags)
+        return {value: percentile(samples, value) for value in PERCENTILES}
+
+    @property
+    def max_lag(self) -> float:
+        return max(self.lags, default=0.0)
+
+
+loop_watchdog = LoopWatchdog()
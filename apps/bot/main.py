@@ -1,9 +1,9 @@
 import asyncio
 import datetime
+import hashlib
+import html
 import os
-from collections import defaultdict
 from collections.abc import Mapping
-import threading
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest, TelegramError
@@ -12,27 +12,71 @@ from telegram.ext import (
     ApplicationBuilder,
     ContextTypes,
     CommandHandler,
-    PicklePersistence,
     MessageHandler,
     filters,
     CallbackQueryHandler,
+    TypeHandler,
 )
 from telegram.constants import ParseMode
 from telegram.constants import MessageEntityType
 
+import http_client
 from ra import process_ra_event
 from dice import process_dice_event
-from models import Cache
-from settings import BotConfiguration, ENVIRONMENT, AnnouncementConfiguration
+from deadline_scheduler import deadline_scheduler
+from calendar_sync import CalendarSync
+from dice_id_store import dice_id_store
+from duplicate_index import DuplicateIndex, canonicalize_event_url, get_source_key
+from event_cache import EventCache
+from fetch_cache import provider_cache
+from join_aggregator import join_aggregator
+from loop_watchdog import loop_watchdog
+from metrics import announcement_updates, metrics, metrics_server, observe_handler
+from tracing import traced, tracer
+from models import Event
+from onboarding import ONBOARDING_KEY, OnboardingStore
+from outbound import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_NAMES,
+    outbound_limiter,
+    outbound_priority,
+)
+from persistence import SQLitePersistence
+from rate_limit import rate_limiter
+from sharding import (
+    drop_foreign_update,
+    get_admin_value,
+    is_sharded,
+    owns_chat,
+    run_router,
+    update_admin_value,
+)
+from shared_state import shared_state
+from settings import (
+    BotConfiguration,
+    ENVIRONMENT,
+    AnnouncementConfiguration,
+    ConcurrencyConfiguration,
+    EventImportConfiguration,
+    CacheConfiguration,
+    MetricsConfiguration,
+    ShardConfiguration,
+    WebhookConfiguration,
+)
+from update_processor import ChatOrderedUpdateProcessor, TracedUpdateProcessor
 from events_calendar import (
     get_calendar_link,
-    get_events,
+    get_event_link,
     create_calendar_event,
     search_event,
+    search_event_url,
 )
 from utils import get_name, get_mention, logger, validate_and_sanitize_url
+from webhook import run_webhook
 from text import (
     welcome_message,
+    flood_welcome_message,
+    welcome_more_members_message,
     success_message,
     help_message,
     warn_message,
@@ -55,6 +99,10 @@ from text import (
     malformed_url_message,
     configured_announcement_set_message,
     configured_announcement_unset_message,
+    stale_events_message,
+    bulk_import_progress_message,
+    bulk_import_summary_message,
+    bulk_import_limit_message,
 )
 
 # Track bot start time for uptime calculation
@@ -62,19 +110,46 @@ bot_start_time = datetime.datetime.now(datetime.timezone.utc)
 
 # Announcement update tracking key
 LAST_ANNOUNCEMENT_UPDATE_KEY = "last_announcement_update"
+# Per-chat record of what was last published: message ID, text digest, pin state
+ANNOUNCEMENT_STATE_KEY = "announcement_state"
+UPDATE_TIMERS_KEY = "update_timers"
+# Calendar window synced by one shard and reused by the others
+CALENDAR_SNAPSHOT_KEY = "calendar_snapshot"
+
+# Calendar window shared by every chat, kept current by delta syncs
+calendar_sync = CalendarSync()
+event_cache = EventCache()
+duplicate_index = DuplicateIndex()
+
+# Days of events shown by /rave and the announcement
+RAVE_WINDOW_DAYS = 7
+
+# Onboarding deadlines, in seconds
+WARN_IDLE_DELAY = 90 * 60
+KICK_IDLE_DELAY = 30 * 60
+KICK_MESSAGE_DELETE_DELAY = 5 * 60
+MEMBER_DEADLINES = ("warn_idle", "kick_idle")
+
+# Members mentioned by name in one combined welcome
+MAX_WELCOME_MENTIONS = 30
+
+ALLOWED_EVENT_DOMAINS = ["ra.co", "dice.fm"]
+# Minimum gap between edits of the bulk import progress message
+BULK_IMPORT_PROGRESS_INTERVAL = 2
 
-# Rate limiting configuration
-RATE_LIMIT_WINDOW = 60  # 1 minute window
-RATE_LIMIT_MAX_REQUESTS = 3  # Max 3 requests per minute per user
-rate_limit_tracker = defaultdict(list)
-rate_limit_lock = threading.Lock()  # Thread-safe lock for rate limiting
+# Traces, and spans per trace, shown by /traces
+TRACES_SHOWN = 5
+TRACE_SPANS_SHOWN = 15
 
 
+@observe_handler("rave")
 async def rave_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Received /rave command from user {update.effective_user.id}")
     if is_old_command(update, context):
         logger.info("Command is old, ignoring")
         return
+    if await is_rate_limited(update, "rave"):
+        return
     message = await get_rave_message(context)
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
@@ -85,6 +160,7 @@ async def rave_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info("Rave command completed")
 
 
+@observe_handler("update")
 async def update_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_old_command(update, context):
         return
@@ -92,6 +168,7 @@ async def update_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update_announcement(context, update.effective_chat.id)
 
 
+@observe_handler("help")
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Received /help command from user {update.effective_user.id}")
     if is_old_command(update, context):
@@ -100,6 +177,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info("Help command completed")
 
 
+@observe_handler("leave")
 async def member_left_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     member = update.effective_message.left_chat_member
     if member.is_bot:
@@ -109,57 +187,93 @@ async def member_left_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     if user_id is None:
         return
 
-    success = remove_job_if_exists(str(user_id), context)
+    success = deadline_scheduler.cancel(
+        update.effective_chat.id, user_id, *MEMBER_DEADLINES
+    )
     if success:
         await clean_up_welcome_message(context, update.effective_chat.id, user_id)
         await clean_up_warn_message(context, update.effective_chat.id, user_id)
+    get_onboarding_store(context).pop(user_id)
+
+
+def get_onboarding_store(context: ContextTypes.DEFAULT_TYPE) -> OnboardingStore:
+    return OnboardingStore(context.chat_data)
 
 
+@observe_handler("join")
 async def new_member_welcome_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ):
+    chat_id = update.effective_chat.id
+    onboarding = get_onboarding_store(context)
+    member_ids = []
     for member in update.effective_message.new_chat_members:
         if member.is_bot:
-            return
+            continue
 
-        context.user_data["new_member"] = True
-        name = get_name(member.first_name, member.last_name)
-        mention = get_mention(member.id, name)
+        onboarding.add(
+            member.id,
+            get_name(member.first_name, member.last_name),
+            username=member.username,
+            joined_message_id=update.effective_message.message_id,
+        )
 
-        message = welcome_message.format(name=mention)
+        deadline_scheduler.cancel(chat_id, member.id, "kick_idle")
+        deadline_scheduler.schedule("warn_idle", chat_id, member.id, WARN_IDLE_DELAY)
+        member_ids.append(member.id)
 
-        welcome_msg = await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=message,
-            parse_mode=ParseMode.HTML,
-            disable_web_page_preview=False,
-        )
+    if member_ids:
 
-        context.chat_data["welcome_" + str(member.id)] = welcome_msg.message_id
-        context.chat_data["joined_" + str(member.id)] = (
-            update.effective_message.message_id
-        )
+        async def flush(member_ids: "list[int]", flood: bool):
+            await send_welcome(context, chat_id, member_ids, flood)
 
-        remove_job_if_exists(str(member.id), context)
-        context.job_queue.run_once(
-            warn_idle,
-            when=90 * 60,
-            chat_id=update.effective_chat.id,
-            user_id=member.id,
-            name=str(member.id),
+        join_aggregator.add(chat_id, member_ids, flush)
+
+
+async def send_welcome(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    member_ids: "list[int]",
+    flood: bool = False,
+):
+    """Greet a batch of new members with one message and record it for each."""
+    onboarding = get_onboarding_store(context)
+    records = [
+        (member_id, record)
+        for member_id in member_ids
+        if (record := onboarding.get(member_id)) is not None
+    ]
+    if not records:
+        return
+
+    mentions = [get_mention(member_id, record["name"]) for member_id, record in records]
+    names = ", ".join(mentions[:MAX_WELCOME_MENTIONS])
+    if len(mentions) > MAX_WELCOME_MENTIONS:
+        names = welcome_more_members_message.format(
+            names=names, count=len(mentions) - MAX_WELCOME_MENTIONS
         )
-        context.chat_data[str(member.id)] = name
-        context.chat_data[f"@{member.username}"] = member.id
+    message = (flood_welcome_message if flood else welcome_message).format(name=names)
+
+    welcome_msg = await context.bot.send_message(
+        chat_id=chat_id,
+        text=message,
+        parse_mode=ParseMode.HTML,
+        disable_web_page_preview=flood,
+    )
+    for _, record in records:
+        record["welcome"] = welcome_msg.message_id
+    context.application.mark_data_for_update_persistence(chat_ids=chat_id)
 
 
+@observe_handler("whois")
 async def whois_reply_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    is_new_member = context.user_data.pop("new_member", False)
-    if is_new_member == False:
+    member_id = update.effective_user.id
+    if get_onboarding_store(context).pop(member_id) is None:
         return
 
-    member_id = context._user_id
-
-    success = remove_job_if_exists(str(member_id), context)
+    success = deadline_scheduler.cancel(
+        update.effective_chat.id, member_id, *MEMBER_DEADLINES
+    )
     if success:
         mention = get_mention(
             member_id,
@@ -169,6 +283,7 @@ async def whois_reply_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.effective_message.reply_html(message)
 
 
+@observe_handler("set")
 async def set_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_old_command(update, context):
         return
@@ -181,7 +296,7 @@ async def set_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if chat_id == AnnouncementConfiguration.chat_id:
         remove_job_if_exists(f"update_{chat_id}", context)
         register_configured_announcement_job(context.application)
-        context.bot_data.get("update_timers", {}).pop(chat_id, None)
+        await set_update_timer(context, chat_id, False)
         await update.effective_message.reply_text(configured_announcement_set_message)
         return
 
@@ -195,7 +310,7 @@ async def set_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Persist timer state so it can be restored after restart
-    context.bot_data.setdefault("update_timers", {})[chat_id] = True
+    await set_update_timer(context, chat_id, True)
 
     text = "Update timer successfully set!"
     if job_removed:
@@ -203,6 +318,21 @@ async def set_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.effective_message.reply_text(text)
 
 
+async def set_update_timer(
+    context: ContextTypes.DEFAULT_TYPE, chat_id: int, enabled: bool
+):
+    def change(update_timers: dict) -> dict:
+        update_timers = dict(update_timers)
+        if enabled:
+            update_timers[chat_id] = True
+        else:
+            update_timers.pop(chat_id, None)
+        return update_timers
+
+    await update_admin_value(context.bot_data, UPDATE_TIMERS_KEY, change, {})
+
+
+@observe_handler("unset")
 async def unset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_old_command(update, context):
         return
@@ -217,7 +347,7 @@ async def unset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     job_removed = remove_job_if_exists(f"update_{chat_id}", context)
-    context.bot_data.get("update_timers", {}).pop(chat_id, None)
+    await set_update_timer(context, chat_id, False)
     text = (
         "Update timer successfully removed!"
         if job_removed
@@ -226,28 +356,23 @@ async def unset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.effective_message.reply_text(text)
 
 
-def is_rate_limited(user_id: int) -> bool:
-    """Check if user is rate limited for createevent command. Thread-safe."""
-    with rate_limit_lock:
-        current_time = datetime.datetime.now(datetime.timezone.utc)
-        user_requests = rate_limit_tracker[user_id]
-
-        # Remove requests outside the time window
-        user_requests[:] = [
-            req_time
-            for req_time in user_requests
-            if (current_time - req_time).total_seconds() < RATE_LIMIT_WINDOW
-        ]
-
-        # Check if user has exceeded the limit
-        if len(user_requests) >= RATE_LIMIT_MAX_REQUESTS:
-            return True
-
-        # Add current request
-        user_requests.append(current_time)
-        return False
+async def is_rate_limited(update: Update, command: str) -> bool:
+    """Take a token from the command's bucket for this user or chat."""
+    limited = not await rate_limiter.check(
+        command,
+        user_id=update.effective_user.id if update.effective_user else None,
+        chat_id=update.effective_chat.id if update.effective_chat else None,
+    )
+    if limited:
+        logger.warning(
+            f"Rate limit exceeded for /{command} by user "
+            f"{update.effective_user.id if update.effective_user else None} "
+            f"in chat {update.effective_chat.id if update.effective_chat else None}"
+        )
+    return limited
 
 
+@observe_handler("createevent")
 async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_old_command(update, context):
         return
@@ -255,31 +380,37 @@ async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYP
     # Check rate limiting
     user_id = update.effective_user.id
     username = update.effective_user.username or update.effective_user.first_name
-    if is_rate_limited(user_id):
+    if await is_rate_limited(update, "createevent"):
+        policy = rate_limiter.policies["createevent"]
         await update.effective_message.reply_text(
             f"⚠️ Rate limit exceeded. Please wait before creating more events. "
-            f"(Max {RATE_LIMIT_MAX_REQUESTS} events per {RATE_LIMIT_WINDOW} seconds)"
+            f"(Max {policy.capacity} events per {policy.period_seconds:g} seconds)"
         )
-        logger.warning(f"Rate limit exceeded for user {user_id}")
         return
 
     logger.info(f"Event creation attempt by user {username} (ID: {user_id})")
 
     mentions = update.effective_message.parse_entities(MessageEntityType.URL)
-    if len(list(mentions.values())) == 0:
+    # Keep the first of any links that point at the same page
+    unique_urls = {}
+    for url in mentions.values():
+        if url:
+            unique_urls.setdefault(canonicalize_event_url(url), url)
+    urls = list(unique_urls.values())
+    if len(urls) == 0:
         # await update.effective_message.reply_text(no_event_url_message)
         return
 
-    url = next(iter(mentions.values()))
-
-    if url is None:
-        # await update.effective_message.reply_text(no_event_url_message)
+    if len(urls) > 1:
+        # Counted as a single request by the rate limiter above
+        await import_event_urls(update, context, urls)
         return
 
+    url = urls[0]
+
     # Validate and sanitize the URL
-    allowed_domains = ["ra.co", "dice.fm"]
     is_valid, sanitized_url, error_msg, domain = validate_and_sanitize_url(
-        url, allowed_domains
+        url, ALLOWED_EVENT_DOMAINS
     )
 
     if not is_valid:
@@ -298,44 +429,29 @@ async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYP
         f"Valid URL from user {username} (ID: {user_id}): {sanitized_url}, domain: {domain}"
     )
 
-    event = None
-    if domain == "ra.co":
-        event = await process_ra_event(sanitized_url)
-    elif domain == "dice.fm":
-        event = await process_dice_event(sanitized_url)
+    event, duplicate, url_searched = await fetch_unless_duplicate(domain, sanitized_url)
+    if duplicate is not None:
+        await reply_duplicate_question(update, duplicate)
+        # Only the latest prompt can be confirmed
+        context.user_data.pop("event", None)
+        context.user_data["event_source"] = {"domain": domain, "url": sanitized_url}
+        return
 
     if event is None:
         logger.error(f"Event processing failed for URL: {sanitized_url}")
         await update.effective_message.reply_text(event_creation_error_message)
         return
 
-    duplicate = await asyncio.to_thread(search_event, event)
+    duplicate = await find_duplicate(event, url_searched=url_searched)
     if duplicate is not None:
-        message = duplicate_event_question_message + "\n\n" + duplicate
-        await update.effective_message.reply_text(
-            message,
-            disable_web_page_preview=True,
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [
-                        InlineKeyboardButton(
-                            duplicate_event_create_button_text,
-                            callback_data="duplicate_event_create",
-                        ),
-                        InlineKeyboardButton(
-                            duplicate_event_skip_button_text,
-                            callback_data="duplicate_event_skip",
-                        ),
-                    ]
-                ]
-            ),
-        )
-
+        await reply_duplicate_question(update, duplicate)
+        context.user_data.pop("event_source", None)
         context.user_data["event"] = event
         return
 
-    created = await asyncio.to_thread(create_calendar_event, event)
+    created = await create_calendar_event(event)
     if created:
+        duplicate_index.add(event, get_event_link(event.event_id))
         logger.info(
             f"Event created successfully by user {username} (ID: {user_id}): {event.title}"
         )
@@ -346,6 +462,218 @@ async def create_event_command(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.effective_message.reply_text(event_creation_error_message)
 
 
+async def import_event_urls(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, urls: "list[str]"
+):
+    """Create events for several links at once.
+
+    Links are imported concurrently, up to the configured concurrency cap.
+    Duplicates are skipped rather than asked about. One progress
+    message is edited as links complete and finally replaced by a summary.
+    """
+    skipped = max(len(urls) - EventImportConfiguration.max_urls, 0)
+    urls = urls[: EventImportConfiguration.max_urls]
+    results = {"created": [], "duplicate": [], "failed": []}
+    seen_sources = set()
+    semaphore = asyncio.Semaphore(EventImportConfiguration.max_concurrency)
+    progress_lock = asyncio.Lock()
+    last_progress_edit = asyncio.get_running_loop().time()
+    done = 0
+
+    progress_message = await update.effective_message.reply_text(
+        bulk_import_progress_message.format(done=0, total=len(urls))
+    )
+
+    async def report_progress():
+        nonlocal last_progress_edit
+        now = asyncio.get_running_loop().time()
+        if (
+            progress_lock.locked()
+            or now - last_progress_edit < BULK_IMPORT_PROGRESS_INTERVAL
+        ):
+            return
+        async with progress_lock:
+            last_progress_edit = now
+            try:
+                await progress_message.edit_text(
+                    bulk_import_progress_message.format(done=done, total=len(urls))
+                )
+            except TelegramError as e:
+                logger.warning(f"Failed to update import progress: {e}")
+
+    async def import_one(url: str):
+        nonlocal done
+        async with semaphore:
+            try:
+                status, detail = await import_event_url(url, seen_sources)
+            except Exception as e:
+                logger.error(f"Event import failed for URL {url}: {e}")
+                status, detail = "failed", url
+        results[status].append(detail)
+        done += 1
+        await report_progress()
+
+    await asyncio.gather(*(import_one(url) for url in urls))
+
+    logger.info(
+        f"Bulk import by user {update.effective_user.id}: "
+        f"{len(results['created'])} created, {len(results['duplicate'])} duplicates, "
+        f"{len(results['failed'])} failed"
+    )
+    summary = bulk_import_summary_message.format(
+        created=len(results["created"]),
+        duplicates=len(results["duplicate"]),
+        failed=len(results["failed"]),
+    )
+    lines = (
+        [f"✅ {title}" for title in results["created"]]
+        + [f"🔁 {link}" for link in results["duplicate"]]
+        + [f"❌ {url}" for url in results["failed"]]
+    )
+    if lines:
+        summary += "\n\n" + "\n".join(lines)
+    if skipped:
+        summary += "\n\n" + bulk_import_limit_message.format(
+            limit=EventImportConfiguration.max_urls, skipped=skipped
+        )
+    async with progress_lock:
+        try:
+            await progress_message.edit_text(summary, disable_web_page_preview=True)
+        except TelegramError as e:
+            logger.warning(f"Failed to edit import summary, sending it instead: {e}")
+            await update.effective_message.reply_text(
+                summary, disable_web_page_preview=True
+            )
+
+    if results["created"]:
+        await update_cache(context)
+
+
+async def import_event_url(url: str, seen_sources: set) -> "tuple[str, str]":
+    """Import one link of a bulk import.
+
+    Returns ``("created", title)``, ``("duplicate", link)`` or ``("failed", url)``.
+    ``seen_sources`` holds the events already taken by this import, so the same
+    event posted under two links is only created once.
+    """
+    is_valid, sanitized_url, error_msg, domain = validate_and_sanitize_url(
+        url, ALLOWED_EVENT_DOMAINS
+    )
+    if not is_valid:
+        logger.warning(f"Invalid URL in bulk import: {url}. Error: {error_msg}")
+        return "failed", url
+
+    event, duplicate, url_searched = await fetch_unless_duplicate(domain, sanitized_url)
+    if duplicate is not None:
+        return "duplicate", duplicate
+
+    if event is None:
+        logger.error(f"Event processing failed for URL: {sanitized_url}")
+        return "failed", sanitized_url
+
+    source_key = get_source_key(event.url, event.source_id) or canonicalize_event_url(
+        event.url
+    )
+    if source_key in seen_sources:
+        return "duplicate", sanitized_url
+    seen_sources.add(source_key)
+
+    duplicate = await find_duplicate(event, url_searched=url_searched)
+    if duplicate is not None:
+        return "duplicate", duplicate
+
+    if not await create_calendar_event(event):
+        logger.error(f"Event creation failed for URL: {sanitized_url}")
+        return "failed", sanitized_url
+    duplicate_index.add(event, get_event_link(event.event_id))
+    return "created", event.title
+
+
+async def fetch_unless_duplicate(
+    domain: str, url: str
+) -> "tuple[Event | None, str | None, bool]":
+    """Fetch the event at ``url`` while checking the calendar for it by URL.
+
+    The duplicate check only needs the URL, so a hit cancels the fetch
+    altogether. Returns the event (None on a hit or a failed fetch), the
+    duplicate's link and whether the calendar was searched for the URL.
+    """
+    fetch_task = asyncio.create_task(fetch_provider_event(domain, url))
+    url_searched = not duplicate_index.warm
+    try:
+        duplicate = await find_duplicate_by_url(url)
+        if duplicate is not None:
+            return None, duplicate, url_searched
+        return await fetch_task, None, url_searched
+    finally:
+        if not fetch_task.done():
+            fetch_task.cancel()
+        elif not fetch_task.cancelled():
+            # Retrieved so a fetch that failed after a hit is not logged
+            fetch_task.exception()
+
+
+@traced("fetch_provider_event")
+async def fetch_provider_event(domain: str, url: str) -> "Event | None":
+    if domain == "ra.co":
+        return await process_ra_event(url)
+    if domain == "dice.fm":
+        return await process_dice_event(url)
+    return None
+
+
+async def reply_duplicate_question(update: Update, duplicate: str):
+    message = duplicate_event_question_message + "\n\n" + duplicate
+    await update.effective_message.reply_text(
+        message,
+        disable_web_page_preview=True,
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        duplicate_event_create_button_text,
+                        callback_data="duplicate_event_create",
+                    ),
+                    InlineKeyboardButton(
+                        duplicate_event_skip_button_text,
+                        callback_data="duplicate_event_skip",
+                    ),
+                ]
+            ]
+        ),
+    )
+
+
+@traced("find_duplicate_by_url")
+async def find_duplicate_by_url(url: str) -> "str | None":
+    """Check for an existing copy of the event behind ``url`` before fetching it.
+
+    Answered from the local duplicate index when it is warm; otherwise Teamup
+    is searched for the URL among upcoming events.
+    """
+    duplicate = duplicate_index.lookup(url)
+    if duplicate is not None or duplicate_index.warm:
+        return duplicate
+    duplicate_index.fallbacks += 1
+    return await search_event_url(url, datetime.date.today())
+
+
+@traced("find_duplicate")
+async def find_duplicate(event: Event, url_searched: bool = False) -> "str | None":
+    """Return a calendar link for an existing copy of a fetched event, if any.
+
+    The index is checked by provider ID too, since the same Dice item can be
+    posted under another URL. Teamup is only searched when the index cannot
+    vouch for the event's start date and the URL has not been searched yet.
+    """
+    duplicate = duplicate_index.lookup(event.url, event.source_id)
+    if duplicate is not None or url_searched or duplicate_index.covers(event.start):
+        return duplicate
+    duplicate_index.fallbacks += 1
+    return await search_event(event)
+
+
+@observe_handler("button")
 async def button_click_handler(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -358,18 +686,26 @@ async def button_click_handler(
         await query.edit_message_text(text=message, disable_web_page_preview=True)
     elif query.data == "duplicate_event_create":
         event = context.user_data.pop("event", None)
+        event_source = context.user_data.pop("event_source", None)
+        if event is None and event_source is not None:
+            # The duplicate was found before the provider fetch finished.
+            event = await fetch_provider_event(
+                event_source["domain"], event_source["url"]
+            )
         if event is None:
             await query.edit_message_text(text=event_creation_error_message)
             return
 
-        created = await asyncio.to_thread(create_calendar_event, event)
+        created = await create_calendar_event(event)
         if created:
+            duplicate_index.add(event, get_event_link(event.event_id))
             await query.edit_message_text(text=event_created_message)
             await update_cache(context)
         else:
             await query.edit_message_text(text=event_creation_error_message)
 
 
+@observe_handler("guestlist")
 async def guest_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_old_command(update, context):
         return
@@ -384,19 +720,23 @@ async def guest_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.effective_message.reply_text(queue_user_not_found_message)
         return
     username = usernames[0]
-    user_id = context.chat_data.get(username, None)
+    onboarding = get_onboarding_store(context)
+    user_id = onboarding.find_by_username(username)
     if user_id is None:
         await update.effective_message.reply_text(queue_user_not_found_message)
         return
 
     mention = get_mention(user_id, username)
-    success = remove_job_if_exists(str(user_id), context)
+    success = deadline_scheduler.cancel(
+        update.effective_chat.id, user_id, *MEMBER_DEADLINES
+    )
     if success:
         await update.effective_message.reply_html(
             guest_list_success_message.format(name=mention)
         )
         await clean_up_welcome_message(context, update.effective_chat.id, user_id)
         await clean_up_warn_message(context, update.effective_chat.id, user_id)
+        onboarding.pop(user_id)
 
         message = success_message.format(name=mention)
         await context.bot.send_message(
@@ -407,6 +747,7 @@ async def guest_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
 
 
+@observe_handler("kick")
 async def kick_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_old_command(update, context):
         return
@@ -421,19 +762,23 @@ async def kick_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text(queue_user_not_found_message)
         return
     username = usernames[0]
-    user_id = context.chat_data.get(username, None)
+    onboarding = get_onboarding_store(context)
+    user_id = onboarding.find_by_username(username)
     if user_id is None:
         await update.effective_message.reply_text(queue_user_not_found_message)
         return
 
     mention = get_mention(user_id, username)
-    success = remove_job_if_exists(str(user_id), context)
+    success = deadline_scheduler.cancel(
+        update.effective_chat.id, user_id, *MEMBER_DEADLINES
+    )
     if success:
         await context.bot.send_message(
             chat_id=update.effective_chat.id, text=kick_message.format(name=mention)
         )
         await clean_up_welcome_message(context, update.effective_chat.id, user_id)
         await clean_up_warn_message(context, update.effective_chat.id, user_id)
+        onboarding.pop(user_id)
 
         # Calculate the datetime object that is one minute from now
         until_date = datetime.datetime.now() + datetime.timedelta(minutes=1)
@@ -442,9 +787,12 @@ async def kick_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+@observe_handler("calendar")
 async def calendar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_old_command(update, context):
         return
+    if await is_rate_limited(update, "calendar"):
+        return
     message = get_calendar_link()
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
@@ -454,6 +802,7 @@ async def calendar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@observe_handler("status")
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin command to check bot health and status."""
     if is_old_command(update, context):
@@ -475,6 +824,10 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     hours, remainder = divmod(int(uptime.total_seconds()), 3600)
     minutes, seconds = divmod(remainder, 60)
     status_message += f"⏱️ Uptime: {hours}h {minutes}m {seconds}s\n"
+    if is_sharded():
+        status_message += (
+            f"🧩 Shard: {ShardConfiguration.index + 1} of {ShardConfiguration.count}\n"
+        )
 
     # Determine where to read announcement data from
     # Use configured announcement chat data if available, otherwise current chat data
@@ -488,14 +841,55 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 status_chat_data = configured_chat_data
 
     # Check cache status
-    cache = status_chat_data.get("cache", None)
-    if cache:
+    if event_cache.loaded:
+        cache = event_cache.cache
         status_message += f"💾 Cache: {len(cache.events)} events loaded\n"
         status_message += (
             f"🕐 Last update: {cache.last_update.strftime('%Y-%m-%d %H:%M:%S')}\n"
         )
     else:
         status_message += "⚠️ Cache: Not initialized\n"
+    status_message += (
+        f"📈 Cache stats: {event_cache.hits} hits, {event_cache.stale_hits} stale hits, "
+        f"{event_cache.misses} misses, "
+        f"{event_cache.refreshes} refreshes ({event_cache.failures} failed)\n"
+    )
+    status_message += (
+        f"🔄 Calendar sync: {calendar_sync.full_syncs} full, "
+        f"{calendar_sync.delta_syncs} delta\n"
+    )
+    status_message += (
+        f"🔎 Duplicate index: {len(duplicate_index)} events, "
+        f"{duplicate_index.hits} hits, {duplicate_index.misses} misses, "
+        f"{duplicate_index.fallbacks} Teamup searches\n"
+    )
+    status_message += (
+        f"🗂 Provider cache: {len(provider_cache)} events, "
+        f"{provider_cache.hit_rate:.0%} hit rate "
+        f"({provider_cache.hits} hits, {provider_cache.shared} shared, "
+        f"{provider_cache.misses} misses)\n"
+    )
+
+    # Chat data is loaded lazily, so only chats seen since startup are counted
+    pending_members = 0
+    loaded_chats = 0
+    application = getattr(context, "application", None)
+    app_chat_data = getattr(application, "chat_data", None)
+    if isinstance(app_chat_data, Mapping):
+        loaded_chats = len(app_chat_data)
+        for chat_data in app_chat_data.values():
+            onboarding = chat_data.get(ONBOARDING_KEY)
+            if isinstance(onboarding, Mapping):
+                pending_members += len(onboarding["members"])
+    status_message += (
+        f"👋 Onboarding: {pending_members} pending members "
+        f"in {loaded_chats} loaded chats\n"
+    )
+    status_message += (
+        f"🎉 Welcomes: {join_aggregator.batches} sent to {join_aggregator.members} "
+        f"members ({join_aggregator.flood_batches} in flood mode, "
+        f"{len(join_aggregator)} waiting)\n"
+    )
 
     # Check announcement updater status
     if AnnouncementConfiguration.chat_id is None:
@@ -515,7 +909,9 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         status_message += f"📌 Announcement message: {announcement_id}\n"
 
-    last_announcement_update = context.bot_data.get(LAST_ANNOUNCEMENT_UPDATE_KEY)
+    last_announcement_update = await get_admin_value(
+        context.bot_data, LAST_ANNOUNCEMENT_UPDATE_KEY
+    )
     if last_announcement_update:
         outcome = last_announcement_update.get("outcome", "unknown")
         timestamp = last_announcement_update.get("timestamp", "unknown")
@@ -526,9 +922,15 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         status_message += "🧾 Last announcement update: Not recorded\n"
 
-    # Check rate limiting - use generator expression for efficiency
-    active_users = sum(1 for v in rate_limit_tracker.values() if v)
-    status_message += f"⏱️ Rate limiting: Active ({active_users} users tracked)\n"
+    limited_commands = ", ".join(
+        f"/{command} {rate_limiter.allowed.get(command, 0)} allowed"
+        f"/{rate_limiter.limited.get(command, 0)} limited"
+        for command in rate_limiter.policies
+    )
+    status_message += (
+        f"⏱️ Rate limiting: {len(rate_limiter)} buckets tracked"
+        f"{' (' + limited_commands + ')' if limited_commands else ''}\n"
+    )
 
     # Check scheduled jobs - count all jobs in the job queue
     try:
@@ -543,10 +945,182 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         status_message += f"⚙️ Scheduled jobs: {job_count}\n"
     else:
         status_message += "⚙️ Scheduled jobs: N/A\n"
+    status_message += f"⏰ Onboarding deadlines: {len(deadline_scheduler)} pending\n"
+    queued = ", ".join(
+        f"{name} {outbound_limiter.queued.get(priority, 0)}"
+        for priority, name in PRIORITY_NAMES.items()
+    )
+    lag = ", ".join(
+        f"p{value} {lag * 1000:.0f} ms"
+        for value, lag in loop_watchdog.percentiles().items()
+    )
+    status_message += (
+        f"🐌 Event loop lag: {lag}, max {loop_watchdog.max_lag * 1000:.0f} ms, "
+        f"{loop_watchdog.stalls} stalls\n"
+    )
+    if loop_watchdog.last_stall is not None:
+        status_message += (
+            f"🧱 Last stall: {loop_watchdog.last_stall['lag_seconds'] * 1000:.0f} ms "
+            f"in {html.escape(loop_watchdog.last_stall['handler'])} "
+            f"(<code>{html.escape(loop_watchdog.last_stall['call'])}</code>)\n"
+        )
+    status_message += (
+        f"📤 Outbound: {outbound_limiter.sent} sent, "
+        f"{outbound_limiter.retries} flood-wait retries, queued: {queued}\n"
+    )
 
     await update.effective_message.reply_html(status_message)
 
 
+def format_trace(trace) -> str:
+    """Span tree of a finished trace, one indented line per span."""
+    started = datetime.datetime.fromtimestamp(
+        trace.finished_at - trace.duration, datetime.timezone.utc
+    ).strftime("%H:%M:%S")
+    lines = [
+        f"<b>{html.escape(trace.name)}</b> {trace.duration * 1000:.0f} ms "
+        f"at {started} (<code>{trace.correlation_id}</code>)"
+    ]
+    depths = {None: -1}
+    for span in trace.spans[1 : TRACE_SPANS_SHOWN + 1]:
+        depth = depths[span.parent_id] + 1 if span.parent_id in depths else 0
+        depths[span.span_id] = depth
+        duration = "…" if span.duration is None else f"{span.duration * 1000:.0f} ms"
+        error = f" ⚠️ {html.escape(span.error)}" if span.error else ""
+        lines.append(f"{'  ' * depth}• {html.escape(span.name)} {duration}{error}")
+    hidden = len(trace.spans) - 1 - TRACE_SPANS_SHOWN + trace.dropped
+    if hidden > 0:
+        lines.append(f"  … {hidden} more spans")
+    return "\n".join(lines)
+
+
+@observe_handler("traces")
+async def traces_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin command showing the slowest recently handled updates."""
+    if is_old_command(update, context):
+        return
+    if update.effective_user.id != BotConfiguration.admin_id:
+        await update.effective_message.reply_text(admin_access_error_message)
+        return
+
+    traces = tracer.slowest(TRACES_SHOWN)
+    if not traces:
+        await update.effective_message.reply_text("No traces recorded yet")
+        return
+    message = (
+        f"🐢 <b>Slowest of the last {len(tracer.recent)} updates</b>\n\n"
+        + "\n\n".join(format_trace(trace) for trace in traces)
+    )
+    await update.effective_message.reply_html(message)
+
+
+def register_metrics(application: Application):
+    """Export the counters kept by the bot's components as metrics."""
+
+    def get_job_count() -> int:
+        return len(application.job_queue.jobs())
+
+    metrics.gauge_callback(
+        "cache_hit_ratio",
+        "Share of lookups answered from a cache.",
+        lambda: {
+            "events": event_cache.hit_rate,
+            "provider": provider_cache.hit_rate,
+            "duplicates": duplicate_index.hits
+            / ((duplicate_index.hits + duplicate_index.misses) or 1),
+        },
+        labels=("cache",),
+    )
+    metrics.counter_callback(
+        "cache_lookups",
+        "Cache lookups by result.",
+        lambda: {
+            ("events", "hit"): event_cache.hits,
+            ("events", "stale"): event_cache.stale_hits,
+            ("events", "miss"): event_cache.misses,
+            ("provider", "hit"): provider_cache.hits,
+            ("provider", "shared"): provider_cache.shared,
+            ("provider", "miss"): provider_cache.misses,
+            ("duplicates", "hit"): duplicate_index.hits,
+            ("duplicates", "miss"): duplicate_index.misses,
+        },
+        labels=("cache", "result"),
+    )
+    metrics.gauge_callback(
+        "cached_events",
+        "Events in the shared calendar cache.",
+        lambda: len(event_cache.cache.events),
+    )
+    metrics.gauge_callback(
+        "job_queue_size", "Jobs scheduled in the job queue.", get_job_count
+    )
+    metrics.gauge_callback(
+        "onboarding_deadlines",
+        "Pending warn and kick deadlines.",
+        lambda: len(deadline_scheduler),
+    )
+    metrics.gauge_callback(
+        "outbound_queued",
+        "Bot API requests waiting for a send slot, by lane.",
+        lambda: {
+            name: outbound_limiter.queued.get(priority, 0)
+            for priority, name in PRIORITY_NAMES.items()
+        },
+        labels=("lane",),
+    )
+    metrics.counter_callback(
+        "outbound_retries",
+        "Bot API requests retried after a flood wait.",
+        lambda: outbound_limiter.retries,
+    )
+    metrics.counter_callback(
+        "rate_limited_commands",
+        "Commands rejected by the rate limiter.",
+        lambda: dict(rate_limiter.limited),
+        labels=("command",),
+    )
+    metrics.gauge_callback(
+        "event_loop_lag_seconds",
+        "Event loop scheduling lag over recent heartbeats, by percentile.",
+        lambda: {
+            **{
+                str(value / 100): lag
+                for value, lag in loop_watchdog.percentiles().items()
+            },
+            "1.0": loop_watchdog.max_lag,
+        },
+        labels=("quantile",),
+    )
+    metrics.counter_callback(
+        "event_loop_stalls",
+        "Times the event loop was blocked past the lag threshold.",
+        lambda: loop_watchdog.stalls,
+    )
+    metrics.counter_callback(
+        "welcomed_members",
+        "Members greeted by a welcome message.",
+        lambda: join_aggregator.members,
+    )
+    metrics.counter_callback(
+        "welcome_batches",
+        "Welcome messages sent, by mode.",
+        lambda: {
+            "normal": join_aggregator.batches - join_aggregator.flood_batches,
+            "flood": join_aggregator.flood_batches,
+        },
+        labels=("mode",),
+    )
+
+
+async def start_metrics_server():
+    if not MetricsConfiguration.port:
+        return
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        logger.error(f"Failed to start metrics server: {e}")
+
+
 def get_configured_announcement_job_name(chat_id: int) -> str:
     return f"configured_update_{chat_id}"
 
@@ -576,6 +1150,13 @@ def register_configured_announcement_job(
         if first_run_seconds is None
         else first_run_seconds
     )
+    if not owns_chat(configured_chat_id):
+        logger.info(
+            f"Announcement chat {configured_chat_id} belongs to another shard; "
+            "updater not scheduled"
+        )
+        return False
+
     job_name = get_configured_announcement_job_name(configured_chat_id)
 
     for job in application.job_queue.get_jobs_by_name(job_name):
@@ -619,22 +1200,62 @@ def is_recoverable_announcement_edit_error(error_message: str) -> bool:
     )
 
 
-def record_announcement_update_status(
+async def record_announcement_update_status(
     context: ContextTypes.DEFAULT_TYPE, outcome: str, reason: str
 ):
-    context.bot_data[LAST_ANNOUNCEMENT_UPDATE_KEY] = {
+    status = {
         "timestamp": datetime.datetime.now(datetime.timezone.utc).strftime(
             "%Y-%m-%d %H:%M:%S"
         ),
         "outcome": outcome,
         "reason": reason,
     }
+    # Error details after the colon would make a label per message
+    announcement_updates.inc(outcome, reason.split(":", 1)[0])
+    await update_admin_value(
+        context.bot_data, LAST_ANNOUNCEMENT_UPDATE_KEY, lambda _: status
+    )
 
 
 async def update_announcement_timer(context: ContextTypes.DEFAULT_TYPE):
     logger.info("Running scheduled announcement update...")
     job = context.job
-    await update_announcement(context, job.chat_id)
+    # Scheduled refreshes yield to moderation and replies in the send queue
+    with outbound_priority(PRIORITY_BACKGROUND):
+        await update_announcement(context, job.chat_id)
+
+
+def get_announcement_digest(message: str) -> str:
+    return hashlib.sha256(message.encode("utf-8")).hexdigest()
+
+
+def is_announcement_verification_due(state: dict) -> bool:
+    verified_at = state.get("verified_at")
+    if verified_at is None:
+        return True
+    age = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.datetime.fromisoformat(verified_at)
+    return age.total_seconds() >= AnnouncementConfiguration.verify_interval_seconds
+
+
+def record_announcement_state(
+    context: ContextTypes.DEFAULT_TYPE,
+    message_id: int,
+    digest: str,
+    pinned: bool,
+    verified: bool,
+):
+    previous = context.chat_data.get(ANNOUNCEMENT_STATE_KEY) or {}
+    verified_at = previous.get("verified_at")
+    if verified:
+        verified_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    context.chat_data[ANNOUNCEMENT_STATE_KEY] = {
+        "message_id": message_id,
+        "digest": digest,
+        "pinned": pinned,
+        "verified_at": verified_at,
+    }
 
 
 async def update_announcement(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
@@ -646,9 +1267,26 @@ async def update_announcement(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
         old_announcement_id = int(context.chat_data["announcement_id"])
 
     message = await get_rave_message(context)
+    digest = get_announcement_digest(message)
     msg_object = None
     should_create_new_message = old_announcement_id is None
 
+    # Between verifications trust the recorded state: an unchanged, pinned
+    # announcement needs no Bot API calls, and an edited one needs no re-pin.
+    state = context.chat_data.get(ANNOUNCEMENT_STATE_KEY) or {}
+    trusted_pin = (
+        old_announcement_id is not None
+        and state.get("message_id") == old_announcement_id
+        and state.get("pinned")
+        and not is_announcement_verification_due(state)
+    )
+    if trusted_pin and state.get("digest") == digest:
+        logger.info("Announcement unchanged and pinned. Skipping update.")
+        await record_announcement_update_status(
+            context, "success", "unchanged, skipped"
+        )
+        return
+
     if old_announcement_id is not None:
         try:
             logger.info("Announcement message found. Updating...")
@@ -672,20 +1310,27 @@ async def update_announcement(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
                     logger.error(
                         f"Failed to pin unchanged announcement message: {pin_error.message}"
                     )
-                    record_announcement_update_status(
+                    record_announcement_state(
+                        context, old_announcement_id, digest, False, False
+                    )
+                    await record_announcement_update_status(
                         context, "failure", f"pin failed: {pin_error.message}"
                     )
                     return
-                record_announcement_update_status(
+                record_announcement_state(
+                    context, old_announcement_id, digest, True, True
+                )
+                await record_announcement_update_status(
                     context, "success", "message not modified"
                 )
                 return
             if is_recoverable_announcement_edit_error(e.message):
                 logger.warning(f"Stored announcement message is stale: {e.message}")
                 should_create_new_message = True
+                trusted_pin = False
             else:
                 logger.error(f"Failed to edit announcement message: {e.message}")
-                record_announcement_update_status(
+                await record_announcement_update_status(
                     context, "failure", f"edit failed: {e.message}"
                 )
                 return
@@ -701,7 +1346,7 @@ async def update_announcement(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
             )
         except TelegramError as e:
             logger.error(f"Failed to create announcement message: {e.message}")
-            record_announcement_update_status(
+            await record_announcement_update_status(
                 context, "failure", f"create failed: {e.message}"
             )
             return
@@ -709,19 +1354,35 @@ async def update_announcement(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
         context.chat_data["announcement_id"] = msg_object.message_id
 
     if msg_object is not None:
-        # Pin defensively on every update: re-pins the message if an admin manually
-        # unpinned it, and pins a freshly created replacement message.
+        if trusted_pin:
+            # Edited in place; the pin recorded for this message still holds.
+            record_announcement_state(
+                context, msg_object.message_id, digest, True, False
+            )
+            await record_announcement_update_status(
+                context, "success", "announcement updated"
+            )
+            return
+
+        # Pin on verification runs and for new messages: re-pins the message if
+        # an admin manually unpinned it, and pins a freshly created replacement.
         try:
             await msg_object.pin(disable_notification=True)
         except TelegramError as e:
             logger.error(f"Failed to pin announcement message: {e.message}")
-            record_announcement_update_status(
+            record_announcement_state(
+                context, msg_object.message_id, digest, False, False
+            )
+            await record_announcement_update_status(
                 context, "failure", f"pin failed: {e.message}"
             )
             return
 
         context.chat_data["announcement_id"] = msg_object.message_id
-        record_announcement_update_status(context, "success", "announcement updated")
+        record_announcement_state(context, msg_object.message_id, digest, True, True)
+        await record_announcement_update_status(
+            context, "success", "announcement updated"
+        )
         if (
             old_announcement_id is not None
             and msg_object.message_id != old_announcement_id
@@ -744,106 +1405,171 @@ async def clean_up_old_announcement(
 
 
 async def get_rave_message(context: ContextTypes.DEFAULT_TYPE):
-    cache = context.chat_data.get("cache", Cache(datetime.datetime.now(), []))
-    if (
-        not cache.events
-        or (datetime.datetime.now().date() - cache.last_update.date()).days >= 1
-    ):
-        await update_cache(context)
-        cache = context.chat_data.get("cache", cache)
-
-    message = upcoming_events_header
-    if not cache.events:
-        message += no_upcoming_events_message
+    cache = await event_cache.get(sync_calendar)
+
+    today = datetime.date.today()
+    last_day = today + datetime.timedelta(days=RAVE_WINDOW_DAYS - 1)
+    events = [
+        event
+        for event in cache.events
+        if event.start.date() <= last_day and event.end.date() >= today
+    ]
+
+    parts = [upcoming_events_header]
+    if not events:
+        parts.append(no_upcoming_events_message)
     else:
-        for event in cache.events:
-            message += str(event) + "\n"
+        parts.extend(event.line + "\n" for event in events)
 
-    return message
+    if event_cache.is_expired():
+        parts.append(
+            stale_events_message.format(
+                last_update=cache.last_update.strftime("%d.%m %H:%M")
+            )
+        )
 
+    return "".join(parts)
 
+
+@traced("update_cache")
 async def update_cache(context: ContextTypes.DEFAULT_TYPE):
-    events = await asyncio.to_thread(get_events)
-    if events is None:
-        logger.warning("API failure, keeping existing cache")
-        return
-    cache = context.chat_data.get("cache", Cache(datetime.datetime.now(), []))
-    cache.update(events)
-    context.chat_data["cache"] = cache
-    logger.info(f"Cache updated with {len(events)} events")
+    # Explicit refreshes follow calendar changes, so never reuse a snapshot
+    await event_cache.refresh(lambda: sync_calendar(use_snapshot=False))
+
+
+@traced("sync_calendar")
+async def sync_calendar(use_snapshot: bool = True) -> "list[Event] | None":
+    """Sync the calendar window and rebuild the duplicate index from it.
+
+    When sharded, a fresh window synced by another shard is reused instead of
+    asking TeamUp again, and every sync is shared with the other shards.
+    """
+    if is_sharded() and use_snapshot:
+        snapshot = await shared_state.get(CALENDAR_SNAPSHOT_KEY)
+        if snapshot is not None and snapshot["window_start"] == datetime.date.today():
+            events = snapshot["events"]
+            duplicate_index.rebuild(
+                events,
+                get_event_link,
+                snapshot["window_start"],
+                snapshot["window_end"],
+            )
+            return events
+
+    events = await calendar_sync.sync()
+    if events is not None:
+        duplicate_index.rebuild(
+            events,
+            get_event_link,
+            calendar_sync.window_start,
+            calendar_sync.window_end,
+        )
+        if is_sharded():
+            await shared_state.put(
+                CALENDAR_SNAPSHOT_KEY,
+                {
+                    "events": events,
+                    "window_start": calendar_sync.window_start,
+                    "window_end": calendar_sync.window_end,
+                },
+                ttl_seconds=CacheConfiguration.refresh_after_seconds,
+            )
+    return events
 
 
-async def warn_idle(context: ContextTypes.DEFAULT_TYPE):
-    user_id = context.job.user_id
-    username = context.chat_data.get(str(user_id), None)
+async def warn_idle(
+    context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, data=None
+):
+    record = get_onboarding_store(context).get(user_id)
+    username = record["name"] if record is not None else None
     mention = get_mention(user_id, username)
 
     message = warn_message.format(name=mention)
     warn_msg = await context.bot.send_message(
-        chat_id=context.job.chat_id, text=message, parse_mode=ParseMode.HTML
+        chat_id=chat_id, text=message, parse_mode=ParseMode.HTML
     )
 
-    context.chat_data["warn_" + str(user_id)] = warn_msg.message_id
+    if record is not None:
+        record["warn"] = warn_msg.message_id
 
-    context.job_queue.run_once(
-        kick_idle,
-        when=30 * 60,
-        chat_id=context.job.chat_id,
-        user_id=user_id,
-        name=str(user_id),
-    )
+    deadline_scheduler.schedule("kick_idle", chat_id, user_id, KICK_IDLE_DELAY)
 
 
-async def kick_idle(context: ContextTypes.DEFAULT_TYPE):
-    user_id = context.job.user_id
-    username = context.chat_data.pop(str(user_id), None)
+async def kick_idle(
+    context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, data=None
+):
+    onboarding = get_onboarding_store(context)
+    record = onboarding.get(user_id)
+    username = record["name"] if record is not None else None
     mention = get_mention(user_id, username)
 
     message = kick_message.format(name=mention)
 
     kick_msg = await context.bot.send_message(
-        chat_id=context.job.chat_id, text=message, parse_mode=ParseMode.HTML
-    )
-    await context.bot.ban_chat_member(
-        chat_id=context.job.chat_id, user_id=context.job.user_id
+        chat_id=chat_id, text=message, parse_mode=ParseMode.HTML
     )
+    await context.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
     await context.bot.unban_chat_member(
-        chat_id=context.job.chat_id, user_id=context.job.user_id, only_if_banned=True
+        chat_id=chat_id, user_id=user_id, only_if_banned=True
     )
 
-    await clean_up_welcome_message(context, context.job.chat_id, user_id)
-    await clean_up_warn_message(context, context.job.chat_id, user_id)
-    await clean_up_joined_message(context, context.job.chat_id, user_id)
+    await clean_up_welcome_message(context, chat_id, user_id)
+    await clean_up_warn_message(context, chat_id, user_id)
+    await clean_up_joined_message(context, chat_id, user_id)
+    onboarding.pop(user_id)
 
     # Schedule kick message self-deletion after 5 minutes
-    context.job_queue.run_once(
-        delete_kick_message,
-        when=5 * 60,
-        chat_id=context.job.chat_id,
+    deadline_scheduler.schedule(
+        "delete_kick_message",
+        chat_id,
+        user_id,
+        KICK_MESSAGE_DELETE_DELAY,
         data={"message_id": kick_msg.message_id},
-        name=f"kick_msg_{user_id}",
     )
 
 
+def pop_onboarding_message_id(
+    context: ContextTypes.DEFAULT_TYPE, user_id: int, kind: str
+) -> "int | None":
+    onboarding = get_onboarding_store(context)
+    record = onboarding.get(user_id)
+    if record is None:
+        return None
+    message_id = record.get(kind)
+    record[kind] = None
+    if message_id is not None and onboarding.message_in_use(kind, message_id):
+        # Shared by a batch; the last member still pending removes it
+        return None
+    return message_id
+
+
+def is_message_already_deleted(error_message: str) -> bool:
+    return "message to delete not found" in error_message.lower()
+
+
 async def clean_up_welcome_message(
     context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int
 ):
-    welcome_msg_id = context.chat_data.pop("welcome_" + str(user_id), None)
-    if welcome_msg_id is not None:
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=welcome_msg_id)
-        except BadRequest as e:
-            logger.warning(
-                f"Failed to delete welcome message for user {user_id}: {e.message}"
-            )
-    else:
+    record = get_onboarding_store(context).get(user_id)
+    if record is None or record.get("welcome") is None:
         logger.warning(f"Welcome message for user {user_id} not found.")
+        return
+    welcome_msg_id = pop_onboarding_message_id(context, user_id, "welcome")
+    if welcome_msg_id is None:
+        # Combined welcome still greeting other pending members
+        return
+    try:
+        await context.bot.delete_message(chat_id=chat_id, message_id=welcome_msg_id)
+    except BadRequest as e:
+        # A combined welcome may already be gone, e.g. removed by an admin
+        log = logger.debug if is_message_already_deleted(e.message) else logger.warning
+        log(f"Failed to delete welcome message for user {user_id}: {e.message}")
 
 
 async def clean_up_warn_message(
     context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int
 ):
-    warn_msg_id = context.chat_data.pop("warn_" + str(user_id), None)
+    warn_msg_id = pop_onboarding_message_id(context, user_id, "warn")
     if warn_msg_id is not None:
         try:
             await context.bot.delete_message(chat_id=chat_id, message_id=warn_msg_id)
@@ -858,22 +1584,24 @@ async def clean_up_warn_message(
 async def clean_up_joined_message(
     context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int
 ):
-    joined_msg_id = context.chat_data.pop("joined_" + str(user_id), None)
+    joined_msg_id = pop_onboarding_message_id(context, user_id, "joined")
     if joined_msg_id is not None:
         try:
             await context.bot.delete_message(chat_id=chat_id, message_id=joined_msg_id)
         except BadRequest as e:
-            logger.warning(
-                f"Failed to delete joined message for user {user_id}: {e.message}"
+            log = (
+                logger.debug
+                if is_message_already_deleted(e.message)
+                else logger.warning
             )
+            log(f"Failed to delete joined message for user {user_id}: {e.message}")
 
 
-async def delete_kick_message(context: ContextTypes.DEFAULT_TYPE):
-    message_id = context.job.data["message_id"]
+async def delete_kick_message(
+    context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, data: dict
+):
     try:
-        await context.bot.delete_message(
-            chat_id=context.job.chat_id, message_id=message_id
-        )
+        await context.bot.delete_message(chat_id=chat_id, message_id=data["message_id"])
     except BadRequest as e:
         logger.warning(f"Failed to delete kick message: {e.message}")
 
@@ -889,13 +1617,38 @@ if __name__ == "__main__":
     logger.info("RaveBot starting up...")
     logger.info(f"Environment: {ENVIRONMENT}")
 
-    persistence = PicklePersistence("bot_data")
-    application = (
+    if WebhookConfiguration.mode == "router":
+        logger.info("Starting shard router...")
+        run_router()
+        raise SystemExit(0)
+    if is_sharded() and WebhookConfiguration.mode != "webhook":
+        # Only one process may poll getUpdates; shards are fed by the router
+        raise SystemExit("Sharded workers need BOT_MODE=webhook")
+
+    # The announcement chat is read by /status outside of its own updates
+    persistence = SQLitePersistence(
+        preload_chat_ids=[AnnouncementConfiguration.chat_id]
+    )
+    builder = (
         ApplicationBuilder()
         .token(BotConfiguration.token)
         .persistence(persistence)
-        .build()
+        .rate_limiter(outbound_limiter)
     )
+    if ConcurrencyConfiguration.max_concurrent_updates > 1:
+        builder = builder.concurrent_updates(
+            ChatOrderedUpdateProcessor(
+                ConcurrencyConfiguration.max_concurrent_updates,
+                max_pending_updates=ConcurrencyConfiguration.max_pending_updates,
+                admin_id=BotConfiguration.admin_id,
+            )
+        )
+    else:
+        builder = builder.concurrent_updates(TracedUpdateProcessor(1))
+    application = builder.build()
+
+    # Runs before every other handler group
+    application.add_handler(TypeHandler(Update, drop_foreign_update), group=-1)
 
     # Register all handlers
     rave_handler = CommandHandler("rave", rave_command)
@@ -943,6 +1696,9 @@ if __name__ == "__main__":
     status_handler = CommandHandler("status", status_command)
     application.add_handler(status_handler)
 
+    traces_handler = CommandHandler("traces", traces_command)
+    application.add_handler(traces_handler)
+
     application.add_handler(CallbackQueryHandler(button_click_handler))
 
     # Add error handler to log all errors
@@ -958,10 +1714,24 @@ if __name__ == "__main__":
     # Restore configured and manually enabled scheduled jobs
     async def post_init(application):
         register_configured_announcement_job(application)
+        register_metrics(application)
+        await start_metrics_server()
+        loop_watchdog.start()
 
-        update_timers = application.bot_data.get("update_timers", {})
+        deadline_scheduler.register("warn_idle", warn_idle)
+        deadline_scheduler.register("kick_idle", kick_idle)
+        deadline_scheduler.register("delete_kick_message", delete_kick_message)
+        deadline_scheduler.start(application)
+
+        update_timers = await get_admin_value(
+            application.bot_data, UPDATE_TIMERS_KEY, {}
+        )
         for chat_id, enabled in update_timers.items():
-            if enabled and chat_id != AnnouncementConfiguration.chat_id:
+            if (
+                enabled
+                and chat_id != AnnouncementConfiguration.chat_id
+                and owns_chat(chat_id)
+            ):
                 application.job_queue.run_repeating(
                     update_announcement_timer,
                     interval=1 * 60 * 60,
@@ -971,7 +1741,29 @@ if __name__ == "__main__":
                 )
                 logger.info(f"Restored manual hourly update timer for chat {chat_id}")
 
-    application.post_init = post_init
+    async def post_stop(application):
+        await join_aggregator.flush_all()
+        # Before shutdown flushes persistence, so unfinished deadlines are saved
+        await deadline_scheduler.stop()
+
+    async def post_shutdown(application):
+        await loop_watchdog.stop()
+        await metrics_server.stop()
+        await http_client.aclose()
+        await dice_id_store.close()
+        await shared_state.close()
 
-    logger.info("All handlers registered. Starting polling...")
-    application.run_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
+    application.post_init = post_init
+    application.post_stop = post_stop
+    application.post_shutdown = post_shutdown
+
+    # Updates that arrived while the bot was down are processed rather than
+    # dropped, so joins are not lost; stale commands are skipped by is_old_command.
+    if WebhookConfiguration.mode == "webhook":
+        logger.info("All handlers registered. Starting webhook server...")
+        run_webhook(application)
+    else:
+        logger.info("All handlers registered. Starting polling...")
+        application.run_polling(
+            drop_pending_updates=False, allowed_updates=Update.ALL_TYPES
+        )
@@ -0,0 +1,347 @@
+import asyncio
+import contextlib
+import functools
+import math
+import time
+
+from settings import MetricsConfiguration
+from tracing import span
+from utils import logger
+
+# Prefix of every exported metric name
+NAMESPACE = "ravebot"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; Telegram handlers and upstream calls range from milliseconds to the
+# 30 second HTTP timeout
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Upstream hosts reported under one provider label
+PROVIDER_HOSTS = {
+    "ra.co": "ra",
+    "dice.fm": "dice",
+    "api.dice.fm": "dice",
+    "api.teamup.com": "teamup",
+    "teamup.com": "teamup",
+}
+# Path segments kept in the endpoint label; any other segment is an ID, slug
+# or calendar key and becomes {id}, so each API call has one label value
+ENDPOINT_SEGMENTS = {"graphql", "event", "events", "ticket_types"}
+
+REQUEST_TIMEOUT_SECONDS = 10
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{name}="{escape_label_value(value)}"' for name, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: "tuple[str, ...]" = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        key = tuple(str(value) for value in label_values)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, *label_values) -> float:
+        return self.values.get(tuple(str(value) for value in label_values), 0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield "_total", dict(zip(self.labels, key)), value
+
+
+class Histogram:
+    """Cumulative latency buckets with a running sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: "tuple[str, ...]" = (),
+        buckets: "tuple[float, ...]" = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [bucket counts..., sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        key = tuple(str(label) for label in label_values)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * len(self.buckets) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values) -> int:
+        counts = self.values.get(tuple(str(label) for label in label_values))
+        return 0 if counts is None else counts[-2]
+
+    def samples(self):
+        for key, counts in self.values.items():
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                yield "_bucket", {**labels, "le": format_value(bound)}, count
+            yield "_sum", labels, counts[-1]
+            yield "_count", labels, counts[-2]
+
+
+class CallbackMetric:
+    """Counter or gauge read from existing state when metrics are scraped.
+
+    ``callback`` returns a number, or a dict keyed by label value (or tuple of
+    label values) when the metric has labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        description: str,
+        callback,
+        labels: "tuple[str, ...]" = (),
+    ):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.callback = callback
+        self.labels = labels
+
+    def samples(self):
+        suffix = "_total" if self.kind == "counter" else ""
+        value = self.callback()
+        if not self.labels:
+            yield suffix, {}, value
+            return
+        for key, item in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield suffix, dict(zip(self.labels, key)), item
+
+
+class MetricsRegistry:
+    """Metrics exported in the Prometheus text format.
+
+    Metrics are registered once by name; registering a name again returns
+    the existing counter or histogram, and replaces a callback metric.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self._metrics: dict[str, object] = {}
+
+    def _register(self, metric):
+        metric.name = f"{self.namespace}_{metric.name}"
+        existing = self._metrics.get(metric.name)
+        if existing is not None and not isinstance(metric, CallbackMetric):
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels=()) -> Counter:
+        return self._register(Counter(name, description, tuple(labels)))
+
+    def histogram(
+        self, name: str, description: str, labels=(), buckets=DEFAULT_BUCKETS
+    ):
+        return self._register(Histogram(name, description, tuple(labels), buckets))
+
+    def gauge_callback(self, name: str, description: str, callback, labels=()):
+        return self._register(
+            CallbackMetric(name, "gauge", description, callback, labels)
+        )
+
+    def counter_callback(self, name: str, description: str, callback, labels=()):
+        return self._register(
+            CallbackMetric(name, "counter", description, callback, labels)
+        )
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in self._metrics.items():
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # One broken callback must not hide the other metrics
+                logger.warning(f"Failed to collect metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for suffix, labels, value in samples:
+                lines.append(
+                    f"{name}{suffix}{format_labels(labels)} {format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+handler_duration = metrics.histogram(
+    "handler_duration_seconds", "Time spent handling an update.", ("handler",)
+)
+handler_calls = metrics.counter(
+    "handler_calls", "Handled updates by outcome.", ("handler", "outcome")
+)
+external_request_duration = metrics.histogram(
+    "external_request_duration_seconds",
+    "Latency of requests to RA, Dice and TeamUp.",
+    ("provider", "endpoint"),
+)
+external_requests = metrics.counter(
+    "external_requests",
+    "Requests to RA, Dice and TeamUp by outcome (2xx, 4xx, 5xx or error).",
+    ("provider", "endpoint", "outcome"),
+)
+announcement_updates = metrics.counter(
+    "announcement_updates",
+    "Announcement update attempts by outcome and reason.",
+    ("outcome", "reason"),
+)
+
+
+def get_provider(host: str) -> str:
+    return PROVIDER_HOSTS.get(host, host)
+
+
+def get_endpoint(method: str, path: str) -> str:
+    """Method and path template of a request, e.g. ``GET /events/{id}/ticket_types``."""
+    segments = [
+        segment if segment in ENDPOINT_SEGMENTS else "{id}"
+        for segment in path.split("/")
+        if segment
+    ]
+    return f"{method} /{'/'.join(segments)}"
+
+
+def get_status_outcome(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+def observe_handler(name: str):
+    """Record latency and outcome of a handler under ``name``, in a span."""
+
+    def decorator(callback):
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                with span(f"handler.{name}"):
+                    result = await callback(update, context)
+                outcome = "ok"
+                return result
+            finally:
+                handler_duration.observe(time.perf_counter() - start, name)
+                handler_calls.inc(name, outcome)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsServer:
+    """Serves ``GET /metrics`` for Prometheus to scrape.
+
+    Runs in every mode, next to polling or the webhook server, on its own
+    port so the metrics are never exposed on the public webhook listener.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        host: "str | None" = None,
+        port: "int | None" = None,
+        path: str = "/metrics",
+    ):
+        self.registry = registry
+        self.host = MetricsConfiguration.listen if host is None else host
+        self.port = MetricsConfiguration.port if port is None else port
+        self.path = path
+        self._server: "asyncio.base_events.Server | None" = None
+
+    @property
+    def bound_port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Metrics served on {self.host}:{self.bound_port}{self.path}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(
+                reader.readline(), REQUEST_TIMEOUT_SECONDS
+            )
+            parts = request_line.decode("latin-1").split()
+            while (
+                await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT_SECONDS)
+            ) not in (b"\r\n", b"\n", b""):
+                pass
+        except (asyncio.TimeoutError, ConnectionError, ValueError) as e:
+            logger.warning(f"Malformed metrics request: {e}")
+            writer.close()
+            return
+
+        if len(parts) != 3 or parts[1].split("?", 1)[0] != self.path:
+            status, body = "404 Not Found", b""
+        elif parts[0] != "GET":
+            status, body = "405 Method Not Allowed", b""
+        else:
+            status, body = "200 OK", self.registry.render().encode()
+        try:
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode(
+                    "ascii"
+                )
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+metrics_server = MetricsServer(metrics)
@@ -1,27 +1,113 @@
 import datetime
 
+# Format of event times exchanged with Teamup and the providers
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Fields shown in the rendered announcement line
+RENDERED_FIELDS = frozenset({"title", "start", "location", "url"})
+
+
+def parse_time(value: "str | datetime.datetime") -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
 
 class Event:
+    """A calendar or provider event with parsed start and end times.
+
+    ``start_time``/``end_time`` remain available as ISO strings. The HTML line
+    used by /rave and the announcement is rendered once and reused until one
+    of the rendered fields changes.
+    """
+
+    __slots__ = (
+        "event_id",
+        "source_id",
+        "title",
+        "start",
+        "end",
+        "location",
+        "url",
+        "description",
+        "_line",
+    )
+
     def __init__(
         self,
         title: str,
-        start_time: str,
-        end_time: str,
+        start_time: "str | datetime.datetime",
+        end_time: "str | datetime.datetime",
         location: str,
         url: str,
-        description: str,
+        description: str = "",
         event_id: str = None,
+        source_id: str = None,
     ):
+        self._line = None
         self.event_id = event_id
+        # Provider's own ID: RA event ID or Dice retailer item ID
+        self.source_id = source_id
         self.title = title
-        self.start_time = start_time
-        self.end_time = end_time
+        self.start = parse_time(start_time)
+        self.end = parse_time(end_time)
         self.location = location
         self.url = url
         self.description = description
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in RENDERED_FIELDS:
+            object.__setattr__(self, "_line", None)
+
+    @property
+    def start_time(self) -> str:
+        return self.start.strftime(TIME_FORMAT)
+
+    @start_time.setter
+    def start_time(self, value: "str | datetime.datetime"):
+        self.start = parse_time(value)
+
+    @property
+    def end_time(self) -> str:
+        return self.end.strftime(TIME_FORMAT)
+
+    @end_time.setter
+    def end_time(self, value: "str | datetime.datetime"):
+        self.end = parse_time(value)
+
+    def render(self) -> str:
+        """Build the announcement line, unless it is cached already."""
+        if self._line is None:
+            object.__setattr__(
+                self,
+                "_line",
+                f'<b>{self.start.strftime("%d.%m")}</b> - {self.title} @ {self.location} - <a href="{self.url}">{self.url}</a>',
+            )
+        return self._line
+
+    @property
+    def line(self) -> str:
+        return self.render()
+
     def __str__(self):
-        return f'<b>{datetime.datetime.strptime(self.start_time, "%Y-%m-%dT%H:%M:%S").strftime("%d.%m")}</b> - {self.title} @ {self.location} - <a href="{self.url}">{self.url}</a>'
+        return self.line
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != "_line"}
+
+    def __setstate__(self, state):
+        # Slotted pickles arrive as (None, slots); events pickled before the
+        # model was slotted arrive as a plain __dict__ with string times.
+        if isinstance(state, tuple):
+            state = state[1] or {}
+        object.__setattr__(self, "_line", None)
+        object.__setattr__(self, "event_id", None)
+        object.__setattr__(self, "source_id", None)
+        object.__setattr__(self, "description", "")
+        for name, value in state.items():
+            if name != "_line":
+                setattr(self, name, value)
 
 
 class Cache:
@@ -32,3 +118,6 @@ class Cache:
     def update(self, events: list[Event]):
         self.last_update = datetime.datetime.now()
         self.events = events
+        # Render once per update so /rave and announcements only join lines
+        for event in events:
+            event.render()
@@ -0,0 +1,153 @@
+import re
+import time
+
+from settings import OnboardingConfiguration
+from utils import logger
+
+ONBOARDING_KEY = "onboarding"
+LEGACY_KEY_PATTERN = re.compile(r"^(welcome_|joined_|warn_)?(\d+)$")
+
+
+def normalize_username(username: "str | None") -> "str | None":
+    if not username:
+        return None
+    return username.lstrip("@").lower()
+
+
+class OnboardingStore:
+    """Pending members of one chat, kept in that chat's data.
+
+    Each member who has yet to post #whois has one record holding their
+    display name, username and the IDs of the welcome, join and warning
+    messages. Records expire ``ttl_seconds`` after the join, so members whose
+    timers were lost do not linger, and the store never holds more than
+    ``max_members`` records. A username index gives constant-time lookups for
+    /guestlist and /kick.
+    """
+
+    def __init__(
+        self,
+        chat_data: dict,
+        ttl_seconds: "int | None" = None,
+        max_members: "int | None" = None,
+    ):
+        self.ttl_seconds = (
+            OnboardingConfiguration.ttl_seconds if ttl_seconds is None else ttl_seconds
+        )
+        self.max_members = (
+            OnboardingConfiguration.max_members if max_members is None else max_members
+        )
+        state = chat_data.get(ONBOARDING_KEY)
+        created = state is None
+        if created:
+            state = chat_data[ONBOARDING_KEY] = {"members": {}, "usernames": {}}
+        self.members: dict[int, dict] = state["members"]
+        self.usernames: dict[str, int] = state["usernames"]
+        if created:
+            migrate_legacy_keys(chat_data, self)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, user_id: int) -> bool:
+        return self.get(user_id) is not None
+
+    def add(
+        self,
+        user_id: int,
+        name: str,
+        username: "str | None" = None,
+        welcome_message_id: "int | None" = None,
+        joined_message_id: "int | None" = None,
+    ) -> dict:
+        self.expire()
+        self.pop(user_id)
+        now = time.time()
+        record = {
+            "name": name,
+            "username": normalize_username(username),
+            "welcome": welcome_message_id,
+            "joined": joined_message_id,
+            "warn": None,
+            "expires_at": now + self.ttl_seconds,
+        }
+        self.members[user_id] = record
+        if record["username"] is not None:
+            self.usernames[record["username"]] = user_id
+        while len(self.members) > self.max_members:
+            oldest = min(
+                self.members, key=lambda member: self.members[member]["expires_at"]
+            )
+            logger.warning(f"Onboarding store full, dropping member {oldest}")
+            self.pop(oldest)
+        return record
+
+    def get(self, user_id: int) -> "dict | None":
+        record = self.members.get(user_id)
+        if record is not None and record["expires_at"] <= time.time():
+            self.pop(user_id)
+            return None
+        return record
+
+    def find_by_username(self, username: str) -> "int | None":
+        user_id = self.usernames.get(normalize_username(username))
+        if user_id is None or user_id not in self:
+            return None
+        return user_id
+
+    def pop(self, user_id: int) -> "dict | None":
+        record = self.members.pop(user_id, None)
+        if record is not None and record["username"] is not None:
+            if self.usernames.get(record["username"]) == user_id:
+                del self.usernames[record["username"]]
+        return record
+
+    def message_in_use(self, kind: str, message_id: int) -> bool:
+        """Whether a pending member still refers to a shared welcome or join message."""
+        return any(record[kind] == message_id for record in self.members.values())
+
+    def expire(self) -> "list[int]":
+        now = time.time()
+        expired = [
+            user_id
+            for user_id, record in self.members.items()
+            if record["expires_at"] <= now
+        ]
+        for user_id in expired:
+            self.pop(user_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} onboarding records")
+        return expired
+
+
+def migrate_legacy_keys(chat_data: dict, store: OnboardingStore):
+    """Move the per-member keys older versions kept in chat data into the store."""
+    legacy = {}
+    for key in list(chat_data):
+        if not isinstance(key, str):
+            continue
+        if key.startswith("@"):
+            user_id = chat_data.pop(key)
+            # Members without a username used to be stored under "@None"
+            if isinstance(user_id, int) and key != "@None":
+                legacy.setdefault(user_id, {})["username"] = key
+            continue
+        match = LEGACY_KEY_PATTERN.match(key)
+        if match:
+            field = (match.group(1) or "name_").rstrip("_")
+            legacy.setdefault(int(match.group(2)), {})[field] = chat_data.pop(key)
+
+    # Only members with a pending welcome were still being onboarded.
+    for user_id, fields in legacy.items():
+        if "welcome" not in fields:
+            continue
+        record = store.add(
+            user_id,
+            fields.get("name"),
+            fields.get("username"),
+            fields.get("welcome"),
+            fields.get("joined"),
+        )
+        record["warn"] = fields.get("warn")
+    if legacy:
+        logger.info(f"Migrated onboarding keys for {len(legacy)} members")
@@ -0,0 +1,285 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from settings import OutboundConfiguration, ShardConfiguration
+from tracing import span
+from utils import logger
+
+PRIORITY_MODERATION = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_MODERATION: "moderation",
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background",
+}
+
+ENDPOINT_PRIORITIES = {
+    "banChatMember": PRIORITY_MODERATION,
+    "unbanChatMember": PRIORITY_MODERATION,
+    "restrictChatMember": PRIORITY_MODERATION,
+    "deleteMessage": PRIORITY_BACKGROUND,
+    "pinChatMessage": PRIORITY_BACKGROUND,
+    "unpinChatMessage": PRIORITY_BACKGROUND,
+}
+
+# Telegram's per-chat limits count messages sent; moderation, edits, pins and
+# deletes only take a token from the global bucket, but still wait out their
+# chat's flood wait
+SEND_ENDPOINTS = {
+    "sendMessage",
+    "sendPhoto",
+    "sendAudio",
+    "sendDocument",
+    "sendVideo",
+    "sendAnimation",
+    "sendVoice",
+    "sendVideoNote",
+    "sendMediaGroup",
+    "sendLocation",
+    "sendVenue",
+    "sendContact",
+    "sendPoll",
+    "sendDice",
+    "sendSticker",
+    "forwardMessage",
+    "copyMessage",
+}
+
+# Requests sent back to back to one group before its per-minute rate applies
+GROUP_BURST = 3
+
+_priority = contextvars.ContextVar("outbound_priority", default=None)
+
+
+@contextlib.contextmanager
+def outbound_priority(priority: int):
+    """Send every Bot API request made inside the block in ``priority``'s lane."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Throttle:
+    """Token bucket whose waiters are admitted by priority, FIFO within one.
+
+    Waiters are woken by a single timer set for the moment the next token is
+    available, and ``pause`` holds every waiter back after a flood wait.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer: "asyncio.TimerHandle | None" = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    @property
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return (
+            not self._waiters
+            and self.tokens >= self.capacity
+            and now >= self.paused_until
+        )
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and self.tokens >= 1 and now >= self.paused_until:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                # The token was handed over right before cancellation.
+                self.tokens += 1
+            raise
+
+    async def wait_resumed(self):
+        """Wait until a flood wait set by ``pause`` is over, without a token."""
+        while (delay := self.paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None or not self._waiters:
+            return
+        now = time.monotonic()
+        delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters and now >= self.paused_until:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.tokens < 1:
+                break
+            _, _, future = heapq.heappop(self._waiters)
+            self.tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Central queue for every Bot API request the bot makes.
+
+    Requests take a token from a global bucket (Telegram allows about 30
+    messages a second); messages sent also take one from a bucket for their
+    chat (20 a minute in groups, one a second in private chats). Waiting requests are admitted by
+    lane: bans and kicks first, then replies and other interactive calls, then
+    announcements and cleanup deletes. Requests that hit a flood wait pause
+    their chat for ``retry_after`` seconds and are retried; only requests
+    without a chat pause the global bucket.
+    """
+
+    def __init__(
+        self,
+        global_per_second: "float | None" = None,
+        group_per_minute: "float | None" = None,
+        private_per_second: "float | None" = None,
+        max_retries: "int | None" = None,
+    ):
+        # Shards split the bot-wide limit evenly
+        self.global_per_second = (
+            OutboundConfiguration.global_per_second / ShardConfiguration.count
+            if global_per_second is None
+            else global_per_second
+        )
+        self.group_per_minute = (
+            OutboundConfiguration.group_per_minute
+            if group_per_minute is None
+            else group_per_minute
+        )
+        self.private_per_second = (
+            OutboundConfiguration.private_per_second
+            if private_per_second is None
+            else private_per_second
+        )
+        self.max_retries = (
+            OutboundConfiguration.max_retries if max_retries is None else max_retries
+        )
+        self._global = Throttle(self.global_per_second, self.global_per_second)
+        self._chats: OrderedDict[int, Throttle] = OrderedDict()
+        self.queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self.sent = 0
+        self.retries = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._chats.clear()
+
+    @staticmethod
+    def get_priority(endpoint: str, rate_limit_args) -> int:
+        if isinstance(rate_limit_args, dict) and "priority" in rate_limit_args:
+            return rate_limit_args["priority"]
+        priority = ENDPOINT_PRIORITIES.get(endpoint)
+        if priority == PRIORITY_MODERATION:
+            return priority
+        current = _priority.get()
+        if current is not None:
+            return current
+        return PRIORITY_INTERACTIVE if priority is None else priority
+
+    def get_chat_throttle(self, chat_id) -> "Throttle | None":
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            # Channel usernames and inline messages only count globally
+            return None
+        throttle = self._chats.get(chat_id)
+        if throttle is None:
+            while self._chats and next(iter(self._chats.values())).idle:
+                self._chats.popitem(last=False)
+            if chat_id < 0:
+                throttle = Throttle(self.group_per_minute / 60, GROUP_BURST)
+            else:
+                throttle = Throttle(self.private_per_second, 1)
+            self._chats[chat_id] = throttle
+        else:
+            self._chats.move_to_end(chat_id)
+        return throttle
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        priority = self.get_priority(endpoint, rate_limit_args)
+        chat = self.get_chat_throttle(data.get("chat_id"))
+        takes_chat_token = endpoint in SEND_ENDPOINTS
+        with span(f"bot.{endpoint}", lane=PRIORITY_NAMES.get(priority)) as current:
+            attempt = 0
+            waited = 0.0
+            while True:
+                self.queued[priority] = self.queued.get(priority, 0) + 1
+                start = time.perf_counter()
+                try:
+                    if chat is not None and takes_chat_token:
+                        await chat.acquire(priority)
+                    elif chat is not None:
+                        await chat.wait_resumed()
+                    await self._global.acquire(priority)
+                finally:
+                    self.queued[priority] -= 1
+                    waited += time.perf_counter() - start
+
+                try:
+                    result = await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning(
+                        f"Flood wait of {e.retry_after}s on {endpoint} for chat "
+                        f"{data.get('chat_id')}, retry {attempt}/{self.max_retries}"
+                    )
+                    (chat or self._global).pause(e.retry_after)
+                    continue
+                finally:
+                    if current is not None:
+                        current.set(wait_ms=round(waited * 1000, 1), retries=attempt)
+                self.sent += 1
+                return result
+
+
+outbound_limiter = OutboundRateLimiter()
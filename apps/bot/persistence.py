@@ -0,0 +1,396 @@
+import asyncio
+import datetime
+import functools
+import json
+import os
+import pickle
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from models import Event
+from settings import PersistenceConfiguration
+from utils import logger
+
+# Bump when the encoding of stored values changes; rows written with another
+# version are skipped on load instead of being misread.
+FORMAT_VERSION = 1
+
+BOT_SCOPE = "bot"
+CHAT_SCOPE = "chat"
+USER_SCOPE = "user"
+CONVERSATION_SCOPE = "conversation"
+TYPE_KEY = "__type__"
+
+# Per-chat keys written by earlier versions that are no longer used
+LEGACY_CHAT_KEYS = ("cache",)
+
+
+def encode_value(value):
+    """Convert a stored value into JSON-compatible data with type tags.
+
+    Raises TypeError for values that have no stable representation.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and TYPE_KEY not in value:
+            return {key: encode_value(item) for key, item in value.items()}
+        return {
+            TYPE_KEY: "dict",
+            "value": [[encode_value(k), encode_value(v)] for k, v in value.items()],
+        }
+    if isinstance(value, tuple):
+        return {TYPE_KEY: "tuple", "value": [encode_value(item) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        return {TYPE_KEY: "set", "value": [encode_value(item) for item in value]}
+    if isinstance(value, datetime.datetime):
+        return {TYPE_KEY: "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {TYPE_KEY: "date", "value": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {TYPE_KEY: "timedelta", "value": value.total_seconds()}
+    if isinstance(value, Event):
+        return {TYPE_KEY: "event", "value": encode_value(value.__getstate__())}
+    raise TypeError(f"cannot persist value of type {type(value).__name__}")
+
+
+def decode_value(data):
+    if isinstance(data, list):
+        return [decode_value(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    if TYPE_KEY not in data:
+        return {key: decode_value(item) for key, item in data.items()}
+
+    kind = data[TYPE_KEY]
+    value = data["value"]
+    if kind == "dict":
+        return {decode_value(k): decode_value(v) for k, v in value}
+    if kind == "tuple":
+        return tuple(decode_value(item) for item in value)
+    if kind == "set":
+        return {decode_value(item) for item in value}
+    if kind == "datetime":
+        return datetime.datetime.fromisoformat(value)
+    if kind == "date":
+        return datetime.date.fromisoformat(value)
+    if kind == "timedelta":
+        return datetime.timedelta(seconds=value)
+    if kind == "event":
+        event = Event.__new__(Event)
+        event.__setstate__(decode_value(value))
+        return event
+    raise ValueError(f"unknown stored type {kind!r}")
+
+
+def dump(value) -> str:
+    return json.dumps(encode_value(value), ensure_ascii=False, sort_keys=True)
+
+
+def load(text: str):
+    return decode_value(json.loads(text))
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    # PicklePersistence replaces Bot instances with a persistent ID; nothing
+    # the bot stored holds one, so drop any that turn up.
+    def persistent_load(self, pid):
+        return None
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence backed by a SQLite database in WAL mode.
+
+    Every top-level key of ``bot_data`` and of each chat's and user's data is
+    its own row holding a versioned, tagged JSON value. Only keys whose value
+    changed since they were last written are updated. Chat and user data are
+    read on first access rather than at startup.
+
+    Values are encoded on the event loop, where handlers change them, and the
+    database is only used from one worker thread so reads and commits never
+    block the loop.
+
+    On first use, data from an existing ``PicklePersistence`` file is copied
+    over once.
+    """
+
+    def __init__(
+        self,
+        path: "str | None" = None,
+        legacy_pickle_path: "str | None" = None,
+        preload_chat_ids: "tuple | list" = (),
+        update_interval: float = 60,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = PersistenceConfiguration.path if path is None else path
+        self.legacy_pickle_path = (
+            PersistenceConfiguration.legacy_pickle_path
+            if legacy_pickle_path is None
+            else legacy_pickle_path
+        )
+        self.preload_chat_ids = [
+            chat_id for chat_id in preload_chat_ids if chat_id is not None
+        ]
+        self.rows_written = 0
+        self.rows_deleted = 0
+        self._connection: "sqlite3.Connection | None" = None
+        # Hashes of the values last read or written, per (scope, owner) and key
+        self._written: dict[tuple, dict[str, int]] = {}
+        self._loaded: set[tuple] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="persistence"
+        )
+
+    async def _run(self, function, *args):
+        """Run ``function`` on the database thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args)
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS persistence_data ("
+                "scope TEXT NOT NULL, owner_id INTEGER NOT NULL, key TEXT NOT NULL, "
+                "version INTEGER NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (scope, owner_id, key))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS persistence_meta ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            connection.commit()
+            self._connection = connection
+            self._migrate_pickle()
+        return self._connection
+
+    def _read(self, scope: str, owner_id: int) -> dict:
+        rows = self._connect().execute(
+            "SELECT key, version, value FROM persistence_data "
+            "WHERE scope = ? AND owner_id = ?",
+            (scope, owner_id),
+        )
+        data = {}
+        written = {}
+        for key_text, version, value_text in rows:
+            if version != FORMAT_VERSION:
+                logger.warning(
+                    f"Skipping {scope} {owner_id} row written in format {version}"
+                )
+                continue
+            try:
+                data[load(key_text)] = load(value_text)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.error(f"Skipping unreadable {scope} {owner_id} row: {e}")
+                continue
+            written[key_text] = hash(value_text)
+        self._written[(scope, owner_id)] = written
+        self._loaded.add((scope, owner_id))
+        return data
+
+    def _changes(self, scope: str, owner_id: int, data: dict) -> tuple:
+        """Encode ``data`` and find the keys that changed or were removed."""
+        written = self._written.get((scope, owner_id), {})
+        current = {}
+        upserts = []
+        for key, value in list(data.items()):
+            key_text = None
+            try:
+                key_text = dump(key)
+                value_text = dump(value)
+            except TypeError as e:
+                logger.error(f"Not persisting {scope} {owner_id} key {key!r}: {e}")
+                # The stored row, if any, is left as it was rather than deleted
+                if key_text is not None and key_text in written:
+                    current[key_text] = written[key_text]
+                continue
+            current[key_text] = hash(value_text)
+            if written.get(key_text) != current[key_text]:
+                upserts.append((scope, owner_id, key_text, FORMAT_VERSION, value_text))
+        deletes = [
+            (scope, owner_id, key_text)
+            for key_text in written
+            if key_text not in current
+        ]
+        return current, upserts, deletes
+
+    def _apply(self, scope: str, owner_id: int, changes: tuple):
+        current, upserts, deletes = changes
+        if not upserts and not deletes:
+            return
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO persistence_data "
+                "(scope, owner_id, key, version, value) VALUES (?, ?, ?, ?, ?)",
+                upserts,
+            )
+            connection.executemany(
+                "DELETE FROM persistence_data "
+                "WHERE scope = ? AND owner_id = ? AND key = ?",
+                deletes,
+            )
+        self._written[(scope, owner_id)] = current
+        self.rows_written += len(upserts)
+        self.rows_deleted += len(deletes)
+
+    def _write(self, scope: str, owner_id: int, data: dict):
+        """Write the keys of ``data`` that changed and delete the ones removed."""
+        self._apply(scope, owner_id, self._changes(scope, owner_id, data))
+
+    async def _save(self, scope: str, owner_id: int, data: dict):
+        changes = self._changes(scope, owner_id, data)
+        await self._run(self._apply, scope, owner_id, changes)
+
+    def _drop(self, scope: str, owner_id: int):
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM persistence_data WHERE scope = ? AND owner_id = ?",
+                (scope, owner_id),
+            )
+        self._written.pop((scope, owner_id), None)
+        self._loaded.discard((scope, owner_id))
+
+    async def _refresh(self, scope: str, owner_id: int, data: dict):
+        # Keys set in memory before the first load win over stored ones.
+        if (scope, owner_id) in self._loaded:
+            return
+        stored = await self._run(self._read, scope, owner_id)
+        for key, value in stored.items():
+            data.setdefault(key, value)
+
+    def _migrate_pickle(self):
+        connection = self._connection
+        migrated = connection.execute(
+            "SELECT value FROM persistence_meta WHERE key = 'migrated_from'"
+        ).fetchone()
+        if migrated is not None or not os.path.exists(self.legacy_pickle_path):
+            return
+
+        try:
+            with open(self.legacy_pickle_path, "rb") as file:
+                legacy = LegacyUnpickler(file).load()
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.error(f"Failed to read {self.legacy_pickle_path} for migration: {e}")
+            return
+
+        self._write(BOT_SCOPE, 0, legacy.get("bot_data") or {})
+        for chat_id, chat_data in (legacy.get("chat_data") or {}).items():
+            for key in LEGACY_CHAT_KEYS:
+                chat_data.pop(key, None)
+            self._write(CHAT_SCOPE, chat_id, chat_data)
+        for user_id, user_data in (legacy.get("user_data") or {}).items():
+            self._write(USER_SCOPE, user_id, user_data)
+        self._write(
+            CONVERSATION_SCOPE,
+            0,
+            {
+                (name, key): state
+                for name, states in (legacy.get("conversations") or {}).items()
+                for key, state in states.items()
+            },
+        )
+        with connection:
+            connection.execute(
+                "INSERT INTO persistence_meta (key, value) VALUES ('migrated_from', ?)",
+                (self.legacy_pickle_path,),
+            )
+        # Rows were written straight from the pickle; the real state is read lazily.
+        self._written.clear()
+        logger.info(f"Migrated persistence data from {self.legacy_pickle_path}")
+
+    async def get_bot_data(self) -> dict:
+        return await self._run(self._read, BOT_SCOPE, 0)
+
+    async def get_chat_data(self) -> dict:
+        # Only chats read outside of updates are loaded up front; the rest are
+        # loaded by refresh_chat_data when an update or job first needs them.
+        return {
+            chat_id: await self._run(self._read, CHAT_SCOPE, chat_id)
+            for chat_id in self.preload_chat_ids
+        }
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        conversations = {}
+        stored = await self._run(self._read, CONVERSATION_SCOPE, 0)
+        for (conversation, key), state in stored.items():
+            if conversation == name:
+                conversations[key] = state
+        return conversations
+
+    def _write_conversation(self, key_text: str, value_text: "str | None"):
+        if (CONVERSATION_SCOPE, 0) not in self._loaded:
+            self._read(CONVERSATION_SCOPE, 0)
+        written = self._written[(CONVERSATION_SCOPE, 0)]
+        with self._connect() as connection:
+            if value_text is None:
+                connection.execute(
+                    "DELETE FROM persistence_data "
+                    "WHERE scope = ? AND owner_id = 0 AND key = ?",
+                    (CONVERSATION_SCOPE, key_text),
+                )
+                written.pop(key_text, None)
+            else:
+                connection.execute(
+                    "INSERT OR REPLACE INTO persistence_data "
+                    "(scope, owner_id, key, version, value) VALUES (?, 0, ?, ?, ?)",
+                    (CONVERSATION_SCOPE, key_text, FORMAT_VERSION, value_text),
+                )
+                written[key_text] = hash(value_text)
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        value_text = None if new_state is None else dump(new_state)
+        await self._run(self._write_conversation, dump((name, key)), value_text)
+
+    async def update_bot_data(self, data: dict) -> None:
+        await self._save(BOT_SCOPE, 0, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._refresh(CHAT_SCOPE, chat_id, data)
+        await self._save(CHAT_SCOPE, chat_id, data)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._refresh(USER_SCOPE, user_id, data)
+        await self._save(USER_SCOPE, user_id, data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._run(self._drop, CHAT_SCOPE, chat_id)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._run(self._drop, USER_SCOPE, user_id)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh(CHAT_SCOPE, chat_id, chat_data)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh(USER_SCOPE, user_id, user_data)
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def flush(self) -> None:
+        await self._run(self._close)
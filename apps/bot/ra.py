@@ -1,5 +1,10 @@
-import requests, json, re, datetime
+import asyncio, copy, json, os, re, datetime
 
+import httpx
+
+import http_client
+
+from fetch_cache import provider_cache
 from models import Event
 from settings import RAConfiguration
 from utils import logger
@@ -8,36 +13,205 @@ URL = "https://ra.co/graphql"
 HEADERS = {
     "Content-Type": "application/json",
     "Referrer": "https://ra.co/events/uk/london",
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:106.0) Gecko/20100101 Firefox/106.0",
+    "User-Agent": http_client.BROWSER_USER_AGENT,
 }
+# How long the loader waits to collect IDs into one request, and the most
+# events asked for in a single aliased query.
+BATCH_WINDOW_SECONDS = 0.01
+MAX_BATCH_SIZE = 20
+EVENT_FIELD_PATTERN = re.compile(r"\bevent\s*\(\s*id\s*:\s*\$id\s*\)\s*\{")
 
 
-def get_ra_event(id: str):
-    try:
-        with open(RAConfiguration.query_template_path, "r") as file:
-            payload = json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        logger.error(f"Error loading query template: {e}")
-        return None
+def get_selection_set(query: str) -> str:
+    """Return the ``{ ... }`` block selected from ``event(id: $id)`` in a query."""
+    match = EVENT_FIELD_PATTERN.search(query)
+    if match is None:
+        raise ValueError("query does not select event(id: $id)")
+    depth = 0
+    for position in range(match.end() - 1, len(query)):
+        if query[position] == "{":
+            depth += 1
+        elif query[position] == "}":
+            depth -= 1
+            if depth == 0:
+                return query[match.end() - 1 : position + 1]
+    raise ValueError("unbalanced braces in event selection")
+
+
+class QueryTemplate:
+    """The RA GraphQL query template, validated once and reloaded on change.
+
+    The file is only re-read when its mtime changes. A template that fails to
+    load or validate is logged and the last good one is kept.
+    """
+
+    def __init__(self, path: "str | None" = None):
+        self.path = RAConfiguration.query_template_path if path is None else path
+        self.payload: "dict | None" = None
+        self.selection: "str | None" = None
+        self._mtime: "int | None" = None
+
+    def load(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Error loading query template: {e}")
+            return self.payload is not None
+        if mtime == self._mtime:
+            return True
 
-    payload["variables"]["id"] = id
+        try:
+            with open(self.path, "r") as file:
+                payload = json.load(file)
+            if not isinstance(payload.get("query"), str):
+                raise ValueError("missing 'query'")
+            if not isinstance(payload.get("variables"), dict):
+                raise ValueError("missing 'variables'")
+            selection = get_selection_set(payload["query"])
+        except (OSError, ValueError, AttributeError) as e:
+            # json.JSONDecodeError is a ValueError
+            logger.error(f"Error loading query template: {e}")
+            return self.payload is not None
 
+        self.payload = payload
+        self.selection = selection
+        self._mtime = mtime
+        logger.info(f"Loaded RA query template from {self.path}")
+        return True
+
+    def single(self, event_id: str) -> dict:
+        payload = copy.deepcopy(self.payload)
+        payload["variables"]["id"] = event_id
+        return payload
+
+    def batch(self, event_ids: "list[str]") -> "tuple[dict, dict[str, str]]":
+        """Build one aliased query for several events.
+
+        Returns the payload and a map of response alias to event ID.
+        """
+        aliases = {f"e{index}": event_id for index, event_id in enumerate(event_ids)}
+        variables = ", ".join(f"$id{index}: ID!" for index in range(len(event_ids)))
+        fields = " ".join(
+            f"e{index}: event(id: $id{index}) {self.selection}"
+            for index in range(len(event_ids))
+        )
+        payload = {
+            "operationName": "GET_EVENTS",
+            "variables": {
+                f"id{index}": event_id for index, event_id in enumerate(event_ids)
+            },
+            "query": f"query GET_EVENTS({variables}) {{ {fields} }}",
+        }
+        return payload, aliases
+
+
+query_template = QueryTemplate()
+
+
+async def post_query(payload: dict) -> "dict | None":
     try:
-        response = requests.post(URL, headers=HEADERS, json=payload, timeout=30)
+        response = await http_client.post(URL, headers=HEADERS, json=payload)
         response.raise_for_status()
         data = response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error fetching RA event: {e}")
         return None
     except ValueError as e:
         logger.error(f"Error parsing response JSON: {e}")
         return None
 
-    if "data" not in data:
+    if not isinstance(data, dict) or not isinstance(data.get("data"), dict):
         logger.error(f"Error: Missing 'data' in response: {data}")
         return None
+    if data.get("errors"):
+        logger.warning(f"RA returned errors: {data['errors']}")
+    return data["data"]
+
+
+async def get_ra_event(id: str):
+    if not query_template.load():
+        return None
+
+    data = await post_query(query_template.single(id))
+    if data is None:
+        return None
+    return data.get("event")
+
+
+async def get_ra_events(ids: "list[str]") -> "dict[str, dict | None]":
+    """Fetch several RA events in one aliased GraphQL request.
+
+    Events RA could not resolve, or all of them when the request fails, map
+    to None.
+    """
+    results = {event_id: None for event_id in ids}
+    if len(results) == 1:
+        results[ids[0]] = await get_ra_event(ids[0])
+        return results
+    if not results or not query_template.load():
+        return results
+
+    payload, aliases = query_template.batch(list(results))
+    data = await post_query(payload)
+    if data is None:
+        return results
+    for alias, event_id in aliases.items():
+        results[event_id] = data.get(alias)
+    return results
+
+
+class RaEventLoader:
+    """Coalesces RA event lookups made close together into batched requests.
+
+    Every ID requested within ``BATCH_WINDOW_SECONDS`` of the first one is
+    fetched by the same aliased query, so a message with several ra.co links
+    costs one round trip.
+    """
 
-    return data["data"].get("event")
+    def __init__(self, window_seconds: float = BATCH_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.batches = 0
+        self._pending: dict[str, list[asyncio.Future]] = {}
+        self._handle: "asyncio.TimerHandle | None" = None
+        # Batches being fetched; the loop only keeps weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, event_id: str) -> "dict | None":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(event_id, []).append(future)
+        if self._handle is None:
+            self._handle = loop.call_later(self.window_seconds, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        pending = self._pending
+        self._pending = {}
+        self._handle = None
+        event_ids = list(pending)
+        for start in range(0, len(event_ids), MAX_BATCH_SIZE):
+            batch = {
+                event_id: pending[event_id]
+                for event_id in event_ids[start : start + MAX_BATCH_SIZE]
+            }
+            task = asyncio.create_task(self._resolve(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, batch: "dict[str, list[asyncio.Future]]"):
+        self.batches += 1
+        try:
+            results = await get_ra_events(list(batch))
+        except Exception as e:
+            logger.error(f"Error fetching RA events: {e}")
+            results = {}
+        for event_id, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(event_id))
+
+
+ra_event_loader = RaEventLoader()
 
 
 async def process_ra_event(url: str) -> Event:
@@ -47,7 +221,20 @@ async def process_ra_event(url: str) -> Event:
         return
 
     event_id = match.group(1)
-    event_data = get_ra_event(event_id)
+    event = await provider_cache.get_or_fetch(
+        ("ra", event_id), lambda: fetch_ra_event(url, event_id)
+    )
+    if event is None:
+        return None
+
+    # The cached event is shared; hand out a copy carrying the caller's link.
+    event = copy.copy(event)
+    event.url = url
+    return event
+
+
+async def fetch_ra_event(url: str, event_id: str) -> Event:
+    event_data = await ra_event_loader.load(event_id)
     if event_data is None:
         return
 
@@ -65,16 +252,11 @@ async def process_ra_event(url: str) -> Event:
             title=event_data.get("title", ""),
             url=url,
             description=event_data.get("content", ""),
-            start_time=start_time,
-            end_time=end_time,
+            start_time=datetime.datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%f"),
+            end_time=datetime.datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S.%f"),
             location=location,
+            source_id=event_id,
         )
-        event.start_time = datetime.datetime.strptime(
-            event.start_time, "%Y-%m-%dT%H:%M:%S.%f"
-        ).strftime("%Y-%m-%dT%H:%M:%S")
-        event.end_time = datetime.datetime.strptime(
-            event.end_time, "%Y-%m-%dT%H:%M:%S.%f"
-        ).strftime("%Y-%m-%dT%H:%M:%S")
     except (ValueError, KeyError) as e:
         logger.error(f"Error processing RA event data: {e}")
         return None
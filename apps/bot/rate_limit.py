@@ -0,0 +1,143 @@
+import time
+from collections import OrderedDict
+
+from settings import RateLimitConfiguration
+from shared_state import SharedStateStore, shared_state
+from sharding import is_sharded
+from utils import logger
+
+USER_SCOPE = "user"
+CHAT_SCOPE = "chat"
+
+
+class RateLimitPolicy:
+    """Allow ``capacity`` requests per ``period_seconds`` for each user or chat."""
+
+    __slots__ = ("scope", "capacity", "period_seconds")
+
+    def __init__(self, scope: str, capacity: int, period_seconds: float):
+        if scope not in (USER_SCOPE, CHAT_SCOPE):
+            raise ValueError(f"unknown rate limit scope {scope!r}")
+        if capacity < 1 or period_seconds <= 0:
+            raise ValueError("rate limit capacity and period must be positive")
+        self.scope = scope
+        self.capacity = capacity
+        self.period_seconds = period_seconds
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.period_seconds
+
+    def __repr__(self):
+        return f"{self.scope}:{self.capacity}/{self.period_seconds:g}"
+
+
+def parse_policies(spec: str) -> "dict[str, RateLimitPolicy]":
+    """Parse ``command=scope:capacity/seconds`` entries separated by commas.
+
+    For example ``createevent=user:3/60,rave=chat:2/60``.
+    """
+    policies = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            command, rule = entry.split("=", 1)
+            scope, rate = rule.split(":", 1)
+            capacity, period = rate.split("/", 1)
+            policies[command.strip().lstrip("/")] = RateLimitPolicy(
+                scope.strip(), int(capacity), float(period)
+            )
+        except ValueError as e:
+            logger.error(f"Ignoring invalid rate limit policy {entry!r}: {e}")
+    return policies
+
+
+class RateLimiter:
+    """Token-bucket rate limiting for bot commands.
+
+    Each (command, user or chat) key holds one bucket of two numbers, refilled
+    continuously at the policy's rate. Buckets are kept in least recently used
+    order; a bucket untouched for long enough to have refilled completely is
+    indistinguishable from a new one and is evicted. Handlers run on the event
+    loop, so no lock is needed. ``check`` is a coroutine because the shared
+    buckets are read on the store's worker thread.
+
+    With a ``store`` the buckets live in the shared state instead, so every
+    shard of a sharded deployment draws from the same buckets.
+    """
+
+    def __init__(
+        self,
+        policies: "dict[str, RateLimitPolicy] | None" = None,
+        store: "SharedStateStore | None" = None,
+    ):
+        self.policies = (
+            parse_policies(RateLimitConfiguration.policies)
+            if policies is None
+            else policies
+        )
+        self.store = store
+        self._buckets: OrderedDict[tuple, list] = OrderedDict()
+        self.allowed: dict[str, int] = {}
+        self.limited: dict[str, int] = {}
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def check(
+        self,
+        command: str,
+        user_id: "int | None" = None,
+        chat_id: "int | None" = None,
+    ) -> bool:
+        """Take a token for ``command``. Returns False when the caller is limited."""
+        policy = self.policies.get(command)
+        if policy is None:
+            return True
+        subject = user_id if policy.scope == USER_SCOPE else chat_id
+        if subject is None:
+            return True
+
+        if self.store is not None:
+            allowed = await self.store.take_token(
+                f"rate:{command}:{subject}", policy.capacity, policy.refill_rate
+            )
+        else:
+            allowed = self._take_token(policy, (command, subject))
+
+        counters = self.allowed if allowed else self.limited
+        counters[command] = counters.get(command, 0) + 1
+        return allowed
+
+    def _take_token(self, policy: RateLimitPolicy, key: tuple) -> bool:
+        now = time.monotonic()
+        self._evict_idle(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(policy.capacity), now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(
+                policy.capacity, bucket[0] + (now - bucket[1]) * policy.refill_rate
+            )
+            bucket[1] = now
+
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def _evict_idle(self, now: float):
+        while self._buckets:
+            (command, _), bucket = next(iter(self._buckets.items()))
+            policy = self.policies.get(command)
+            if policy is not None and now - bucket[1] < policy.period_seconds:
+                break
+            self._buckets.popitem(last=False)
+            self.evicted += 1
+
+
+rate_limiter = RateLimiter(store=shared_state if is_sharded() else None)
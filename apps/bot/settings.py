@@ -42,6 +42,8 @@ class CalendarConfiguration:
     api_url = f"https://api.teamup.com/{calendar_key}"
     reader_url = f"https://teamup.com/{calendar_reader_key}"
     timezone = config_env.get("CALENDAR_TIMEZONE", "Europe/London")
+    # Kept wider than the weekly /rave window so duplicate checks can be answered locally
+    sync_days = int(config_env.get("CALENDAR_SYNC_DAYS", "90"))
 
 
 class LoggingConfiguration:
@@ -53,4 +55,122 @@ class AnnouncementConfiguration:
     chat_id = int(chat_id_value) if chat_id_value else None
     interval_seconds = int(config_env.get("ANNOUNCEMENT_INTERVAL_SECONDS", "3600"))
     first_run_seconds = int(config_env.get("ANNOUNCEMENT_FIRST_RUN_SECONDS", "60"))
+    # How often an unchanged announcement is re-checked (edit + re-pin) anyway
+    verify_interval_seconds = int(
+        config_env.get("ANNOUNCEMENT_VERIFY_INTERVAL_SECONDS", "21600")
+    )
     del chat_id_value
+
+
+class ConcurrencyConfiguration:
+    # Set CONCURRENT_UPDATES=1 to process updates strictly one at a time
+    max_concurrent_updates = int(config_env.get("CONCURRENT_UPDATES", "8"))
+    max_pending_updates = int(config_env.get("MAX_PENDING_UPDATES", "256"))
+
+
+class CacheConfiguration:
+    stale_while_revalidate = (
+        config_env.get("CACHE_STALE_WHILE_REVALIDATE", "true").lower() == "true"
+    )
+    refresh_after_seconds = int(config_env.get("CACHE_REFRESH_AFTER_SECONDS", "900"))
+    max_age_seconds = int(config_env.get("CACHE_MAX_AGE_SECONDS", "86400"))
+    retry_after_seconds = int(config_env.get("CACHE_RETRY_AFTER_SECONDS", "60"))
+
+
+class ProviderCacheConfiguration:
+    ttl_seconds = int(config_env.get("PROVIDER_CACHE_TTL_SECONDS", "900"))
+    max_entries = int(config_env.get("PROVIDER_CACHE_MAX_ENTRIES", "256"))
+
+
+class DiceConfiguration:
+    id_store_path = config_env.get("DICE_ID_STORE_PATH", "dice_ids.sqlite3")
+    id_store_max_entries = int(config_env.get("DICE_ID_STORE_MAX_ENTRIES", "5000"))
+
+
+class EventImportConfiguration:
+    # Links imported at the same time when /createevent is given several
+    max_concurrency = int(config_env.get("CREATEEVENT_MAX_CONCURRENCY", "3"))
+    max_urls = int(config_env.get("CREATEEVENT_MAX_URLS", "20"))
+
+
+class PersistenceConfiguration:
+    path = config_env.get("PERSISTENCE_PATH", "bot_data.sqlite3")
+    # PicklePersistence file migrated into the database on first start
+    legacy_pickle_path = config_env.get("PERSISTENCE_PICKLE_PATH", "bot_data")
+
+
+class OnboardingConfiguration:
+    # Members are kicked two hours after joining; records live a little longer
+    ttl_seconds = int(config_env.get("ONBOARDING_TTL_SECONDS", "10800"))
+    max_members = int(config_env.get("ONBOARDING_MAX_MEMBERS", "500"))
+
+
+class RateLimitConfiguration:
+    # command=scope:requests/seconds, scope is "user" or "chat"
+    policies = config_env.get(
+        "RATE_LIMITS", "createevent=user:3/60,rave=chat:3/60,calendar=chat:3/60"
+    )
+
+
+class JoinAggregationConfiguration:
+    # Joins within the window are greeted with one welcome message
+    window_seconds = float(config_env.get("WELCOME_BATCH_SECONDS", "5"))
+    # Above this many joins a minute, batches stay open for the flood window
+    flood_threshold = int(config_env.get("WELCOME_FLOOD_JOINS_PER_MINUTE", "20"))
+    flood_window_seconds = float(config_env.get("WELCOME_FLOOD_BATCH_SECONDS", "60"))
+
+
+class OutboundConfiguration:
+    # Telegram's documented limits for bots
+    global_per_second = float(config_env.get("OUTBOUND_GLOBAL_PER_SECOND", "30"))
+    group_per_minute = float(config_env.get("OUTBOUND_GROUP_PER_MINUTE", "20"))
+    private_per_second = float(config_env.get("OUTBOUND_PRIVATE_PER_SECOND", "1"))
+    # Flood waits retried before the error reaches the handler
+    max_retries = int(config_env.get("OUTBOUND_MAX_RETRIES", "3"))
+
+
+class WebhookConfiguration:
+    # "polling" (default) or "webhook"
+    mode = config_env.get("BOT_MODE", "polling").lower()
+    listen = config_env.get("WEBHOOK_LISTEN", "0.0.0.0")
+    port = int(config_env.get("WEBHOOK_PORT", "8080"))
+    path = config_env.get("WEBHOOK_PATH", "/telegram")
+    # Public HTTPS URL registered with Telegram; leave unset to run locally
+    url = config_env.get("WEBHOOK_URL", "")
+    secret_token = config_env.get("WEBHOOK_SECRET_TOKEN", "")
+
+
+class ShardConfiguration:
+    # Worker processes sharing the bot; each owns the chats hashed to its index
+    count = int(config_env.get("SHARD_COUNT", "1"))
+    index = int(config_env.get("SHARD_INDEX", "0"))
+    # Rate-limit buckets, calendar snapshot and admin settings shared by shards
+    state_path = config_env.get("SHARED_STATE_PATH", "shared_state.sqlite3")
+    # Webhook URLs of the workers, in shard order (BOT_MODE=router only)
+    worker_urls = [
+        url.strip()
+        for url in config_env.get("SHARD_WORKER_URLS", "").split(",")
+        if url.strip()
+    ]
+
+
+class MetricsConfiguration:
+    # Prometheus endpoint (GET /metrics); 0 disables it
+    listen = config_env.get("METRICS_LISTEN", "0.0.0.0")
+    port = int(config_env.get("METRICS_PORT", "0"))
+
+
+class TracingConfiguration:
+    # Finished update traces kept for /traces
+    history = int(config_env.get("TRACE_HISTORY", "200"))
+    # Spans recorded per trace; later ones are counted as dropped
+    max_spans = int(config_env.get("TRACE_MAX_SPANS", "200"))
+
+
+class WatchdogConfiguration:
+    # Heartbeat period; lag is how late each heartbeat wakes up
+    interval_seconds = float(config_env.get("LOOP_LAG_INTERVAL_SECONDS", "0.1"))
+    # Lag above this is reported with the stack of the blocking code
+    threshold_seconds = float(config_env.get("LOOP_LAG_THRESHOLD_SECONDS", "0.5"))
+    # Heartbeats kept for the lag percentiles (10 minutes at the default period)
+    samples = int(config_env.get("LOOP_LAG_SAMPLES", "6000"))
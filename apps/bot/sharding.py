@@ -0,0 +1,210 @@
+import asyncio
+import bisect
+import hashlib
+import signal
+import sqlite3
+
+import httpx
+from telegram import Bot, Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+import http_client
+from settings import BotConfiguration, ShardConfiguration, WebhookConfiguration
+from shared_state import shared_state
+from utils import logger
+from webhook import SECRET_TOKEN_HEADER, WebhookServer
+
+# Points per shard on the ring; more points spread chats more evenly
+RING_REPLICAS = 64
+
+# Update fields whose payload carries the chat the update belongs to
+CHAT_UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+
+def hash_key(key) -> int:
+    return int.from_bytes(hashlib.sha1(str(key).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash of chat IDs onto shards.
+
+    Adding a shard only moves the chats that land on its points, so most
+    chats keep their shard, and their chat data and timers, when the
+    deployment grows.
+    """
+
+    def __init__(self, shard_count: int, replicas: int = RING_REPLICAS):
+        if shard_count < 1:
+            raise ValueError("shard count must be positive")
+        self.shard_count = shard_count
+        points = sorted(
+            (hash_key(f"shard-{shard}-{replica}"), shard)
+            for shard in range(shard_count)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def get_shard(self, key) -> int:
+        if self.shard_count == 1:
+            return 0
+        index = bisect.bisect(self._hashes, hash_key(key)) % len(self._hashes)
+        return self._shards[index]
+
+
+shard_ring = HashRing(ShardConfiguration.count)
+
+
+def is_sharded() -> bool:
+    return ShardConfiguration.count > 1
+
+
+def owns_chat(chat_id) -> bool:
+    """Whether this process is the shard responsible for ``chat_id``."""
+    return not is_sharded() or shard_ring.get_shard(chat_id) == ShardConfiguration.index
+
+
+def shard_key(key: str) -> str:
+    """Name for per-shard state kept in the shared persistence database."""
+    return f"{key}_shard{ShardConfiguration.index}" if is_sharded() else key
+
+
+def get_update_chat_id(data: dict):
+    """Chat (or, failing that, user) ID of a raw update, used to route it.
+
+    Private chats share their ID with the user, so updates without a chat go
+    to the same shard as the user's private chat. Returns None when the
+    update names neither.
+    """
+    for field in CHAT_UPDATE_FIELDS:
+        payload = data.get(field)
+        if isinstance(payload, dict) and "chat" in payload:
+            return payload["chat"]["id"]
+    callback_query = data.get("callback_query")
+    if isinstance(callback_query, dict) and "message" in callback_query:
+        return callback_query["message"]["chat"]["id"]
+    for payload in data.values():
+        if isinstance(payload, dict) and "from" in payload:
+            return payload["from"]["id"]
+    return None
+
+
+async def drop_foreign_update(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """Stop handling updates for chats another shard owns.
+
+    The router only forwards owned chats, so this guards against a
+    misconfigured router or a changed shard count.
+    """
+    if not is_sharded() or not isinstance(update, Update):
+        return
+    if update.effective_chat is not None:
+        key = update.effective_chat.id
+    elif update.effective_user is not None:
+        key = update.effective_user.id
+    else:
+        return
+    if not owns_chat(key):
+        logger.warning(f"Dropping update {update.update_id} for chat {key}")
+        raise ApplicationHandlerStop
+
+
+async def get_admin_value(bot_data: dict, key: str, default=None):
+    """Read admin/config state, kept in the shared store when sharded."""
+    if is_sharded():
+        return await shared_state.get(f"admin:{key}", default)
+    return bot_data.get(key, default)
+
+
+async def update_admin_value(bot_data: dict, key: str, change, default=None):
+    """Replace admin/config state with ``change(value)``; atomic across shards."""
+    if is_sharded():
+        try:
+            return await shared_state.update(f"admin:{key}", change, default=default)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to update shared {key!r}: {e}")
+            return None
+    value = bot_data[key] = change(bot_data.get(key, default))
+    return value
+
+
+class ShardRouter(WebhookServer):
+    """Webhook intake that forwards each update to the shard owning its chat.
+
+    Workers run in webhook mode with the same secret token; the router is the
+    only process registered with Telegram. A shard that cannot be reached
+    gets a 502, so Telegram redelivers the update later.
+    """
+
+    def __init__(self, worker_urls: "list[str]", secret_token: str, **kwargs):
+        super().__init__(None, secret_token, **kwargs)
+        if not worker_urls:
+            raise ValueError("SHARD_WORKER_URLS must list one URL per shard")
+        self.worker_urls = worker_urls
+        self.ring = HashRing(len(worker_urls))
+        self.forwarded = [0] * len(worker_urls)
+
+    async def dispatch(self, data) -> int:
+        if not isinstance(data, dict):
+            return 400
+        chat_id = get_update_chat_id(data)
+        shard = 0 if chat_id is None else self.ring.get_shard(chat_id)
+        try:
+            response = await http_client.post(
+                self.worker_urls[shard],
+                json=data,
+                headers={SECRET_TOKEN_HEADER: self.secret_token},
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to forward update to shard {shard}: {e}")
+            return 502
+        if response.status_code != 200:
+            logger.error(
+                f"Shard {shard} rejected update with HTTP {response.status_code}"
+            )
+            return 502
+        self.forwarded[shard] += 1
+        return 200
+
+
+async def serve_router(stop_signals=None):
+    """Run the shard router and register it as the bot's webhook."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in stop_signals or (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    router = ShardRouter(
+        ShardConfiguration.worker_urls,
+        WebhookConfiguration.secret_token,
+        host=WebhookConfiguration.listen,
+        port=WebhookConfiguration.port,
+        path=WebhookConfiguration.path,
+    )
+    await router.start()
+    try:
+        if WebhookConfiguration.url:
+            async with Bot(BotConfiguration.token) as bot:
+                await bot.set_webhook(
+                    WebhookConfiguration.url,
+                    allowed_updates=Update.ALL_TYPES,
+                    secret_token=WebhookConfiguration.secret_token,
+                    drop_pending_updates=False,
+                )
+            logger.info(f"Webhook registered at {WebhookConfiguration.url}")
+        logger.info(f"Routing updates to {len(router.worker_urls)} shards")
+        await stop.wait()
+    finally:
+        await router.stop()
+        await http_client.aclose()
+
+
+def run_router():
+    asyncio.run(serve_router())
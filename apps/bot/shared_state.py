@@ -0,0 +1,159 @@
+import asyncio
+import functools
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from persistence import dump, load
+from settings import ShardConfiguration
+from utils import logger
+
+
+class SharedStateStore:
+    """Key-value state shared by every shard of a deployment, in one SQLite file.
+
+    Values are stored as tagged JSON (see ``persistence.dump``) with an
+    optional expiry. Read-modify-write operations run inside ``BEGIN
+    IMMEDIATE`` transactions, so concurrent shards never lose each other's
+    updates. Expired rows are ignored on read and purged now and then.
+
+    Another shard can hold the write lock for a while, so the database is
+    only used from one worker thread and the public methods are awaited.
+    """
+
+    # Writes between purges of expired rows
+    PURGE_INTERVAL = 500
+
+    def __init__(self, path: "str | None" = None):
+        self.path = ShardConfiguration.state_path if path is None else path
+        self._connection: "sqlite3.Connection | None" = None
+        self._writes = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="shared-state"
+        )
+
+    async def _run(self, function, *args):
+        """Run ``function`` on the database thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args)
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS shared_state ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def close(self):
+        await self._run(self._close)
+
+    def _read(self, connection: sqlite3.Connection, key: str, now: float):
+        row = connection.execute(
+            "SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return load(row[0])
+
+    def _write(
+        self,
+        connection: sqlite3.Connection,
+        key: str,
+        value,
+        now: float,
+        ttl_seconds: "float | None",
+    ):
+        connection.execute(
+            "INSERT OR REPLACE INTO shared_state (key, value, expires_at) "
+            "VALUES (?, ?, ?)",
+            (key, dump(value), None if ttl_seconds is None else now + ttl_seconds),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL == 0:
+            connection.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+
+    def _get(self, key: str, default=None):
+        try:
+            value = self._read(self._connect(), key, time.time())
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read shared state {key!r}: {e}")
+            return default
+        return default if value is None else value
+
+    def _put(self, key: str, value, ttl_seconds: "float | None" = None):
+        try:
+            self._write(self._connect(), key, value, time.time(), ttl_seconds)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write shared state {key!r}: {e}")
+
+    def _update(self, key: str, change, default=None, ttl_seconds=None):
+        connection = self._connect()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            value = self._read(connection, key, now)
+            value = change(default if value is None else value)
+            self._write(connection, key, value, now, ttl_seconds)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return value
+
+    def _take_token(self, key: str, capacity: float, rate: float) -> bool:
+        allowed = False
+
+        def take(bucket):
+            nonlocal allowed
+            tokens, updated = bucket
+            now = time.time()
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            return [tokens - 1 if allowed else tokens, now]
+
+        try:
+            self._update(
+                key,
+                take,
+                default=[float(capacity), time.time()],
+                ttl_seconds=capacity / rate,
+            )
+        except sqlite3.Error as e:
+            # Fail open: a broken store must not silence the bot
+            logger.error(f"Failed to take shared token {key!r}: {e}")
+            return True
+        return allowed
+
+    async def get(self, key: str, default=None):
+        return await self._run(self._get, key, default)
+
+    async def put(self, key: str, value, ttl_seconds: "float | None" = None):
+        await self._run(self._put, key, value, ttl_seconds)
+
+    async def update(self, key: str, change, default=None, ttl_seconds=None):
+        """Atomically replace the value of ``key`` with ``change(value)``.
+
+        ``change`` runs on the database thread while the row is locked.
+        """
+        return await self._run(self._update, key, change, default, ttl_seconds)
+
+    async def take_token(self, key: str, capacity: float, rate: float) -> bool:
+        """Take one token from a shared token bucket. Returns False when empty.
+
+        The bucket's row expires once it would have refilled completely.
+        """
+        return await self._run(self._take_token, key, capacity, rate)
+
+
+shared_state = SharedStateStore()
@@ -0,0 +1,138 @@
+import datetime
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from calendar_sync import CalendarSync
+from models import Event
+
+
+def make_event(event_id, day_offset=0, title=None):
+    start = datetime.datetime.combine(
+        datetime.date.today() + datetime.timedelta(days=day_offset),
+        datetime.time(20, 0),
+    )
+    return Event(
+        event_id=event_id,
+        title=title or f"Event {event_id}",
+        start_time=start.strftime("%Y-%m-%dT%H:%M:%S"),
+        end_time=(start + datetime.timedelta(hours=3)).strftime("%Y-%m-%dT%H:%M:%S"),
+        location="Venue",
+        url=f"https://example.com/{event_id}",
+        description="",
+    )
+
+
+def make_delta(changed=(), deleted=(), recurring=False, timestamp=200):
+    return {
+        "changed": list(changed),
+        "deleted": list(deleted),
+        "recurring": recurring,
+        "timestamp": timestamp,
+    }
+
+
+class TestCalendarSync:
+    @pytest.mark.asyncio
+    @patch("calendar_sync.get_modified_events", new_callable=AsyncMock)
+    @patch("calendar_sync.get_events_window", new_callable=AsyncMock)
+    async def test_first_sync_is_full(self, mock_window, mock_modified):
+        """Test that the first sync downloads the whole window"""
+        mock_window.return_value = ([make_event("2", 1), make_event("1", 0)], 100)
+        sync = CalendarSync(days=7)
+
+        events = await sync.sync()
+
+        assert [event.event_id for event in events] == ["1", "2"]
+        assert sync.cursor == 100
+        assert sync.full_syncs == 1
+        mock_modified.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("calendar_sync.get_modified_events", new_callable=AsyncMock)
+    @patch("calendar_sync.get_events_window", new_callable=AsyncMock)
+    async def test_delta_sync_merges_changes(self, mock_window, mock_modified):
+        """Test that inserts, updates and deletions are merged"""
+        mock_window.return_value = ([make_event("1"), make_event("2", 1)], 100)
+        mock_modified.return_value = make_delta(
+            changed=[make_event("1", title="Renamed"), make_event("3", 2)],
+            deleted=["2"],
+        )
+        sync = CalendarSync(days=7)
+        await sync.sync()
+
+        events = await sync.sync()
+
+        mock_modified.assert_called_once_with(100)
+        assert [(event.event_id, event.title) for event in events] == [
+            ("1", "Renamed"),
+            ("3", "Event 3"),
+        ]
+        assert sync.cursor == 200
+        assert sync.delta_syncs == 1
+        assert mock_window.call_count == 1
+
+    @pytest.mark.asyncio
+    @patch("calendar_sync.get_modified_events", new_callable=AsyncMock)
+    @patch("calendar_sync.get_events_window", new_callable=AsyncMock)
+    async def test_delta_sync_drops_events_moved_out_of_window(
+        self, mock_window, mock_modified
+    ):
+        mock_window.return_value = ([make_event("1")], 100)
+        mock_modified.return_value = make_delta(
+            changed=[make_event("1", 30), make_event("9", 40)]
+        )
+        sync = CalendarSync(days=7)
+        await sync.sync()
+
+        events = await sync.sync()
+
+        assert events == []
+
+    @pytest.mark.asyncio
+    @patch("calendar_sync.get_modified_events", new_callable=AsyncMock)
+    @patch("calendar_sync.get_events_window", new_callable=AsyncMock)
+    async def test_failed_delta_keeps_events_and_forces_full_resync(
+        self, mock_window, mock_modified
+    ):
+        """Test that a lost cursor triggers a full resync on the next run"""
+        mock_window.return_value = ([make_event("1")], 100)
+        mock_modified.return_value = None
+        sync = CalendarSync(days=7)
+        await sync.sync()
+
+        assert await sync.sync() is None
+        assert list(sync.events) == ["1"]
+        assert sync.cursor is None
+
+        await sync.sync()
+        assert mock_window.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("calendar_sync.get_modified_events", new_callable=AsyncMock)
+    @patch("calendar_sync.get_events_window", new_callable=AsyncMock)
+    async def test_window_rollover_forces_full_resync(self, mock_window, mock_modified):
+        mock_window.return_value = ([make_event("1")], 100)
+        sync = CalendarSync(days=7)
+        await sync.sync()
+        sync.window_start -= datetime.timedelta(days=1)
+
+        await sync.sync()
+
+        assert mock_window.call_count == 2
+        mock_modified.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("calendar_sync.get_modified_events", new_callable=AsyncMock)
+    @patch("calendar_sync.get_events_window", new_callable=AsyncMock)
+    async def test_recurring_change_forces_full_resync(
+        self, mock_window, mock_modified
+    ):
+        mock_window.return_value = ([make_event("1")], 100)
+        mock_modified.return_value = make_delta(recurring=True)
+        sync = CalendarSync(days=7)
+        await sync.sync()
+
+        await sync.sync()
+
+        assert mock_window.call_count == 2
+        assert sync.full_syncs == 2
@@ -0,0 +1,177 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+
+from deadline_scheduler import DEADLINES_KEY, DeadlineScheduler
+
+
+def make_application(bot_data=None):
+    application = MagicMock()
+    application.persistence = None
+    application.bot_data = {} if bot_data is None else bot_data
+    return application
+
+
+def make_scheduler(application, runs):
+    scheduler = DeadlineScheduler()
+
+    async def record(context, chat_id, user_id, data):
+        runs.append((chat_id, user_id, data))
+
+    scheduler.register("warn_idle", record)
+    scheduler.register("kick_idle", record)
+    scheduler._application = application
+    return scheduler
+
+
+class TestDeadlineScheduler:
+    @pytest.mark.asyncio
+    async def test_due_deadlines_run_in_order(self):
+        runs = []
+        scheduler = make_scheduler(make_application(), runs)
+
+        with patch("deadline_scheduler.time.time", return_value=1000.0):
+            scheduler.schedule("warn_idle", -100, 2, 20)
+            scheduler.schedule("warn_idle", -100, 1, 10)
+            scheduler.schedule("kick_idle", -100, 3, 60, data={"x": 1})
+
+        with patch("deadline_scheduler.time.time", return_value=1030.0):
+            await scheduler.run_due()
+
+        assert runs == [(-100, 1, None), (-100, 2, None)]
+        assert len(scheduler) == 1
+        assert scheduler.completed == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_deadlines_do_not_run(self):
+        runs = []
+        scheduler = make_scheduler(make_application(), runs)
+        with patch("deadline_scheduler.time.time", return_value=1000.0):
+            scheduler.schedule("warn_idle", -100, 1, 10)
+
+        assert scheduler.cancel(-100, 1, "warn_idle", "kick_idle") is True
+        assert scheduler.cancel(-100, 1, "warn_idle", "kick_idle") is False
+        with patch("deadline_scheduler.time.time", return_value=2000.0):
+            await scheduler.run_due()
+
+        assert runs == []
+
+    def test_dead_entries_are_compacted(self):
+        """Test that cancelled entries do not pile up in the heap"""
+        scheduler = make_scheduler(make_application(), [])
+        for user_id in range(100):
+            scheduler.schedule("warn_idle", -100, user_id, 60)
+
+        for user_id in range(90):
+            scheduler.cancel(-100, user_id, "warn_idle")
+
+        assert len(scheduler) == 10
+        assert len(scheduler._heap) <= 20
+
+    def test_rescheduling_replaces_pending_deadline(self):
+        scheduler = make_scheduler(make_application(), [])
+        with patch("deadline_scheduler.time.time", return_value=1000.0):
+            scheduler.schedule("warn_idle", -100, 1, 10)
+            scheduler.schedule("warn_idle", -100, 1, 50)
+
+        assert len(scheduler) == 1
+        assert scheduler.due("warn_idle", -100, 1) == 1050.0
+
+    @pytest.mark.asyncio
+    async def test_failing_callback_is_logged_and_skipped(self):
+        scheduler = make_scheduler(make_application(), [])
+
+        async def fail(context, chat_id, user_id, data):
+            raise RuntimeError("boom")
+
+        scheduler.register("warn_idle", fail)
+        with patch("deadline_scheduler.time.time", return_value=1000.0):
+            scheduler.schedule("warn_idle", -100, 1, 0)
+            await scheduler.run_due()
+
+        assert scheduler.failed == 1
+        assert len(scheduler) == 0
+
+    @pytest.mark.asyncio
+    async def test_restart_restores_and_catches_up(self):
+        """Test that persisted deadlines survive a restart and overdue ones run"""
+        bot_data = {}
+        first = make_scheduler(make_application(bot_data), [])
+        first.start(first._application)
+        with patch("deadline_scheduler.time.time", return_value=1000.0):
+            first.schedule("warn_idle", -100, 1, 10)
+            first.schedule("kick_idle", -100, 2, 10_000)
+            first.schedule("warn_idle", -100, 3, 20)
+            first.cancel(-100, 3, "warn_idle")
+        await first.stop()
+        assert len(bot_data[DEADLINES_KEY]) == 3
+
+        runs = []
+        application = make_application(bot_data)
+        second = make_scheduler(application, runs)
+        with patch("deadline_scheduler.time.time", return_value=5000.0):
+            second.start(application)
+            await second.run_due()
+        await second.stop()
+
+        assert runs == [(-100, 1, None)]
+        assert len(second) == 1
+        assert second.due("kick_idle", -100, 2) == 11_000.0
+        application.mark_data_for_update_persistence.assert_called_once_with(
+            chat_ids=-100
+        )
+
+    @pytest.mark.asyncio
+    async def test_slow_chat_does_not_hold_back_other_chats(self):
+        """Test that a chat stuck in a callback does not delay other chats"""
+        runs = []
+        release = asyncio.Event()
+        scheduler = make_scheduler(make_application(), runs)
+
+        async def slow(context, chat_id, user_id, data):
+            runs.append((chat_id, user_id, "started"))
+            await release.wait()
+            runs.append((chat_id, user_id, data))
+
+        scheduler.register("kick_idle", slow)
+        with patch("deadline_scheduler.time.time", return_value=1000.0):
+            scheduler.schedule("kick_idle", -100, 1, 0)
+            scheduler.schedule("kick_idle", -100, 2, 1)
+            scheduler.schedule("warn_idle", -200, 3, 2)
+        with patch("deadline_scheduler.time.time", return_value=1010.0):
+            scheduler.dispatch_due()
+        await asyncio.sleep(0.01)
+
+        # The raided chat runs in order; the other chat is not waiting on it
+        assert runs == [(-100, 1, "started"), (-200, 3, None)]
+        assert scheduler.cancel(-100, 2, "kick_idle") is True
+
+        release.set()
+        await scheduler.run_due()
+        assert runs[-1] == (-100, 1, None)
+        assert (-100, 2, "started") not in runs
+        assert len(scheduler) == 0
+
+    @pytest.mark.asyncio
+    async def test_stop_returns_unfinished_deadlines_to_the_heap(self):
+        """Test that deadlines interrupted by shutdown are persisted again"""
+        bot_data = {}
+        application = make_application(bot_data)
+        scheduler = make_scheduler(application, [])
+
+        async def hang(context, chat_id, user_id, data):
+            await asyncio.Event().wait()
+
+        scheduler.register("kick_idle", hang)
+        scheduler.start(application)
+        with patch("deadline_scheduler.time.time", return_value=1000.0):
+            scheduler.schedule("kick_idle", -100, 1, 0)
+            scheduler.schedule("kick_idle", -100, 2, 1)
+        with patch("deadline_scheduler.time.time", return_value=1010.0):
+            scheduler.dispatch_due()
+        await asyncio.sleep(0.01)
+
+        await scheduler.stop()
+
+        assert len(scheduler) == 2
+        assert sorted(entry[4] for entry in bot_data[DEADLINES_KEY]) == [1, 2]
@@ -1,14 +1,50 @@
 import pytest
-from unittest.mock import patch, MagicMock
-import json
+from contextlib import asynccontextmanager
+from unittest.mock import patch, MagicMock, AsyncMock
 from dice import get_dice_event_id, process_dice_event, get_event_details
+from dice_id_store import DiceIdStore
+from fetch_cache import provider_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_provider_cache():
+    provider_cache.clear()
+    yield
+    provider_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def dice_id_store(tmp_path, monkeypatch):
+    store = DiceIdStore(str(tmp_path / "dice_ids.sqlite3"), max_entries=10)
+    monkeypatch.setattr("dice.dice_id_store", store)
+    yield store
+    # Sync and async tests share the fixture, so close on the store's thread
+    store._executor.submit(store._close).result()
+
+
+def stream_response(status_code, chunks, consumed=None):
+    """Build a fake ``http_client.stream`` context yielding ``chunks``."""
+
+    async def aiter_text():
+        for chunk in chunks:
+            if consumed is not None:
+                consumed.append(chunk)
+            yield chunk
+
+    @asynccontextmanager
+    async def stream(*args, **kwargs):
+        response = MagicMock()
+        response.status_code = status_code
+        response.aiter_text = aiter_text
+        yield response
+
+    return stream
 
 
 class TestGetDiceEventId:
-    @patch("dice.urllib.request.urlopen")
-    def test_get_dice_event_id_success(self, mock_urlopen):
+    async def test_get_dice_event_id_success(self):
         """Test successful dice event ID extraction"""
-        html_content = b"""
+        html_content = """
         <html>
             <head>
                 <meta property="product:retailer_item_id" content="12345" />
@@ -16,45 +52,61 @@ class TestGetDiceEventId:
         </html>
         """
 
-        mock_response = MagicMock()
-        mock_response.status = 200
-        mock_response.read.return_value = html_content
-        mock_urlopen.return_value = mock_response
-
-        result = get_dice_event_id("https://dice.fm/event/test")
+        with patch("dice.http_client.stream", stream_response(200, [html_content])):
+            result = await get_dice_event_id("https://dice.fm/event/test")
 
         assert result == "12345"
 
-    @patch("dice.urllib.request.urlopen")
-    def test_get_dice_event_id_no_meta_tag(self, mock_urlopen):
+    async def test_get_dice_event_id_no_meta_tag(self):
         """Test dice event ID extraction when meta tag is missing"""
-        html_content = b"<html><head></head></html>"
-
-        mock_response = MagicMock()
-        mock_response.status = 200
-        mock_response.read.return_value = html_content
-        mock_urlopen.return_value = mock_response
+        html_content = "<html><head></head></html>"
 
-        result = get_dice_event_id("https://dice.fm/event/test")
+        with patch("dice.http_client.stream", stream_response(200, [html_content])):
+            result = await get_dice_event_id("https://dice.fm/event/test")
 
         assert result is None
 
-    @patch("dice.urllib.request.urlopen")
-    def test_get_dice_event_id_http_error(self, mock_urlopen):
+    async def test_get_dice_event_id_http_error(self):
         """Test dice event ID extraction with HTTP error"""
-        mock_response = MagicMock()
-        mock_response.status = 404
-        mock_response.read.return_value = b""
-        mock_urlopen.return_value = mock_response
-
-        result = get_dice_event_id("https://dice.fm/event/test")
+        with patch("dice.http_client.stream", stream_response(404, [])):
+            result = await get_dice_event_id("https://dice.fm/event/test")
 
         assert result is None
 
+    async def test_get_dice_event_id_stops_after_meta_tag(self):
+        """Test that the download stops once the meta tag has been parsed"""
+        consumed = []
+        chunks = [
+            '<html><head><meta property="product:retailer_item_id" ',
+            'content="12345"></head>',
+            "<body>" + "<script>var x = 1;</script>" * 100,
+            "</body></html>",
+        ]
+
+        with patch("dice.http_client.stream", stream_response(200, chunks, consumed)):
+            result = await get_dice_event_id("https://dice.fm/event/test")
+
+        assert result == "12345"
+        assert consumed == chunks[:2]
+
+    async def test_get_dice_event_id_falls_back_to_full_parse(self):
+        """Test that a streaming parser failure falls back to BeautifulSoup"""
+        html_content = (
+            "<html><head>"
+            '<meta property="product:retailer_item_id" content="12345">'
+            "</head></html>"
+        )
 
-class TestGetEventDetails:
-    @patch("dice.urllib.request.urlopen")
-    def test_get_event_details_success(self, mock_urlopen):
+        with (
+            patch("dice.http_client.stream", stream_response(200, [html_content])),
+            patch("dice.RetailerItemIdParser.feed", side_effect=AssertionError("bad")),
+        ):
+            result = await get_dice_event_id("https://dice.fm/event/test")
+
+        assert result == "12345"
+
+    @patch("dice.http_client.get", new_callable=AsyncMock)
+    async def test_get_event_details_success(self, mock_get):
         """Test successful event details retrieval"""
         event_data = {
             "about": {"description": "Test description"},
@@ -67,24 +119,24 @@ class TestGetEventDetails:
         }
 
         mock_response = MagicMock()
-        mock_response.status = 200
-        mock_response.read.return_value = json.dumps(event_data).encode()
-        mock_urlopen.return_value = mock_response
+        mock_response.status_code = 200
+        mock_response.json.return_value = event_data
+        mock_get.return_value = mock_response
 
-        result = get_event_details("12345")
+        result = await get_event_details("12345")
 
         assert result["name"] == "Test Event"
         assert result["description"] == "Test description"
         assert result["venue_address"] == "Test Venue Address"
 
-    @patch("dice.urllib.request.urlopen")
-    def test_get_event_details_http_error(self, mock_urlopen):
+    @patch("dice.http_client.get", new_callable=AsyncMock)
+    async def test_get_event_details_http_error(self, mock_get):
         """Test event details retrieval with HTTP error"""
         mock_response = MagicMock()
-        mock_response.status = 404
-        mock_urlopen.return_value = mock_response
+        mock_response.status_code = 404
+        mock_get.return_value = mock_response
 
-        result = get_event_details("12345")
+        result = await get_event_details("12345")
 
         assert result is None
 
@@ -96,8 +148,8 @@ class TestProcessDiceEvent:
         url = "https://dice.fm/event/test"
 
         with (
-            patch("dice.get_dice_event_id") as mock_get_id,
-            patch("dice.get_event_details") as mock_get_details,
+            patch("dice.get_dice_event_id", new_callable=AsyncMock) as mock_get_id,
+            patch("dice.get_event_details", new_callable=AsyncMock) as mock_get_details,
         ):
 
             mock_get_id.return_value = "12345"
@@ -122,7 +174,7 @@ class TestProcessDiceEvent:
         """Test dice event processing when event ID cannot be extracted"""
         url = "https://dice.fm/event/test"
 
-        with patch("dice.get_dice_event_id") as mock_get_id:
+        with patch("dice.get_dice_event_id", new_callable=AsyncMock) as mock_get_id:
             mock_get_id.return_value = None
 
             event = await process_dice_event(url)
@@ -135,8 +187,8 @@ class TestProcessDiceEvent:
         url = "https://dice.fm/event/test"
 
         with (
-            patch("dice.get_dice_event_id") as mock_get_id,
-            patch("dice.get_event_details") as mock_get_details,
+            patch("dice.get_dice_event_id", new_callable=AsyncMock) as mock_get_id,
+            patch("dice.get_event_details", new_callable=AsyncMock) as mock_get_details,
         ):
 
             mock_get_id.return_value = "12345"
@@ -145,3 +197,26 @@ class TestProcessDiceEvent:
             event = await process_dice_event(url)
 
             assert event is None
+
+    @pytest.mark.asyncio
+    async def test_process_dice_event_skips_scrape_for_known_link(self, dice_id_store):
+        """Test that a stored item ID skips the HTML scrape"""
+        await dice_id_store.put("https://dice.fm/event/test", "12345")
+
+        with (
+            patch("dice.get_dice_event_id", new_callable=AsyncMock) as mock_get_id,
+            patch("dice.get_event_details", new_callable=AsyncMock) as mock_get_details,
+        ):
+            mock_get_details.return_value = {
+                "name": "Test Event",
+                "description": "Test description",
+                "start_date": "2024-01-15T20:00:00",
+                "end_date": "2024-01-15T23:00:00",
+                "venue_address": "Test Venue",
+            }
+
+            event = await process_dice_event("https://dice.fm/event/test?pid=abc")
+
+            assert event.source_id == "12345"
+            mock_get_id.assert_not_called()
+            mock_get_details.assert_called_once_with("12345")
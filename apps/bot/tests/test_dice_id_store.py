@@ -0,0 +1,78 @@
+import sqlite3
+import pytest
+
+from dice_id_store import DiceIdStore
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "dice_ids.sqlite3")
+
+
+class TestDiceIdStore:
+    @pytest.mark.asyncio
+    async def test_put_and_get_by_canonical_url(self, store_path):
+        """Test that trivially different links resolve to the same item ID"""
+        store = DiceIdStore(store_path, max_entries=10)
+        await store.put("https://dice.fm/event/abc-rave/", "12345")
+
+        assert await store.get("https://www.dice.fm/event/abc-rave?pid=1") == "12345"
+        assert await store.get("https://dice.fm/event/other") is None
+        assert store.hits == 1
+        assert store.misses == 1
+
+    @pytest.mark.asyncio
+    async def test_entries_survive_restart(self, store_path):
+        """Test that the mapping is read back by a new store"""
+        store = DiceIdStore(store_path, max_entries=10)
+        await store.put("https://dice.fm/event/abc-rave", "12345")
+        await store.close()
+
+        reopened = DiceIdStore(store_path, max_entries=10)
+
+        assert await reopened.get("https://dice.fm/event/abc-rave") == "12345"
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_entries_are_evicted(
+        self, store_path, monkeypatch
+    ):
+        """Test that the store stays within its bound"""
+        clock = iter(range(100))
+        monkeypatch.setattr("dice_id_store.time.time", lambda: next(clock))
+        store = DiceIdStore(store_path, max_entries=2)
+        await store.put("https://dice.fm/event/one", "1")
+        await store.put("https://dice.fm/event/two", "2")
+        await store.get("https://dice.fm/event/one")
+        await store.put("https://dice.fm/event/three", "3")
+
+        assert await store.count() == 2
+        assert await store.get("https://dice.fm/event/two") is None
+        assert await store.get("https://dice.fm/event/one") == "1"
+
+    @pytest.mark.asyncio
+    async def test_hits_are_written_on_close(self, store_path, monkeypatch):
+        """Test that a cache hit reads without committing"""
+        clock = iter(range(100))
+        monkeypatch.setattr("dice_id_store.time.time", lambda: next(clock))
+        store = DiceIdStore(store_path, max_entries=10)
+        await store.put("https://dice.fm/event/one", "1")
+        changes = await store._run(lambda: store._connect().total_changes)
+
+        for _ in range(3):
+            assert await store.get("https://dice.fm/event/one") == "1"
+
+        assert await store._run(lambda: store._connect().total_changes) == changes
+        await store.close()
+        connection = sqlite3.connect(store_path)
+        last_used = connection.execute("SELECT last_used FROM dice_item_ids").fetchone()
+        connection.close()
+        assert last_used == (3,)
+
+    @pytest.mark.asyncio
+    async def test_unwritable_path_is_logged_not_raised(self, tmp_path):
+        """Test that storage errors degrade to a miss"""
+        store = DiceIdStore(str(tmp_path / "missing" / "dice.sqlite3"))
+
+        await store.put("https://dice.fm/event/one", "1")
+
+        assert await store.get("https://dice.fm/event/one") is None
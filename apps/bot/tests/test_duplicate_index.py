@@ -0,0 +1,97 @@
+import datetime
+import pytest
+
+from duplicate_index import DuplicateIndex, canonicalize_event_url, get_source_key
+from models import Event
+
+
+def make_event(url, event_id="1", start_time="2024-01-15T20:00:00", source_id=None):
+    return Event(
+        event_id=event_id,
+        title="Test Event",
+        start_time=start_time,
+        end_time="2024-01-15T23:00:00",
+        location="Venue",
+        url=url,
+        description="",
+        source_id=source_id,
+    )
+
+
+def link_for(event_id):
+    return f"https://teamup.com/reader/events/{event_id}"
+
+
+WINDOW = (datetime.date(2024, 1, 10), datetime.date(2024, 4, 10))
+
+
+class TestCanonicalizeEventUrl:
+    def test_canonicalize_strips_noise(self):
+        """Test that host case, www, query, fragment and trailing slash are ignored"""
+        assert (
+            canonicalize_event_url("https://WWW.RA.co/events/123/?utm=x#tickets")
+            == "https://ra.co/events/123"
+        )
+
+    def test_canonicalize_keeps_path_case(self):
+        assert (
+            canonicalize_event_url("https://dice.fm/event/AbC-party")
+            == "https://dice.fm/event/AbC-party"
+        )
+
+
+class TestGetSourceKey:
+    def test_ra_id_is_read_from_url(self):
+        assert get_source_key("https://ra.co/events/123456") == ("ra", "123456")
+
+    def test_dice_id_must_be_supplied(self):
+        assert get_source_key("https://dice.fm/event/abc") is None
+        assert get_source_key("https://dice.fm/event/abc", "999") == ("dice", "999")
+
+    def test_unknown_provider(self):
+        assert get_source_key("https://example.com/events/1") is None
+
+
+class TestDuplicateIndex:
+    def test_lookup_by_canonical_url(self):
+        index = DuplicateIndex()
+        index.rebuild([make_event("https://ra.co/events/123")], link_for, *WINDOW)
+
+        assert index.lookup("https://www.ra.co/events/123/?ref=x") == link_for("1")
+        assert index.hits == 1
+
+    def test_lookup_by_provider_id(self):
+        """Test that a Dice event is found by item ID under a different URL"""
+        index = DuplicateIndex()
+        index.add(
+            make_event("https://dice.fm/event/old-slug", source_id="999"),
+            link_for("7"),
+        )
+
+        assert index.lookup("https://dice.fm/event/new-slug", "999") == link_for("7")
+
+    def test_rebuild_keeps_learned_provider_ids_for_present_events(self):
+        index = DuplicateIndex()
+        event = make_event("https://dice.fm/event/slug", event_id="7", source_id="999")
+        index.add(event, link_for("7"))
+
+        index.rebuild(
+            [make_event("https://dice.fm/event/slug", event_id="7")],
+            link_for,
+            *WINDOW,
+        )
+        assert index.lookup("https://dice.fm/event/other", "999") == link_for("7")
+
+        index.rebuild([], link_for, *WINDOW)
+        assert index.lookup("https://dice.fm/event/other", "999") is None
+
+    def test_covers_only_synced_window(self):
+        """Test that misses are authoritative only inside a warm window"""
+        index = DuplicateIndex()
+
+        assert not index.covers(datetime.datetime.fromisoformat("2024-01-15T20:00:00"))
+
+        index.rebuild([], link_for, *WINDOW)
+
+        assert index.covers(datetime.datetime.fromisoformat("2024-01-15T20:00:00"))
+        assert not index.covers(datetime.datetime.fromisoformat("2024-06-01T20:00:00"))
@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+import pytest
+from unittest.mock import AsyncMock
+
+from event_cache import EventCache
+from models import Cache, Event
+
+
+def make_event(title="Event 1"):
+    return Event(
+        title=title,
+        start_time="2024-01-15T20:00:00",
+        end_time="2024-01-15T23:00:00",
+        location="Venue 1",
+        url="https://example.com/1",
+        description="Description 1",
+    )
+
+
+class TestEventCache:
+    def test_new_cache_is_stale_and_not_loaded(self):
+        cache = EventCache()
+
+        assert cache.is_stale()
+        assert not cache.loaded
+
+    @pytest.mark.asyncio
+    async def test_get_counts_hits_and_misses(self):
+        """Test that a fresh cache is served without fetching"""
+        cache = EventCache()
+        fetch = AsyncMock(return_value=[make_event()])
+
+        await cache.get(fetch)
+        await cache.get(fetch)
+
+        fetch.assert_called_once()
+        assert cache.misses == 1
+        assert cache.hits == 1
+        assert cache.hit_rate == 0.5
+
+    @pytest.mark.asyncio
+    async def test_get_serves_stale_cache_without_waiting(self):
+        """Test stale-while-revalidate serving"""
+        events = [make_event()]
+        old = datetime.datetime.now() - datetime.timedelta(hours=2)
+        cache = EventCache(Cache(old, events), stale_while_revalidate=True)
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return []
+
+        result = await cache.get(fetch)
+
+        assert result.events == events
+        assert cache.refresh_task is not None
+        release.set()
+        await cache.refresh_task
+        assert cache.cache.events == []
+
+    @pytest.mark.asyncio
+    async def test_get_waits_for_stale_cache_when_revalidation_disabled(self):
+        old = datetime.datetime.now() - datetime.timedelta(hours=2)
+        cache = EventCache(Cache(old, [make_event()]), stale_while_revalidate=False)
+        fetch = AsyncMock(return_value=[])
+
+        result = await cache.get(fetch)
+
+        assert result.events == []
+        assert cache.misses == 1
+
+    @pytest.mark.asyncio
+    async def test_background_refresh_backs_off_after_failure(self):
+        """Test that a failing TeamUp is not retried on every request"""
+        old = datetime.datetime.now() - datetime.timedelta(hours=2)
+        cache = EventCache(Cache(old, [make_event()]), retry_after_seconds=60)
+        fetch = AsyncMock(return_value=None)
+
+        await cache.get(fetch)
+        await cache.refresh_task
+        await cache.get(fetch)
+
+        fetch.assert_called_once()
+        assert cache.refresh_task is None
+
+    def test_is_expired_past_max_age(self):
+        old = datetime.datetime.now() - datetime.timedelta(days=2)
+
+        assert EventCache(Cache(old, []), max_age_seconds=86400).is_expired()
+        assert not EventCache(max_age_seconds=86400).is_expired()
+
+    @pytest.mark.asyncio
+    async def test_refresh_failure_keeps_events(self):
+        """Test that a failed fetch never wipes a good cache"""
+        events = [make_event()]
+        cache = EventCache(Cache(datetime.datetime(2024, 1, 1), events))
+
+        result = await cache.refresh(AsyncMock(return_value=None))
+
+        assert result is False
+        assert cache.cache.events == events
+        assert cache.failures == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_shared_refresh(self):
+        """Test that one caller giving up does not abort the refresh for others"""
+        cache = EventCache()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return [make_event()]
+
+        first = asyncio.create_task(cache.refresh(fetch))
+        second = asyncio.create_task(cache.refresh(fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+
+        assert await second is True
+        assert cache.refreshes == 1
+        assert len(cache.cache.events) == 1
@@ -1,8 +1,10 @@
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import datetime
 from events_calendar import (
     get_events,
+    get_events_window,
+    get_modified_events,
     search_event,
     create_calendar_event,
     get_calendar_link,
@@ -11,8 +13,8 @@ from models import Event
 
 
 class TestGetEvents:
-    @patch("events_calendar.requests.get")
-    def test_get_events_success(self, mock_get):
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_get_events_success(self, mock_get):
         """Test successful events retrieval"""
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -40,29 +42,101 @@ class TestGetEvents:
         }
         mock_get.return_value = mock_response
 
-        events = get_events()
+        events = await get_events()
 
         assert len(events) == 2
         assert events[0].title == "Test Event 1"
         assert events[0].event_id == "1"
         assert events[1].title == "Test Event 2"
 
-    @patch("events_calendar.requests.get")
-    def test_get_events_empty(self, mock_get):
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_get_events_empty(self, mock_get):
         """Test events retrieval with no events"""
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {"events": []}
         mock_get.return_value = mock_response
 
-        events = get_events()
+        events = await get_events()
 
         assert len(events) == 0
 
 
+class TestGetEventsWindow:
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_get_events_window_returns_cursor(self, mock_get):
+        """Test that a window fetch returns Teamup's timestamp as sync cursor"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"events": [], "timestamp": 1700000000}
+        mock_get.return_value = mock_response
+
+        result = await get_events_window(
+            datetime.date(2024, 1, 15), datetime.date(2024, 1, 21)
+        )
+
+        assert result == ([], 1700000000)
+        api_url = mock_get.call_args.args[0]
+        assert "startDate=2024-01-15" in api_url
+        assert "endDate=2024-01-21" in api_url
+
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_get_events_window_http_error(self, mock_get):
+        import httpx
+
+        mock_get.side_effect = httpx.ConnectError("boom")
+
+        result = await get_events_window(
+            datetime.date(2024, 1, 15), datetime.date(2024, 1, 21)
+        )
+
+        assert result is None
+
+
+class TestGetModifiedEvents:
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_get_modified_events_splits_changes(self, mock_get):
+        """Test that deleted and recurring events are reported separately"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "timestamp": 1700000100,
+            "events": [
+                {
+                    "id": "1",
+                    "title": "Changed",
+                    "start_dt": "2024-01-15T20:00:00+00:00",
+                    "end_dt": "2024-01-15T23:00:00+00:00",
+                    "delete_dt": None,
+                },
+                {
+                    "id": "2",
+                    "title": "Deleted",
+                    "start_dt": "2024-01-16T20:00:00+00:00",
+                    "end_dt": "2024-01-16T23:00:00+00:00",
+                    "delete_dt": "2024-01-10T10:00:00+00:00",
+                },
+                {
+                    "id": "3",
+                    "title": "Weekly",
+                    "start_dt": "2024-01-17T20:00:00+00:00",
+                    "end_dt": "2024-01-17T23:00:00+00:00",
+                    "rrule": "FREQ=WEEKLY",
+                },
+            ],
+        }
+        mock_get.return_value = mock_response
+
+        result = await get_modified_events(1700000000)
+
+        assert [event.event_id for event in result["changed"]] == ["1", "3"]
+        assert result["deleted"] == ["2"]
+        assert result["recurring"] is True
+        assert result["timestamp"] == 1700000100
+        assert "modifiedSince=1700000000" in mock_get.call_args.args[0]
+
+
 class TestSearchEvent:
-    @patch("events_calendar.requests.get")
-    def test_search_event_found(self, mock_get):
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_search_event_found(self, mock_get):
         """Test searching for an event that exists"""
         event = Event(
             title="Test Event",
@@ -90,13 +164,13 @@ class TestSearchEvent:
         }
         mock_get.return_value = mock_response
 
-        result = search_event(event)
+        result = await search_event(event)
 
         assert result is not None
         assert "123" in result
 
-    @patch("events_calendar.requests.get")
-    def test_search_event_not_found(self, mock_get):
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_search_event_not_found(self, mock_get):
         """Test searching for an event that doesn't exist"""
         event = Event(
             title="Test Event",
@@ -112,12 +186,12 @@ class TestSearchEvent:
         mock_response.json.return_value = {"events": []}
         mock_get.return_value = mock_response
 
-        result = search_event(event)
+        result = await search_event(event)
 
         assert result is None
 
-    @patch("events_calendar.requests.get")
-    def test_search_event_http_error(self, mock_get):
+    @patch("events_calendar.http_client.get", new_callable=AsyncMock)
+    async def test_search_event_http_error(self, mock_get):
         """Test searching for an event with HTTP error"""
         event = Event(
             title="Test Event",
@@ -132,14 +206,14 @@ class TestSearchEvent:
         mock_response.status_code = 500
         mock_get.return_value = mock_response
 
-        result = search_event(event)
+        result = await search_event(event)
 
         assert result is None
 
 
 class TestCreateCalendarEvent:
-    @patch("events_calendar.requests.post")
-    def test_create_calendar_event_success(self, mock_post):
+    @patch("events_calendar.http_client.post", new_callable=AsyncMock)
+    async def test_create_calendar_event_success(self, mock_post):
         """Test successful event creation"""
         event = Event(
             title="Test Event",
@@ -152,15 +226,17 @@ class TestCreateCalendarEvent:
 
         mock_response = MagicMock()
         mock_response.status_code = 201
+        mock_response.json.return_value = {"event": {"id": 987}}
         mock_post.return_value = mock_response
 
-        result = create_calendar_event(event)
+        result = await create_calendar_event(event)
 
         assert result is True
         assert mock_post.called
+        assert event.event_id == "987"
 
-    @patch("events_calendar.requests.post")
-    def test_create_calendar_event_failure(self, mock_post):
+    @patch("events_calendar.http_client.post", new_callable=AsyncMock)
+    async def test_create_calendar_event_failure(self, mock_post):
         """Test failed event creation"""
         event = Event(
             title="Test Event",
@@ -176,7 +252,7 @@ class TestCreateCalendarEvent:
         mock_response.text = "Bad request"
         mock_post.return_value = mock_response
 
-        result = create_calendar_event(event)
+        result = await create_calendar_event(event)
 
         assert result is False
 
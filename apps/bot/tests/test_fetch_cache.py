@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from fetch_cache import FetchCache
+
+
+class TestFetchCache:
+    @pytest.mark.asyncio
+    async def test_get_or_fetch_caches_value(self):
+        """Test that a second lookup is answered from the cache"""
+        cache = FetchCache(ttl_seconds=60, max_entries=10)
+        fetch = AsyncMock(return_value="event")
+
+        assert await cache.get_or_fetch(("ra", "1"), fetch) == "event"
+        assert await cache.get_or_fetch(("ra", "1"), fetch) == "event"
+
+        fetch.assert_called_once()
+        assert cache.hits == 1
+        assert cache.misses == 1
+        assert cache.hit_rate == 0.5
+
+    @pytest.mark.asyncio
+    async def test_concurrent_lookups_share_one_fetch(self):
+        """Test that concurrent lookups for one key share the in-flight fetch"""
+        cache = FetchCache(ttl_seconds=60, max_entries=10)
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "event"
+
+        results = await asyncio.gather(
+            *(cache.get_or_fetch(("dice", "1"), fetch) for _ in range(3))
+        )
+
+        assert results == ["event"] * 3
+        assert calls == 1
+        assert cache.shared == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_fetch_is_not_cached(self):
+        """Test that a None result is retried on the next lookup"""
+        cache = FetchCache(ttl_seconds=60, max_entries=10)
+        fetch = AsyncMock(side_effect=[None, "event"])
+
+        assert await cache.get_or_fetch(("ra", "1"), fetch) is None
+        assert await cache.get_or_fetch(("ra", "1"), fetch) == "event"
+        assert len(cache) == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_fetch(self):
+        """Test that the fetch completes for others when one caller gives up"""
+        cache = FetchCache(ttl_seconds=60, max_entries=10)
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            return "event"
+
+        first = asyncio.create_task(cache.get_or_fetch(("ra", "1"), fetch))
+        second = asyncio.create_task(cache.get_or_fetch(("ra", "1"), fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "event"
+        assert cache.get(("ra", "1")) == "event"
+
+    @pytest.mark.asyncio
+    async def test_last_cancelled_caller_cancels_fetch(self):
+        """Test that the fetch is cancelled once nobody is waiting for it"""
+        cache = FetchCache(ttl_seconds=60, max_entries=10)
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(cache.get_or_fetch(("ra", "1"), fetch))
+        await started.wait()
+        caller.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert cache.get(("ra", "1")) is None
+        assert not cache._inflight
+
+    def test_expired_entries_are_dropped(self):
+        """Test that entries older than the TTL are not returned"""
+        cache = FetchCache(ttl_seconds=60, max_entries=10)
+        with patch("fetch_cache.time.monotonic", return_value=1000):
+            cache.put(("ra", "1"), "event")
+        with patch("fetch_cache.time.monotonic", return_value=1061):
+            assert cache.get(("ra", "1")) is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test that the bound evicts the least recently used entry"""
+        cache = FetchCache(ttl_seconds=60, max_entries=2)
+        cache.put(("ra", "1"), "one")
+        cache.put(("ra", "2"), "two")
+        cache.get(("ra", "1"))
+        cache.put(("ra", "3"), "three")
+
+        assert cache.get(("ra", "2")) is None
+        assert cache.get(("ra", "1")) == "one"
+        assert cache.get(("ra", "3")) == "three"
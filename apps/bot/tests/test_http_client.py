@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import http_client
+
+
+@pytest.fixture(autouse=True)
+async def close_clients():
+    yield
+    await http_client.aclose()
+
+
+class TestGetClient:
+    @pytest.mark.asyncio
+    async def test_get_client_reuses_pool_for_same_host(self):
+        """Test that repeated calls share one keep-alive pool per host"""
+        first = http_client.get_client("ra.co")
+        second = http_client.get_client("ra.co")
+
+        assert first is second
+
+    @pytest.mark.asyncio
+    async def test_get_client_separates_hosts(self):
+        """Test that each host gets its own pool"""
+        ra_client = http_client.get_client("ra.co")
+        dice_client = http_client.get_client("dice.fm")
+
+        assert ra_client is not dice_client
+
+    @pytest.mark.asyncio
+    async def test_get_client_replaces_closed_client(self):
+        """Test that a closed client is replaced on next use"""
+        client = http_client.get_client("ra.co")
+        await client.aclose()
+
+        assert http_client.get_client("ra.co") is not client
+
+
+class TestRequest:
+    @pytest.mark.asyncio
+    async def test_request_routes_by_host(self):
+        """Test that requests go through the client for the URL's host"""
+        mock_client = MagicMock()
+        mock_client.request = AsyncMock(return_value="response")
+
+        with patch(
+            "http_client.get_client", return_value=mock_client
+        ) as mock_get_client:
+            result = await http_client.post("https://Ra.co/graphql", json={})
+
+        assert result == "response"
+        mock_get_client.assert_called_once_with("ra.co")
+        mock_client.request.assert_called_once_with(
+            "POST", "https://Ra.co/graphql", json={}
+        )
+
+    @pytest.mark.asyncio
+    async def test_stream_routes_by_host(self):
+        """Test that streamed requests go through the client for the URL's host"""
+        mock_client = MagicMock()
+        mock_client.stream.return_value = "stream"
+
+        with patch(
+            "http_client.get_client", return_value=mock_client
+        ) as mock_get_client:
+            result = http_client.stream("GET", "https://dice.fm/event/test")
+
+        assert result == "stream"
+        mock_get_client.assert_called_once_with("dice.fm")
+        mock_client.stream.assert_called_once_with("GET", "https://dice.fm/event/test")
+
+    @pytest.mark.asyncio
+    async def test_aclose_closes_all_clients(self):
+        """Test that shutdown closes every pooled client"""
+        client = http_client.get_client("ra.co")
+
+        await http_client.aclose()
+
+        assert client.is_closed
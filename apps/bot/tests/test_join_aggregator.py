@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+
+from join_aggregator import JoinAggregator
+
+
+class TestJoinAggregator:
+    @pytest.mark.asyncio
+    async def test_joins_within_window_are_flushed_together(self):
+        aggregator = JoinAggregator(
+            window_seconds=0.01, flood_threshold=100, flood_window_seconds=1
+        )
+        flush = AsyncMock()
+
+        aggregator.add(-100, [1], flush)
+        aggregator.add(-100, [2, 3], flush)
+        assert len(aggregator) == 3
+        await asyncio.sleep(0.05)
+
+        flush.assert_called_once_with([1, 2, 3], False)
+        assert len(aggregator) == 0
+        assert aggregator.batches == 1
+        assert aggregator.members == 3
+
+    @pytest.mark.asyncio
+    async def test_chats_are_batched_separately(self):
+        aggregator = JoinAggregator(
+            window_seconds=60, flood_threshold=100, flood_window_seconds=60
+        )
+        first, second = AsyncMock(), AsyncMock()
+        aggregator.add(-100, [1], first)
+        aggregator.add(-200, [2], second)
+
+        await aggregator.flush_all()
+
+        first.assert_called_once_with([1], False)
+        second.assert_called_once_with([2], False)
+
+    @pytest.mark.asyncio
+    async def test_flood_extends_the_batch_window(self):
+        """Test that crossing the join rate keeps the batch open for the flood window"""
+        aggregator = JoinAggregator(
+            window_seconds=0.01, flood_threshold=2, flood_window_seconds=60
+        )
+        flush = AsyncMock()
+
+        aggregator.add(-100, [1], flush)
+        aggregator.add(-100, [2, 3, 1], flush)
+        await asyncio.sleep(0.05)
+
+        flush.assert_not_called()
+        assert aggregator.is_flooded(-100)
+        await aggregator.flush(-100)
+        flush.assert_called_once_with([1, 2, 3], True)
+        assert aggregator.flood_batches == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_is_logged(self):
+        aggregator = JoinAggregator(
+            window_seconds=60, flood_threshold=100, flood_window_seconds=60
+        )
+        aggregator.add(-100, [1], AsyncMock(side_effect=RuntimeError("boom")))
+
+        await aggregator.flush(-100)
+
+        assert len(aggregator) == 0
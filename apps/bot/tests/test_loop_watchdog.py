@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+import traceback
+import pytest
+
+from loop_watchdog import BOT_DIRECTORY, LoopWatchdog, find_blocking_frames, percentile
+
+
+def blocking_step():
+    time.sleep(0.3)
+
+
+async def blocking_command():
+    await asyncio.sleep(0.05)
+    blocking_step()
+
+
+class TestLoopWatchdog:
+    @pytest.mark.asyncio
+    async def test_stall_is_reported_with_blocking_call(self):
+        """Test that a blocked loop is reported with the handler and call"""
+        watchdog = LoopWatchdog(interval_seconds=0.02, threshold_seconds=0.1)
+        watchdog.start()
+        try:
+            # Handlers run as their own tasks, like updates processed by PTB
+            await asyncio.create_task(blocking_command())
+            await asyncio.sleep(0.05)
+        finally:
+            await watchdog.stop()
+
+        assert watchdog.stalls == 1
+        assert watchdog.last_stall["handler"] == "blocking_command"
+        assert "test_loop_watchdog.py" in watchdog.last_stall["call"]
+        assert "in blocking_step: time.sleep(0.3)" in watchdog.last_stall["call"]
+        assert watchdog.max_lag >= 0.2
+
+    @pytest.mark.asyncio
+    async def test_idle_loop_has_no_stalls(self):
+        """Test that heartbeats on an idle loop record lag without stalls"""
+        watchdog = LoopWatchdog(interval_seconds=0.01, threshold_seconds=0.5)
+        watchdog.start()
+        try:
+            await asyncio.sleep(0.1)
+        finally:
+            await watchdog.stop()
+
+        assert watchdog.stalls == 0
+        assert len(watchdog.lags) > 0
+        assert set(watchdog.percentiles()) == {50, 95, 99}
+
+    def test_percentile(self):
+        """Test that percentiles are read from the sorted samples"""
+        samples = [float(value) for value in range(100, 0, -1)]
+
+        assert percentile(samples, 50) == 51
+        assert percentile(samples, 99) == 100
+        assert percentile([], 95) == 0.0
+
+    def test_find_blocking_frames_skips_wrappers(self):
+        """Test that handler wrappers are not reported as the handler"""
+        stack = traceback.StackSummary.from_list(
+            [
+                ("/usr/lib/python3/asyncio/events.py", 80, "_run", "ctx.run()"),
+                (
+                    os.path.join(BOT_DIRECTORY, "metrics.py"),
+                    250,
+                    "wrapper",
+                    "await callback()",
+                ),
+                (
+                    os.path.join(BOT_DIRECTORY, "main.py"),
+                    390,
+                    "create_event_command",
+                    "await fetch()",
+                ),
+                (
+                    os.path.join(BOT_DIRECTORY, "dice.py"),
+                    70,
+                    "get_dice_event_id",
+                    "parser.feed(chunk)",
+                ),
+                ("/usr/lib/python3/html/parser.py", 150, "goahead", "match = ..."),
+            ]
+        )
+
+        handler, call, innermost = find_blocking_frames(stack)
+
+        assert handler == "create_event_command"
+        assert call == "dice.py:70 in get_dice_event_id: parser.feed(chunk)"
+        assert innermost.endswith("in goahead: match = ...")
+
+    def test_find_blocking_frames_ignores_script_frames(self):
+        """Test that the main.py module frame running the loop is not the handler"""
+        main_py = os.path.join(BOT_DIRECTORY, "main.py")
+        stack = traceback.StackSummary.from_list(
+            [
+                (main_py, 1700, "<module>", "application.run_polling()"),
+                ("/usr/lib/python3/asyncio/base_events.py", 600, "run_forever", ""),
+                ("/usr/lib/python3/asyncio/base_events.py", 1900, "_run_once", ""),
+                ("/usr/lib/python3/asyncio/events.py", 80, "_run", "ctx.run()"),
+                (os.path.join(BOT_DIRECTORY, "tracing.py"), 128, "wrapper", ""),
+                (main_py, 140, "rave_command", "message = render()"),
+                (main_py, 1290, "render", "time.sleep(1)"),
+            ]
+        )
+
+        handler, call, _ = find_blocking_frames(stack)
+
+        assert handler == "rave_command"
+        assert call == "main.py:1290 in render: time.sleep(1)"
@@ -13,9 +13,58 @@ from main import (
     is_old_command,
     update_announcement_timer,
 )
+from event_cache import EventCache
 from models import Cache, Event
 
 
+def today_at(hour: int, day_offset: int = 0) -> str:
+    day = datetime.date.today() + datetime.timedelta(days=day_offset)
+    return datetime.datetime.combine(day, datetime.time(hour)).strftime(
+        "%Y-%m-%dT%H:%M:%S"
+    )
+
+
+@pytest.fixture(autouse=True)
+def shared_event_cache(monkeypatch):
+    import main
+
+    cache = EventCache()
+    monkeypatch.setattr(main, "event_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiter(monkeypatch):
+    import main
+    from rate_limit import RateLimiter
+
+    limiter = RateLimiter()
+    monkeypatch.setattr(main, "rate_limiter", limiter)
+    return limiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_deadline_scheduler(monkeypatch):
+    import main
+    from deadline_scheduler import DeadlineScheduler
+
+    scheduler = DeadlineScheduler()
+    monkeypatch.setattr(main, "deadline_scheduler", scheduler)
+    return scheduler
+
+
+@pytest.fixture(autouse=True)
+def fresh_join_aggregator(monkeypatch):
+    import main
+    from join_aggregator import JoinAggregator
+
+    aggregator = JoinAggregator(
+        window_seconds=60, flood_threshold=3, flood_window_seconds=600
+    )
+    monkeypatch.setattr(main, "join_aggregator", aggregator)
+    return aggregator
+
+
 class TestRemoveJobIfExists:
     def test_remove_job_if_exists_job_found(self):
         """Test removing an existing job"""
@@ -293,11 +342,175 @@ class TestUpdateAnnouncement:
         context.bot.unpin_chat_message.assert_not_called()
         context.bot.delete_message.assert_not_called()
 
+    def make_announcement_state(self, message, verified_ago_seconds=60):
+        from main import get_announcement_digest
+
+        verified_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            seconds=verified_ago_seconds
+        )
+        return {
+            "message_id": 111,
+            "digest": get_announcement_digest(message),
+            "pinned": True,
+            "verified_at": verified_at.isoformat(),
+        }
+
+    @pytest.mark.asyncio
+    @patch("main.get_rave_message", new_callable=AsyncMock)
+    async def test_update_announcement_skips_unchanged_pinned_message(
+        self, mock_get_rave_message
+    ):
+        from main import (
+            ANNOUNCEMENT_STATE_KEY,
+            LAST_ANNOUNCEMENT_UPDATE_KEY,
+            update_announcement,
+        )
+
+        mock_get_rave_message.return_value = "<b>Upcoming events</b>"
+        context = MagicMock()
+        context.chat_data = {
+            "announcement_id": 111,
+            ANNOUNCEMENT_STATE_KEY: self.make_announcement_state(
+                "<b>Upcoming events</b>"
+            ),
+        }
+        context.bot_data = {}
+        context.bot.edit_message_text = AsyncMock()
+        context.bot.pin_chat_message = AsyncMock()
+
+        await update_announcement(context, -1001234567890)
+
+        context.bot.edit_message_text.assert_not_called()
+        context.bot.pin_chat_message.assert_not_called()
+        assert context.bot_data[LAST_ANNOUNCEMENT_UPDATE_KEY]["outcome"] == "success"
+        assert "skipped" in context.bot_data[LAST_ANNOUNCEMENT_UPDATE_KEY]["reason"]
+
+    @pytest.mark.asyncio
+    @patch("main.get_rave_message", new_callable=AsyncMock)
+    async def test_update_announcement_edits_changed_message_without_repin(
+        self, mock_get_rave_message
+    ):
+        from main import (
+            ANNOUNCEMENT_STATE_KEY,
+            get_announcement_digest,
+            update_announcement,
+        )
+
+        mock_get_rave_message.return_value = "<b>New events</b>"
+        edited_message = MagicMock()
+        edited_message.message_id = 111
+        edited_message.pin = AsyncMock()
+        context = MagicMock()
+        context.chat_data = {
+            "announcement_id": 111,
+            ANNOUNCEMENT_STATE_KEY: self.make_announcement_state("<b>Old events</b>"),
+        }
+        context.bot_data = {}
+        context.bot.edit_message_text = AsyncMock(return_value=edited_message)
+
+        await update_announcement(context, -1001234567890)
+
+        context.bot.edit_message_text.assert_called_once()
+        edited_message.pin.assert_not_called()
+        assert context.chat_data[ANNOUNCEMENT_STATE_KEY][
+            "digest"
+        ] == get_announcement_digest("<b>New events</b>")
+
+    @pytest.mark.asyncio
+    @patch("main.get_rave_message", new_callable=AsyncMock)
+    async def test_update_announcement_verifies_when_check_is_due(
+        self, mock_get_rave_message, monkeypatch
+    ):
+        from main import ANNOUNCEMENT_STATE_KEY, update_announcement
+
+        monkeypatch.setattr(
+            "main.AnnouncementConfiguration.verify_interval_seconds", 3600
+        )
+        mock_get_rave_message.return_value = "<b>Upcoming events</b>"
+        context = MagicMock()
+        context.chat_data = {
+            "announcement_id": 111,
+            ANNOUNCEMENT_STATE_KEY: self.make_announcement_state(
+                "<b>Upcoming events</b>", verified_ago_seconds=7200
+            ),
+        }
+        context.bot_data = {}
+        context.bot.edit_message_text = AsyncMock(
+            side_effect=BadRequest("Message is not modified")
+        )
+        context.bot.pin_chat_message = AsyncMock()
+
+        await update_announcement(context, -1001234567890)
+
+        context.bot.edit_message_text.assert_called_once()
+        context.bot.pin_chat_message.assert_called_once()
+        state = context.chat_data[ANNOUNCEMENT_STATE_KEY]
+        assert state["pinned"] is True
+        assert (
+            datetime.datetime.now(datetime.timezone.utc)
+            - datetime.datetime.fromisoformat(state["verified_at"])
+        ).total_seconds() < 60
+
+    @pytest.mark.asyncio
+    @patch("main.get_rave_message", new_callable=AsyncMock)
+    async def test_update_announcement_does_not_trust_failed_pin(
+        self, mock_get_rave_message
+    ):
+        from main import ANNOUNCEMENT_STATE_KEY, update_announcement
+
+        mock_get_rave_message.return_value = "<b>Upcoming events</b>"
+        new_message = MagicMock()
+        new_message.message_id = 222
+        new_message.pin = AsyncMock(side_effect=TelegramError("Can't pin"))
+        context = MagicMock()
+        context.chat_data = {}
+        context.bot_data = {}
+        context.bot.send_message = AsyncMock(return_value=new_message)
+
+        await update_announcement(context, -1001234567890)
+
+        assert context.chat_data[ANNOUNCEMENT_STATE_KEY]["message_id"] == 222
+        assert context.chat_data[ANNOUNCEMENT_STATE_KEY]["pinned"] is False
+
+
+class TestMetrics:
+    @pytest.mark.asyncio
+    async def test_announcement_outcomes_are_counted_without_error_details(self):
+        from main import record_announcement_update_status
+        from metrics import announcement_updates
+
+        before = announcement_updates.get("failure", "edit failed")
+        context = MagicMock()
+        context.bot_data = {}
+
+        await record_announcement_update_status(
+            context, "failure", "edit failed: timeout"
+        )
+
+        assert announcement_updates.get("failure", "edit failed") == before + 1
+
+    def test_register_metrics_exports_component_counters(self, shared_event_cache):
+        from main import register_metrics
+        from metrics import metrics
+
+        application = MagicMock()
+        application.job_queue.jobs.return_value = [MagicMock(), MagicMock()]
+        shared_event_cache.hits = 3
+        shared_event_cache.misses = 1
+
+        register_metrics(application)
+        output = metrics.render()
+
+        assert 'ravebot_cache_hit_ratio{cache="events"} 0.75' in output
+        assert "ravebot_job_queue_size 2" in output
+        assert 'ravebot_outbound_queued{lane="moderation"} 0' in output
+        assert 'ravebot_event_loop_lag_seconds{quantile="0.99"}' in output
+
 
 class TestUpdateCache:
     @pytest.mark.asyncio
-    @patch("main.get_events")
-    async def test_update_cache_new_events(self, mock_get_events):
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_update_cache_new_events(self, mock_sync, shared_event_cache):
         """Test updating cache with new events"""
         mock_events = [
             Event(
@@ -309,22 +522,25 @@ class TestUpdateCache:
                 description="Description 1",
             )
         ]
-        mock_get_events.return_value = mock_events
+        mock_sync.return_value = mock_events
 
         context = MagicMock()
         context.chat_data = {}
 
         await update_cache(context)
 
-        assert "cache" in context.chat_data
-        assert context.chat_data["cache"].events == mock_events
-        mock_get_events.assert_called_once()
+        assert shared_event_cache.loaded
+        assert shared_event_cache.cache.events == mock_events
+        assert "cache" not in context.chat_data
+        mock_sync.assert_called_once()
 
     @pytest.mark.asyncio
-    @patch("main.get_events")
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
     async def test_update_cache_keeps_existing_cache_on_api_failure(
-        self, mock_get_events
+        self, mock_sync, monkeypatch
     ):
+        import main
+
         existing_events = [
             Event(
                 title="Existing Event",
@@ -336,18 +552,23 @@ class TestUpdateCache:
             )
         ]
         existing_cache = Cache(datetime.datetime(2024, 1, 1), existing_events)
-        mock_get_events.return_value = None
+        monkeypatch.setattr(main, "event_cache", EventCache(existing_cache))
+        mock_sync.return_value = None
         context = MagicMock()
-        context.chat_data = {"cache": existing_cache}
 
         await update_cache(context)
 
-        assert context.chat_data["cache"] is existing_cache
-        assert context.chat_data["cache"].events == existing_events
+        assert main.event_cache.cache is existing_cache
+        assert main.event_cache.cache.events == existing_events
+        assert main.event_cache.failures == 1
 
     @pytest.mark.asyncio
-    @patch("main.get_events")
-    async def test_update_cache_accepts_empty_calendar_response(self, mock_get_events):
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_update_cache_accepts_empty_calendar_response(
+        self, mock_sync, monkeypatch
+    ):
+        import main
+
         existing_events = [
             Event(
                 title="Existing Event",
@@ -359,72 +580,868 @@ class TestUpdateCache:
             )
         ]
         existing_cache = Cache(datetime.datetime(2024, 1, 1), existing_events)
-        mock_get_events.return_value = []
+        monkeypatch.setattr(main, "event_cache", EventCache(existing_cache))
+        mock_sync.return_value = []
         context = MagicMock()
-        context.chat_data = {"cache": existing_cache}
 
         await update_cache(context)
 
-        assert context.chat_data["cache"] is existing_cache
-        assert context.chat_data["cache"].events == []
+        assert main.event_cache.cache is existing_cache
+        assert main.event_cache.cache.events == []
         assert (
-            context.chat_data["cache"].last_update.date()
-            == datetime.datetime.now().date()
+            main.event_cache.cache.last_update.date() == datetime.datetime.now().date()
         )
 
 
 class TestGetRaveMessage:
     @pytest.mark.asyncio
-    @patch("main.update_cache", new_callable=AsyncMock)
-    @patch("main.get_events")
-    async def test_get_rave_message_with_events(
-        self, mock_get_events, mock_update_cache
-    ):
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_get_rave_message_with_events(self, mock_sync, monkeypatch):
         """Test getting rave message with events"""
+        import main
+
         events = [
             Event(
                 title="Event 1",
-                start_time="2024-01-15T20:00:00",
-                end_time="2024-01-15T23:00:00",
+                start_time=today_at(20),
+                end_time=today_at(23),
                 location="Venue 1",
                 url="https://example.com/1",
                 description="Description 1",
             )
         ]
-
+        monkeypatch.setattr(
+            main, "event_cache", EventCache(Cache(datetime.datetime.now(), events))
+        )
         context = MagicMock()
-        cache = Cache(datetime.datetime.now(), events)
-        context.chat_data = {"cache": cache}
 
         message = await get_rave_message(context)
 
         assert "Event 1" in message
         assert "Venue 1" in message
+        mock_sync.assert_not_called()
+        assert main.event_cache.hits == 1
 
     @pytest.mark.asyncio
-    @patch("main.update_cache", new_callable=AsyncMock)
-    async def test_get_rave_message_no_events(self, mock_update_cache):
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_get_rave_message_no_events(self, mock_sync):
         """Test getting rave message with no events"""
+        mock_sync.return_value = []
         context = MagicMock()
-        cache = Cache(datetime.datetime.now(), [])
-        context.chat_data = {"cache": cache}
 
         message = await get_rave_message(context)
 
         assert message is not None
 
     @pytest.mark.asyncio
-    @patch("main.update_cache", new_callable=AsyncMock)
-    async def test_get_rave_message_outdated_cache(self, mock_update_cache):
-        """Test getting rave message with outdated cache"""
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_get_rave_message_outdated_cache(self, mock_sync, monkeypatch):
+        """Test that an outdated cache is served at once and refreshed in background"""
+        import main
+
+        old_date = datetime.datetime.now() - datetime.timedelta(hours=2)
+        events = [
+            Event(
+                title="Old Event",
+                start_time=today_at(20),
+                end_time=today_at(23),
+                location="Venue 1",
+                url="https://example.com/1",
+                description="Description 1",
+            )
+        ]
+        monkeypatch.setattr(main, "event_cache", EventCache(Cache(old_date, events)))
+        mock_sync.return_value = []
+        context = MagicMock()
+
+        message = await get_rave_message(context)
+
+        assert "Old Event" in message
+        assert main.event_cache.stale_hits == 1
+        await main.event_cache.refresh_task
+        mock_sync.assert_called_once()
+        assert main.event_cache.cache.events == []
+
+    @pytest.mark.asyncio
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_get_rave_message_only_shows_this_week(self, mock_sync, monkeypatch):
+        """Test that events beyond the weekly window are synced but not shown"""
+        import main
+
+        events = [
+            Event(
+                title=title,
+                start_time=today_at(20, offset),
+                end_time=today_at(23, offset),
+                location="Venue",
+                url=f"https://example.com/{offset}",
+                description="",
+            )
+            for title, offset in [("This Week", 6), ("Next Month", 30)]
+        ]
+        monkeypatch.setattr(
+            main, "event_cache", EventCache(Cache(datetime.datetime.now(), events))
+        )
+
+        message = await get_rave_message(MagicMock())
+
+        assert "This Week" in message
+        assert "Next Month" not in message
+
+    @pytest.mark.asyncio
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_get_rave_message_marks_expired_cache(self, mock_sync, monkeypatch):
+        """Test that the staleness marker only appears past the hard maximum age"""
+        import main
+        from text import stale_events_message
+
         old_date = datetime.datetime.now() - datetime.timedelta(days=2)
+        monkeypatch.setattr(
+            main,
+            "event_cache",
+            EventCache(Cache(old_date, []), max_age_seconds=86400),
+        )
+        mock_sync.return_value = None
+        context = MagicMock()
+
+        message = await get_rave_message(context)
+
+        assert stale_events_message.split("{")[0] in message
+
+    @pytest.mark.asyncio
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_get_rave_message_fresh_cache_has_no_marker(
+        self, mock_sync, monkeypatch
+    ):
+        import main
+        from text import stale_events_message
+
+        monkeypatch.setattr(
+            main, "event_cache", EventCache(Cache(datetime.datetime.now(), []))
+        )
         context = MagicMock()
-        cache = Cache(old_date, [])
-        context.chat_data = {"cache": cache}
 
         message = await get_rave_message(context)
 
-        mock_update_cache.assert_called_once_with(context)
+        assert stale_events_message.split("{")[0] not in message
+        mock_sync.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_get_rave_message_shares_one_refresh_across_chats(self):
+        """Test that concurrent chats with a stale cache trigger one fetch"""
+        import asyncio
+        import main
+
+        fetch_started = asyncio.Event()
+        release_fetch = asyncio.Event()
+
+        async def slow_sync():
+            fetch_started.set()
+            await release_fetch.wait()
+            return []
+
+        with patch(
+            "main.calendar_sync.sync",
+            new_callable=AsyncMock,
+            side_effect=slow_sync,
+        ) as mock_sync:
+            tasks = [
+                asyncio.create_task(get_rave_message(MagicMock())) for _ in range(5)
+            ]
+            await fetch_started.wait()
+            release_fetch.set()
+            messages = await asyncio.gather(*tasks)
+
+        assert len(messages) == 5
+        mock_sync.assert_called_once()
+        assert main.event_cache.refreshes == 1
+
+
+class TestFindDuplicate:
+    def make_event(self, start_time="2024-01-15T20:00:00"):
+        return Event(
+            title="Test Event",
+            start_time=start_time,
+            end_time="2024-01-15T23:00:00",
+            location="Venue",
+            url="https://ra.co/events/123",
+            description="",
+        )
+
+    @pytest.fixture
+    def duplicate_index(self, monkeypatch):
+        import main
+        from duplicate_index import DuplicateIndex
+
+        index = DuplicateIndex()
+        monkeypatch.setattr(main, "duplicate_index", index)
+        return index
+
+    @pytest.mark.asyncio
+    @patch("main.search_event", new_callable=AsyncMock)
+    async def test_find_duplicate_uses_index_hit(self, mock_search, duplicate_index):
+        from main import find_duplicate
+
+        duplicate_index.add(self.make_event(), "https://teamup.com/x/events/1")
+
+        result = await find_duplicate(self.make_event())
+
+        assert result == "https://teamup.com/x/events/1"
+        mock_search.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("main.search_event", new_callable=AsyncMock)
+    async def test_find_duplicate_trusts_miss_inside_window(
+        self, mock_search, duplicate_index
+    ):
+        from main import find_duplicate
+
+        duplicate_index.rebuild(
+            [], str, datetime.date(2024, 1, 1), datetime.date(2024, 3, 1)
+        )
+
+        result = await find_duplicate(self.make_event())
+
+        assert result is None
+        mock_search.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("main.search_event", new_callable=AsyncMock)
+    async def test_find_duplicate_falls_back_when_index_cold(
+        self, mock_search, duplicate_index
+    ):
+        from main import find_duplicate
+
+        mock_search.return_value = "https://teamup.com/x/events/2"
+
+        result = await find_duplicate(self.make_event())
+
+        assert result == "https://teamup.com/x/events/2"
+        assert duplicate_index.fallbacks == 1
+
+    @pytest.mark.asyncio
+    @patch("main.search_event", new_callable=AsyncMock)
+    async def test_find_duplicate_skips_search_after_url_search(
+        self, mock_search, duplicate_index
+    ):
+        from main import find_duplicate
+
+        result = await find_duplicate(self.make_event(), url_searched=True)
+
+        assert result is None
+        mock_search.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("main.search_event_url", new_callable=AsyncMock)
+    async def test_find_duplicate_by_url_searches_when_index_cold(
+        self, mock_search_url, duplicate_index
+    ):
+        from main import find_duplicate_by_url
+
+        mock_search_url.return_value = "https://teamup.com/x/events/3"
+
+        result = await find_duplicate_by_url("https://ra.co/events/123")
+
+        assert result == "https://teamup.com/x/events/3"
+        assert mock_search_url.call_args.args[1] == datetime.date.today()
+
+    @pytest.mark.asyncio
+    @patch("main.search_event_url", new_callable=AsyncMock)
+    async def test_find_duplicate_by_url_trusts_warm_index(
+        self, mock_search_url, duplicate_index
+    ):
+        from main import find_duplicate_by_url
+
+        duplicate_index.rebuild(
+            [], str, datetime.date(2024, 1, 1), datetime.date(2024, 3, 1)
+        )
+
+        assert await find_duplicate_by_url("https://ra.co/events/123") is None
+        mock_search_url.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_sync_calendar_rebuilds_index(
+        self, mock_sync, duplicate_index, monkeypatch
+    ):
+        import main
+        from main import sync_calendar
+
+        event = self.make_event()
+        event.event_id = "42"
+        mock_sync.return_value = [event]
+        monkeypatch.setattr(
+            main.calendar_sync, "window_start", datetime.date(2024, 1, 1)
+        )
+
+        await sync_calendar()
+
+        assert duplicate_index.lookup(event.url).endswith("/events/42")
+
+    @pytest.mark.asyncio
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_shards_share_calendar_snapshot(
+        self, mock_sync, duplicate_index, monkeypatch, tmp_path
+    ):
+        """Test that a sharded sync is reused by other shards until refreshed"""
+        import main
+        from main import sync_calendar
+        from shared_state import SharedStateStore
+
+        monkeypatch.setattr(main, "is_sharded", lambda: True)
+        monkeypatch.setattr(
+            main, "shared_state", SharedStateStore(str(tmp_path / "shared.sqlite3"))
+        )
+        event = self.make_event()
+        event.event_id = "42"
+        mock_sync.return_value = [event]
+        monkeypatch.setattr(main.calendar_sync, "window_start", datetime.date.today())
+
+        await sync_calendar()
+        snapshot_events = await sync_calendar()
+        await sync_calendar(use_snapshot=False)
+
+        assert mock_sync.call_count == 2
+        assert snapshot_events[0].url == event.url
+        assert duplicate_index.lookup(event.url).endswith("/events/42")
+
+
+class TestCreateEventCommand:
+    def make_update(self, user_id, url="https://ra.co/events/123"):
+        update = MagicMock()
+        update.message.date = datetime.datetime.now(datetime.timezone.utc)
+        update.effective_user.id = user_id
+        update.effective_user.username = "raver"
+        update.effective_message.parse_entities.return_value = {MagicMock(): url}
+        update.effective_message.reply_text = AsyncMock()
+        return update
+
+    def make_event(self):
+        return Event(
+            title="Test Event",
+            start_time="2024-01-15T20:00:00",
+            end_time="2024-01-15T23:00:00",
+            location="Venue",
+            url="https://ra.co/events/123",
+            description="",
+        )
+
+    @pytest.mark.asyncio
+    @patch("main.create_calendar_event", new_callable=AsyncMock)
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    async def test_duplicate_found_cancels_provider_fetch(
+        self, mock_find_by_url, mock_create
+    ):
+        """Test that a duplicate hit cancels the in-flight provider fetch"""
+        import asyncio
+        from main import create_event_command
+        from text import duplicate_event_question_message
+
+        fetch_cancelled = asyncio.Event()
+
+        async def slow_fetch(url):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                fetch_cancelled.set()
+                raise
+
+        async def find_by_url(url):
+            await asyncio.sleep(0)
+            return "https://teamup.com/x/events/1"
+
+        mock_find_by_url.side_effect = find_by_url
+        update = self.make_update(9001)
+        context = MagicMock()
+        context.user_data = {}
+
+        with patch("main.process_ra_event", side_effect=slow_fetch):
+            await create_event_command(update, context)
+            await asyncio.wait_for(fetch_cancelled.wait(), 1)
+
+        reply = update.effective_message.reply_text.call_args.args[0]
+        assert reply.startswith(duplicate_event_question_message)
+        assert context.user_data["event_source"] == {
+            "domain": "ra.co",
+            "url": "https://ra.co/events/123",
+        }
+        mock_create.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    async def test_failed_duplicate_check_cancels_provider_fetch(
+        self, mock_find_by_url
+    ):
+        """Test that the provider fetch is cancelled when the duplicate check fails"""
+        import asyncio
+        from main import create_event_command
+
+        fetch_cancelled = asyncio.Event()
+
+        async def slow_fetch(url):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                fetch_cancelled.set()
+                raise
+
+        async def find_by_url(url):
+            await asyncio.sleep(0)
+            raise RuntimeError("calendar unavailable")
+
+        mock_find_by_url.side_effect = find_by_url
+        update = self.make_update(9003)
+        context = MagicMock()
+        context.user_data = {}
+
+        with patch("main.process_ra_event", side_effect=slow_fetch):
+            with pytest.raises(RuntimeError):
+                await create_event_command(update, context)
+            await asyncio.wait_for(fetch_cancelled.wait(), 1)
+
+    @pytest.mark.asyncio
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    async def test_cancelled_duplicate_check_cancels_provider_fetch(
+        self, mock_find_by_url
+    ):
+        """Test that cancelling the handler during the check cancels the fetch"""
+        import asyncio
+        from main import create_event_command
+
+        checking = asyncio.Event()
+        fetch_cancelled = asyncio.Event()
+
+        async def slow_fetch(url):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                fetch_cancelled.set()
+                raise
+
+        async def find_by_url(url):
+            checking.set()
+            await asyncio.sleep(10)
+
+        mock_find_by_url.side_effect = find_by_url
+        context = MagicMock()
+        context.user_data = {}
+
+        with patch("main.process_ra_event", side_effect=slow_fetch):
+            handler = asyncio.create_task(
+                create_event_command(self.make_update(9005), context)
+            )
+            await checking.wait()
+            handler.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await handler
+            await asyncio.wait_for(fetch_cancelled.wait(), 1)
+
+    @pytest.mark.asyncio
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    async def test_failed_fetch_after_duplicate_hit_is_retrieved(
+        self, mock_find_by_url
+    ):
+        """Test that a fetch that failed before the hit leaves no unretrieved error"""
+        import asyncio
+        import gc
+        from main import fetch_unless_duplicate
+
+        async def failing_fetch(url):
+            raise RuntimeError("ra.co unavailable")
+
+        async def find_by_url(url):
+            await asyncio.sleep(0.01)
+            return "https://teamup.com/x/events/1"
+
+        mock_find_by_url.side_effect = find_by_url
+        errors = []
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        try:
+            with patch("main.process_ra_event", side_effect=failing_fetch):
+                result = await fetch_unless_duplicate(
+                    "ra.co", "https://ra.co/events/123"
+                )
+            gc.collect()
+        finally:
+            loop.set_exception_handler(None)
+
+        assert result[:2] == (None, "https://teamup.com/x/events/1")
+        assert errors == []
+
+    @pytest.mark.asyncio
+    @patch("main.update_cache", new_callable=AsyncMock)
+    @patch("main.create_calendar_event", new_callable=AsyncMock)
+    @patch("main.find_duplicate", new_callable=AsyncMock)
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    @patch("main.process_ra_event", new_callable=AsyncMock)
+    async def test_fetch_and_duplicate_check_run_concurrently(
+        self, mock_fetch, mock_find_by_url, mock_find, mock_create, mock_update_cache
+    ):
+        """Test that the provider fetch starts before the duplicate check returns"""
+        from main import create_event_command
+        from text import event_created_message
+
+        event = self.make_event()
+        calls = []
+
+        async def fetch(url):
+            calls.append("fetch")
+            return event
+
+        async def find_by_url(url):
+            calls.append("duplicate check")
+            return None
+
+        mock_fetch.side_effect = fetch
+        mock_find_by_url.side_effect = find_by_url
+        mock_find.return_value = None
+        mock_create.return_value = True
+        update = self.make_update(9002)
+        context = MagicMock()
+        context.user_data = {}
+
+        await create_event_command(update, context)
+
+        assert sorted(calls) == ["duplicate check", "fetch"]
+        mock_create.assert_called_once_with(event)
+        update.effective_message.reply_text.assert_called_once_with(
+            event_created_message
+        )
+
+    @pytest.mark.asyncio
+    @patch("main.update_cache", new_callable=AsyncMock)
+    @patch("main.create_calendar_event", new_callable=AsyncMock)
+    @patch("main.process_ra_event", new_callable=AsyncMock)
+    async def test_confirm_after_early_duplicate_fetches_event(
+        self, mock_fetch, mock_create, mock_update_cache
+    ):
+        """Test that confirming a duplicate found before the fetch fetches it then"""
+        from main import button_click_handler
+        from text import event_created_message
+
+        event = self.make_event()
+        mock_fetch.return_value = event
+        mock_create.return_value = True
+        update = MagicMock()
+        update.callback_query.data = "duplicate_event_create"
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.edit_message_text = AsyncMock()
+        context = MagicMock()
+        context.user_data = {
+            "event_source": {"domain": "ra.co", "url": "https://ra.co/events/123"}
+        }
+
+        await button_click_handler(update, context)
+
+        mock_fetch.assert_called_once_with("https://ra.co/events/123")
+        mock_create.assert_called_once_with(event)
+        update.callback_query.edit_message_text.assert_called_once_with(
+            text=event_created_message
+        )
+
+    @pytest.mark.asyncio
+    @patch("main.update_cache", new_callable=AsyncMock)
+    @patch("main.create_calendar_event", new_callable=AsyncMock)
+    @patch("main.find_duplicate", new_callable=AsyncMock)
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    @patch("main.process_ra_event", new_callable=AsyncMock)
+    async def test_confirm_creates_event_from_latest_prompt(
+        self, mock_fetch, mock_find_by_url, mock_find, mock_create, mock_update_cache
+    ):
+        """Test that an unanswered earlier prompt's event is not created instead"""
+        from main import button_click_handler, create_event_command
+
+        stale = self.make_event()
+        latest = self.make_event()
+        latest.url = "https://ra.co/events/456"
+        mock_fetch.side_effect = [stale, latest]
+        mock_find_by_url.side_effect = [None, "https://teamup.com/x/events/2"]
+        mock_find.return_value = "https://teamup.com/x/events/1"
+        mock_create.return_value = True
+        context = MagicMock()
+        context.user_data = {}
+
+        await create_event_command(self.make_update(9004), context)
+        await create_event_command(
+            self.make_update(9004, url="https://ra.co/events/456"), context
+        )
+        update = MagicMock()
+        update.callback_query.data = "duplicate_event_create"
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.edit_message_text = AsyncMock()
+        await button_click_handler(update, context)
+
+        mock_create.assert_called_once_with(latest)
+        assert context.user_data == {}
+
+    @pytest.mark.asyncio
+    @patch("main.update_cache", new_callable=AsyncMock)
+    @patch("main.create_calendar_event", new_callable=AsyncMock)
+    @patch("main.find_duplicate", new_callable=AsyncMock)
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    @patch("main.process_ra_event", new_callable=AsyncMock)
+    async def test_several_urls_are_imported_with_one_summary(
+        self, mock_fetch, mock_find_by_url, mock_find, mock_create, mock_update_cache
+    ):
+        """Test that a message with several links creates each event once"""
+        import main
+        from main import create_event_command
+
+        async def fetch(url):
+            event = self.make_event()
+            event.url = url
+            event.title = url.rsplit("/", 1)[-1]
+            return event
+
+        async def find_by_url(url):
+            return "https://teamup.com/x/events/2" if url.endswith("/2") else None
+
+        mock_fetch.side_effect = fetch
+        mock_find_by_url.side_effect = find_by_url
+        mock_find.return_value = None
+        mock_create.return_value = True
+        update = self.make_update(9003)
+        update.effective_message.parse_entities.return_value = {
+            MagicMock(): "https://ra.co/events/1",
+            MagicMock(): "https://ra.co/events/2",
+            MagicMock(): "https://www.ra.co/events/1/",
+            MagicMock(): "https://example.com/events/3",
+        }
+        progress_message = MagicMock()
+        progress_message.edit_text = AsyncMock()
+        update.effective_message.reply_text.return_value = progress_message
+        context = MagicMock()
+        context.user_data = {}
+
+        await create_event_command(update, context)
+
+        mock_create.assert_called_once()
+        assert mock_create.call_args.args[0].url == "https://ra.co/events/1"
+        update.effective_message.reply_text.assert_called_once()
+        summary = progress_message.edit_text.call_args.args[0]
+        assert "Добавлено: 1" in summary
+        assert "уже были в календаре: 1" in summary
+        assert "не получилось: 1" in summary
+        assert "🔁 https://teamup.com/x/events/2" in summary
+        assert main.rate_limiter.allowed == {"createevent": 1}
+        mock_update_cache.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch("main.update_cache", new_callable=AsyncMock)
+    @patch("main.create_calendar_event", new_callable=AsyncMock)
+    @patch("main.find_duplicate", new_callable=AsyncMock)
+    @patch("main.find_duplicate_by_url", new_callable=AsyncMock)
+    @patch("main.process_ra_event", new_callable=AsyncMock)
+    async def test_bulk_import_respects_concurrency_cap(
+        self,
+        mock_fetch,
+        mock_find_by_url,
+        mock_find,
+        mock_create,
+        mock_update_cache,
+        monkeypatch,
+    ):
+        """Test that no more links than the cap are imported at once"""
+        import asyncio
+        from main import create_event_command
+
+        monkeypatch.setattr("main.EventImportConfiguration.max_concurrency", 2)
+        running = 0
+        peak = 0
+
+        async def fetch(url):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            event = self.make_event()
+            event.url = url
+            return event
+
+        mock_fetch.side_effect = fetch
+        mock_find_by_url.return_value = None
+        mock_find.return_value = None
+        mock_create.return_value = True
+        update = self.make_update(9004)
+        update.effective_message.parse_entities.return_value = {
+            MagicMock(): f"https://ra.co/events/{event_id}" for event_id in range(5)
+        }
+        progress_message = MagicMock()
+        progress_message.edit_text = AsyncMock()
+        update.effective_message.reply_text.return_value = progress_message
+        context = MagicMock()
+
+        await create_event_command(update, context)
+
+        assert peak == 2
+        assert mock_create.call_count == 5
+
+
+class TestOnboarding:
+    @pytest.mark.asyncio
+    async def test_guest_list_finds_member_welcomed_earlier(self):
+        """Test that /guestlist resolves the username recorded at join time"""
+        import main
+        from main import guest_list_command, new_member_welcome_command
+        from settings import BotConfiguration
+        from onboarding import ONBOARDING_KEY
+
+        member = MagicMock()
+        member.is_bot = False
+        member.id = 42
+        member.username = "Raver42"
+        member.first_name = "Raver"
+        member.last_name = None
+        join_update = MagicMock()
+        join_update.effective_chat.id = -100
+        join_update.effective_message.new_chat_members = [member]
+        join_update.effective_message.message_id = 6
+        context = MagicMock()
+        context.chat_data = {}
+        context.bot.send_message = AsyncMock(return_value=MagicMock(message_id=7))
+        context.bot.delete_message = AsyncMock()
+
+        await new_member_welcome_command(join_update, context)
+        await main.join_aggregator.flush(-100)
+
+        assert context.chat_data[ONBOARDING_KEY]["usernames"] == {"raver42": 42}
+        assert main.deadline_scheduler.due("warn_idle", -100, 42) is not None
+
+        command_update = MagicMock()
+        command_update.message.date = datetime.datetime.now(datetime.timezone.utc)
+        command_update.effective_user.id = BotConfiguration.admin_id
+        command_update.effective_chat.id = -100
+        command_update.effective_message.parse_entities.return_value = {
+            MagicMock(): "@raver42"
+        }
+        command_update.effective_message.reply_html = AsyncMock()
+
+        await guest_list_command(command_update, context)
+
+        command_update.effective_message.reply_html.assert_called_once()
+        context.bot.delete_message.assert_called_once_with(chat_id=-100, message_id=7)
+        assert context.chat_data[ONBOARDING_KEY] == {"members": {}, "usernames": {}}
+        assert len(main.deadline_scheduler) == 0
+
+    @staticmethod
+    def make_member(user_id: int, is_bot: bool = False):
+        member = MagicMock()
+        member.is_bot = is_bot
+        member.id = user_id
+        member.username = f"raver{user_id}"
+        member.first_name = f"Raver{user_id}"
+        member.last_name = None
+        return member
+
+    @pytest.mark.asyncio
+    async def test_batch_of_joins_gets_one_welcome(self, fresh_join_aggregator):
+        """Test that members joining together share one welcome and bots are skipped"""
+        from main import new_member_welcome_command, get_onboarding_store
+
+        context = MagicMock()
+        context.chat_data = {}
+        context.bot.send_message = AsyncMock(return_value=MagicMock(message_id=7))
+        for members in (
+            [self.make_member(1), self.make_member(99, True)],
+            [self.make_member(2)],
+        ):
+            update = MagicMock()
+            update.effective_chat.id = -100
+            update.effective_message.new_chat_members = members
+            await new_member_welcome_command(update, context)
+
+        context.bot.send_message.assert_not_called()
+        await fresh_join_aggregator.flush(-100)
+
+        context.bot.send_message.assert_called_once()
+        text = context.bot.send_message.call_args.kwargs["text"]
+        assert "Raver1" in text and "Raver2" in text and "Raver99" not in text
+        onboarding = get_onboarding_store(context)
+        assert onboarding.get(1)["welcome"] == onboarding.get(2)["welcome"] == 7
+        assert 99 not in onboarding
+
+    @pytest.mark.asyncio
+    async def test_shared_welcome_is_deleted_by_last_member(self):
+        """Test that a combined welcome stays until every member has left the queue"""
+        from main import clean_up_welcome_message, get_onboarding_store
+
+        context = MagicMock()
+        context.chat_data = {}
+        context.bot.delete_message = AsyncMock()
+        onboarding = get_onboarding_store(context)
+        onboarding.add(1, "Raver1", welcome_message_id=7)
+        onboarding.add(2, "Raver2", welcome_message_id=7)
+
+        await clean_up_welcome_message(context, -100, 1)
+        onboarding.pop(1)
+        context.bot.delete_message.assert_not_called()
+
+        await clean_up_welcome_message(context, -100, 2)
+        context.bot.delete_message.assert_called_once_with(chat_id=-100, message_id=7)
+
+    @pytest.mark.asyncio
+    async def test_shared_welcome_cleanup_does_not_warn(self):
+        """Test that held back or already deleted shared welcomes are not warnings"""
+        from telegram.error import BadRequest
+        from main import clean_up_welcome_message, get_onboarding_store
+
+        context = MagicMock()
+        context.chat_data = {}
+        context.bot.delete_message = AsyncMock(
+            side_effect=BadRequest("Message to delete not found")
+        )
+        onboarding = get_onboarding_store(context)
+        onboarding.add(1, "Raver1", welcome_message_id=7)
+        onboarding.add(2, "Raver2", welcome_message_id=7)
+
+        with patch("main.logger") as logger:
+            await clean_up_welcome_message(context, -100, 1)
+            onboarding.pop(1)
+            await clean_up_welcome_message(context, -100, 2)
+
+        context.bot.delete_message.assert_called_once_with(chat_id=-100, message_id=7)
+        logger.warning.assert_not_called()
+        logger.debug.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_join_flood_switches_to_short_welcome(self, fresh_join_aggregator):
+        """Test that a join burst above the threshold gets the flood welcome"""
+        from main import new_member_welcome_command
+        from text import flood_welcome_message
+
+        context = MagicMock()
+        context.chat_data = {}
+        context.bot.send_message = AsyncMock(return_value=MagicMock(message_id=7))
+        update = MagicMock()
+        update.effective_chat.id = -100
+        update.effective_message.new_chat_members = [
+            self.make_member(user_id) for user_id in range(1, 6)
+        ]
+
+        await new_member_welcome_command(update, context)
+        await fresh_join_aggregator.flush(-100)
+
+        text = context.bot.send_message.call_args.kwargs["text"]
+        assert text.startswith(flood_welcome_message.split("{name}")[0])
+        assert fresh_join_aggregator.flood_batches == 1
+
+    @pytest.mark.asyncio
+    async def test_warn_idle_schedules_kick(self):
+        """Test that the warning records its message and queues the kick deadline"""
+        import main
+        from main import get_onboarding_store, warn_idle
+
+        context = MagicMock()
+        context.chat_data = {}
+        context.bot.send_message = AsyncMock(return_value=MagicMock(message_id=9))
+        get_onboarding_store(context).add(42, "Raver")
+
+        await warn_idle(context, -100, 42)
+
+        assert get_onboarding_store(context).get(42)["warn"] == 9
+        assert main.deadline_scheduler.due("kick_idle", -100, 42) is not None
 
 
 class TestIsOldCommand:
@@ -454,12 +1471,12 @@ class TestIsOldCommand:
 
 class TestCommandHandlers:
     @pytest.mark.asyncio
-    @patch("main.get_events")
-    async def test_rave_command_basic(self, mock_get_events):
+    @patch("main.calendar_sync.sync", new_callable=AsyncMock)
+    async def test_rave_command_basic(self, mock_sync):
         """Test basic rave command execution"""
         from main import rave_command
 
-        mock_get_events.return_value = []
+        mock_sync.return_value = []
 
         update = MagicMock()
         update.message.date = datetime.datetime.now(datetime.timezone.utc)
@@ -467,8 +1484,6 @@ class TestCommandHandlers:
 
         context = MagicMock()
         context.bot.send_message = AsyncMock()
-        cache = Cache(datetime.datetime.now(), [])
-        context.chat_data = {"cache": cache}
 
         await rave_command(update, context)
 
@@ -506,6 +1521,26 @@ class TestCommandHandlers:
 
         context.bot.send_message.assert_called_once()
 
+    @pytest.mark.asyncio
+    async def test_calendar_command_is_rate_limited_per_chat(self, fresh_rate_limiter):
+        """Test that repeated /calendar in one chat is ignored once the bucket is empty"""
+        from main import calendar_command
+        from rate_limit import RateLimitPolicy
+
+        fresh_rate_limiter.policies = {"calendar": RateLimitPolicy("chat", 2, 60)}
+        context = MagicMock()
+        context.bot.send_message = AsyncMock()
+
+        for user_id in (1, 2, 3):
+            update = MagicMock()
+            update.message.date = datetime.datetime.now(datetime.timezone.utc)
+            update.effective_user.id = user_id
+            update.effective_chat.id = 12345
+            await calendar_command(update, context)
+
+        assert context.bot.send_message.call_count == 2
+        assert fresh_rate_limiter.limited == {"calendar": 1}
+
     @pytest.mark.asyncio
     async def test_set_command_configured_chat(self):
         """Test set_command when chat_id equals configured announcement chat"""
@@ -564,6 +1599,37 @@ class TestCommandHandlers:
         )
         context.job_queue.get_jobs_by_name.assert_not_called()
 
+    @pytest.mark.asyncio
+    async def test_traces_command_shows_slowest_trace_breakdown(self, monkeypatch):
+        import main
+        from main import traces_command
+        from tracing import Tracer, span
+
+        tracer = Tracer(history=10, max_spans=50)
+        monkeypatch.setattr(main, "tracer", tracer)
+        monkeypatch.setattr(main.BotConfiguration, "admin_id", 123456)
+        with tracer.trace("update /createevent"):
+            with span("handler.createevent"):
+                with span("http.teamup"):
+                    pass
+        with tracer.trace("update /rave"):
+            pass
+        tracer.recent[0].root.duration = 40
+
+        update = MagicMock()
+        update.message.date = datetime.datetime.now(datetime.timezone.utc)
+        update.effective_user.id = 123456
+        update.effective_message.reply_html = AsyncMock()
+
+        await traces_command(update, MagicMock())
+
+        text = update.effective_message.reply_html.call_args.args[0]
+        assert text.index("update /createevent</b> 40000 ms") < text.index(
+            "update /rave"
+        )
+        assert "\n• handler.createevent" in text
+        assert "\n  • http.teamup" in text
+
     @pytest.mark.asyncio
     async def test_status_command_reports_announcement_configuration(self, monkeypatch):
         import main
@@ -606,6 +1672,7 @@ class TestCommandHandlers:
         assert "📌 Announcement config: Enabled" in status_text
         assert "📌 Announcement job: Active" in status_text
         assert "📌 Announcement message: 222" in status_text
+        assert "🐌 Event loop lag: p50 0 ms, p95 0 ms, p99 0 ms" in status_text
         assert (
             "🧾 Last announcement update: success at 2026-06-05 10:00:00" in status_text
         )
@@ -637,6 +1704,10 @@ class TestCommandHandlers:
 
         status_text = update.effective_message.reply_html.call_args.args[0]
         assert "📌 Announcement config: Disabled" in status_text
+        assert "⚠️ Cache: Not initialized" in status_text
+        assert (
+            "📈 Cache stats: 0 hits, 0 stale hits, 0 misses, 0 refreshes" in status_text
+        )
         assert "📌 Announcement job: Inactive" in status_text
         assert "🧾 Last announcement update: Not recorded" in status_text
 
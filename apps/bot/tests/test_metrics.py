@@ -0,0 +1,168 @@
+import pytest
+
+import httpx
+
+from http_client import MeasuredTransport
+from metrics import (
+    MetricsRegistry,
+    MetricsServer,
+    external_request_duration,
+    external_requests,
+    get_endpoint,
+    handler_calls,
+    handler_duration,
+    observe_handler,
+)
+
+
+class TestMetricsRegistry:
+    def test_render_counter_and_histogram(self):
+        """Test that counters and histograms use the Prometheus text format"""
+        registry = MetricsRegistry(namespace="test")
+        counter = registry.counter("commands", "Commands.", ("command",))
+        histogram = registry.histogram(
+            "latency_seconds", "Latency.", ("command",), buckets=(0.1, 1)
+        )
+
+        counter.inc("rave")
+        counter.inc("rave")
+        histogram.observe(0.5, "rave")
+
+        output = registry.render()
+
+        assert "# TYPE test_commands counter" in output
+        assert 'test_commands_total{command="rave"} 2' in output
+        assert "# TYPE test_latency_seconds histogram" in output
+        assert 'test_latency_seconds_bucket{command="rave",le="0.1"} 0' in output
+        assert 'test_latency_seconds_bucket{command="rave",le="1"} 1' in output
+        assert 'test_latency_seconds_bucket{command="rave",le="+Inf"} 1' in output
+        assert 'test_latency_seconds_sum{command="rave"} 0.5' in output
+        assert 'test_latency_seconds_count{command="rave"} 1' in output
+
+    def test_callback_metrics_are_read_on_render(self):
+        """Test that callback metrics report the current value of their source"""
+        registry = MetricsRegistry(namespace="test")
+        state = {"hits": 1}
+        registry.gauge_callback(
+            "ratio", "Ratio.", lambda: {("events", "a"): 0.25}, ("cache", "kind")
+        )
+        registry.counter_callback("hits", "Hits.", lambda: state["hits"])
+
+        state["hits"] = 3
+        output = registry.render()
+
+        assert 'test_ratio{cache="events",kind="a"} 0.25' in output
+        assert "test_hits_total 3" in output
+
+    def test_broken_callback_is_skipped(self):
+        """Test that a failing callback does not hide the other metrics"""
+        registry = MetricsRegistry(namespace="test")
+        registry.gauge_callback("broken", "Broken.", lambda: 1 / 0)
+        registry.counter("ok", "OK.").inc()
+
+        output = registry.render()
+
+        assert "test_broken" not in output
+        assert "test_ok_total 1" in output
+
+    def test_label_values_are_escaped(self):
+        """Test that quotes and backslashes in label values are escaped"""
+        registry = MetricsRegistry(namespace="test")
+        registry.counter("errors", "Errors.", ("reason",)).inc('say "hi"\\')
+
+        assert 'test_errors_total{reason="say \\"hi\\"\\\\"} 1' in registry.render()
+
+    def test_registering_twice_returns_existing_counter(self):
+        """Test that a metric registered twice keeps its values"""
+        registry = MetricsRegistry(namespace="test")
+        first = registry.counter("calls", "Calls.")
+        first.inc()
+
+        assert registry.counter("calls", "Calls.") is first
+
+
+class TestObserveHandler:
+    @pytest.mark.asyncio
+    async def test_records_latency_and_outcome(self):
+        """Test that decorated handlers are timed and counted by outcome"""
+
+        @observe_handler("test_ok")
+        async def handler(update, context):
+            return "done"
+
+        @observe_handler("test_error")
+        async def failing(update, context):
+            raise RuntimeError("boom")
+
+        assert await handler(None, None) == "done"
+        with pytest.raises(RuntimeError):
+            await failing(None, None)
+
+        assert handler_duration.count("test_ok") == 1
+        assert handler_calls.get("test_ok", "ok") == 1
+        assert handler_calls.get("test_error", "error") == 1
+
+
+class TestMeasuredTransport:
+    @pytest.mark.asyncio
+    async def test_upstream_requests_are_counted_by_endpoint(self, monkeypatch):
+        """Test that upstream requests are recorded per provider and endpoint"""
+        graphql = ("ra", "POST /graphql", "2xx")
+        listing = ("teamup", "GET /{id}/events", "2xx")
+        creation = ("teamup", "POST /{id}/events", "error")
+        before = {
+            labels: external_requests.get(*labels)
+            for labels in (graphql, listing, creation)
+        }
+
+        async def handle(transport, request):
+            if request.method == "POST" and request.url.host == "api.teamup.com":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(200, request=request)
+
+        monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", handle)
+
+        async with httpx.AsyncClient(transport=MeasuredTransport()) as client:
+            response = await client.post("https://ra.co/graphql", json={})
+            await client.get("https://api.teamup.com/ks123/events?startDate=2024-01-15")
+            await client.get("https://api.teamup.com/ks123/events?startDate=2024-01-16")
+            with pytest.raises(httpx.ConnectError):
+                await client.post("https://api.teamup.com/ks123/events", json={})
+
+        assert response.status_code == 200
+        assert external_requests.get(*graphql) == before[graphql] + 1
+        assert external_requests.get(*listing) == before[listing] + 2
+        assert external_requests.get(*creation) == before[creation] + 1
+        assert external_request_duration.count("teamup", "GET /{id}/events") >= 2
+
+    def test_endpoint_replaces_ids_and_slugs(self):
+        """Test that IDs, slugs and calendar keys collapse into one template"""
+        assert get_endpoint("GET", "/events/123/ticket_types") == (
+            "GET /events/{id}/ticket_types"
+        )
+        assert get_endpoint("GET", "/event/abc-rave-2024") == "GET /event/{id}"
+        assert get_endpoint("PUT", "/ks123/events/456") == "PUT /{id}/events/{id}"
+
+
+class TestMetricsServer:
+    @pytest.mark.asyncio
+    async def test_serves_metrics(self):
+        """Test that GET /metrics returns the rendered registry"""
+        registry = MetricsRegistry(namespace="test")
+        registry.counter("scrapes", "Scrapes.").inc()
+        server = MetricsServer(registry, host="127.0.0.1", port=0)
+        await server.start()
+        try:
+            async with httpx.AsyncClient() as client:
+                url = f"http://127.0.0.1:{server.bound_port}"
+                response = await client.get(f"{url}/metrics")
+                missing = await client.get(f"{url}/other")
+                posted = await client.post(f"{url}/metrics")
+        finally:
+            await server.stop()
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "test_scrapes_total 1" in response.text
+        assert missing.status_code == 404
+        assert posted.status_code == 405
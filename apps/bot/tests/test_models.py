@@ -1,4 +1,6 @@
+import copy
 import datetime
+import pickle
 import pytest
 from models import Event, Cache
 
@@ -36,6 +38,7 @@ class TestEvent:
         )
 
         assert event.event_id is None
+        assert event.source_id is None
 
     def test_event_str_representation(self):
         """Test Event string representation"""
@@ -54,6 +57,72 @@ class TestEvent:
         assert "Test Venue" in result
         assert "https://example.com/event" in result
 
+    def test_event_stores_parsed_times(self):
+        """Test that times are kept as datetimes and exposed as ISO strings"""
+        event = Event(
+            title="Test Event",
+            start_time=datetime.datetime(2024, 1, 15, 20, 0),
+            end_time="2024-01-15T23:00:00",
+            location="Test Venue",
+            url="https://example.com/event",
+        )
+
+        assert event.start == datetime.datetime(2024, 1, 15, 20, 0)
+        assert event.end == datetime.datetime(2024, 1, 15, 23, 0)
+        assert event.start_time == "2024-01-15T20:00:00"
+        assert event.description == ""
+        assert not hasattr(event, "__dict__")
+
+    def test_event_line_is_rerendered_after_change(self):
+        """Test that the cached line is reused until a rendered field changes"""
+        event = Event(
+            title="Test Event",
+            start_time="2024-01-15T20:00:00",
+            end_time="2024-01-15T23:00:00",
+            location="Test Venue",
+            url="https://example.com/event",
+        )
+        line = event.line
+
+        assert event.line is line
+        event.start_time = "2024-01-16T20:00:00"
+        assert event.line.startswith("<b>16.01</b>")
+
+    def test_event_copy_and_pickle_round_trip(self):
+        """Test that slotted events can be copied and pickled"""
+        event = Event(
+            title="Test Event",
+            start_time="2024-01-15T20:00:00",
+            end_time="2024-01-15T23:00:00",
+            location="Test Venue",
+            url="https://example.com/event",
+            source_id="123",
+        )
+
+        for restored in (copy.copy(event), pickle.loads(pickle.dumps(event))):
+            assert restored.start == event.start
+            assert restored.source_id == "123"
+            assert str(restored) == str(event)
+
+    def test_event_restores_legacy_pickled_state(self):
+        """Test that events pickled before the model was slotted still load"""
+        event = Event.__new__(Event)
+        event.__setstate__(
+            {
+                "event_id": "1",
+                "title": "Old Event",
+                "start_time": "2024-01-15T20:00:00",
+                "end_time": "2024-01-15T23:00:00",
+                "location": "Venue",
+                "url": "https://example.com/event",
+                "description": "Old description",
+            }
+        )
+
+        assert event.start == datetime.datetime(2024, 1, 15, 20, 0)
+        assert event.source_id is None
+        assert "Old Event" in str(event)
+
 
 class TestCache:
     def test_cache_initialization(self):
@@ -0,0 +1,68 @@
+import pytest
+from unittest.mock import patch
+
+from onboarding import ONBOARDING_KEY, OnboardingStore
+
+
+class TestOnboardingStore:
+    def test_add_and_lookup_by_username(self):
+        """Test that members can be found by ID and case-insensitive username"""
+        chat_data = {}
+        store = OnboardingStore(chat_data, ttl_seconds=60, max_members=10)
+
+        store.add(42, "Raver", username="Raver42", welcome_message_id=7)
+
+        assert store.find_by_username("@raver42") == 42
+        assert store.get(42)["welcome"] == 7
+        assert len(OnboardingStore(chat_data)) == 1
+
+    def test_pop_removes_username_index(self):
+        chat_data = {}
+        store = OnboardingStore(chat_data, ttl_seconds=60, max_members=10)
+        store.add(42, "Raver", username="raver42")
+
+        store.pop(42)
+
+        assert store.find_by_username("@raver42") is None
+        assert chat_data[ONBOARDING_KEY] == {"members": {}, "usernames": {}}
+
+    def test_records_expire_after_ttl(self):
+        """Test that members whose timers were lost are evicted"""
+        store = OnboardingStore({}, ttl_seconds=60, max_members=10)
+        with patch("onboarding.time.time", return_value=1000):
+            store.add(42, "Raver", username="raver42")
+        with patch("onboarding.time.time", return_value=1061):
+            assert store.find_by_username("@raver42") is None
+            store.add(43, "Other")
+
+        assert len(store) == 1
+        assert store.usernames == {}
+
+    def test_store_is_bounded(self):
+        store = OnboardingStore({}, ttl_seconds=60, max_members=2)
+        for user_id, name, now in ((1, "One", 1), (2, "Two", 2), (3, "Three", 3)):
+            with patch("onboarding.time.time", return_value=now):
+                store.add(user_id, name, username=name.lower())
+
+        with patch("onboarding.time.time", return_value=4):
+            assert sorted(store.members) == [2, 3]
+            assert store.find_by_username("one") is None
+
+    def test_legacy_keys_are_migrated(self):
+        """Test that per-member keys from older versions move into the store"""
+        chat_data = {
+            "announcement_id": 111,
+            "welcome_42": 7,
+            "joined_42": 6,
+            "42": "Raver",
+            "@raver42": 42,
+            "@None": 43,
+            "43": "Gone",
+        }
+
+        store = OnboardingStore(chat_data, ttl_seconds=60, max_members=10)
+
+        assert set(chat_data) == {"announcement_id", ONBOARDING_KEY}
+        assert store.find_by_username("@raver42") == 42
+        assert store.get(42)["joined"] == 6
+        assert 43 not in store
@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+
+from telegram.error import RetryAfter
+
+from outbound import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_MODERATION,
+    OutboundRateLimiter,
+    Throttle,
+    outbound_priority,
+)
+
+
+def make_limiter(**kwargs):
+    settings = dict(
+        global_per_second=1000,
+        group_per_minute=60_000,
+        private_per_second=1000,
+        max_retries=2,
+    )
+    settings.update(kwargs)
+    return OutboundRateLimiter(**settings)
+
+
+async def send(limiter, endpoint="sendMessage", chat_id=-100, callback=None):
+    callback = callback or AsyncMock(return_value=True)
+    return await limiter.process_request(
+        callback, (), {}, endpoint, {"chat_id": chat_id}, None
+    )
+
+
+class TestThrottle:
+    @pytest.mark.asyncio
+    async def test_waiters_are_admitted_by_priority(self):
+        """Test that a moderation request overtakes queued background requests"""
+        throttle = Throttle(rate=100, capacity=1)
+        order = []
+
+        async def take(name, priority):
+            await throttle.acquire(priority)
+            order.append(name)
+
+        await throttle.acquire()
+        await asyncio.gather(
+            take("cleanup", PRIORITY_BACKGROUND),
+            take("reply", PRIORITY_INTERACTIVE),
+            take("ban", PRIORITY_MODERATION),
+        )
+
+        assert order == ["ban", "reply", "cleanup"]
+
+    @pytest.mark.asyncio
+    async def test_pause_holds_back_requests(self):
+        throttle = Throttle(rate=1000, capacity=5)
+        throttle.pause(0.05)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await throttle.acquire()
+
+        assert loop.time() - started >= 0.04
+
+
+class TestOutboundRateLimiter:
+    def test_priority_by_endpoint_and_context(self):
+        get_priority = OutboundRateLimiter.get_priority
+
+        assert get_priority("banChatMember", None) == PRIORITY_MODERATION
+        assert get_priority("sendMessage", None) == PRIORITY_INTERACTIVE
+        assert get_priority("deleteMessage", None) == PRIORITY_BACKGROUND
+        with outbound_priority(PRIORITY_BACKGROUND):
+            assert get_priority("editMessageText", None) == PRIORITY_BACKGROUND
+            assert get_priority("banChatMember", None) == PRIORITY_MODERATION
+        assert get_priority("sendMessage", {"priority": 0}) == 0
+
+    @pytest.mark.asyncio
+    async def test_retry_after_is_retried(self):
+        """Test that a flood wait pauses the chat and the request is sent again"""
+        limiter = make_limiter()
+        callback = AsyncMock(side_effect=[RetryAfter(0), {"ok": True}])
+
+        result = await send(limiter, callback=callback)
+
+        assert result == {"ok": True}
+        assert callback.call_count == 2
+        assert limiter.retries == 1
+        assert limiter.sent == 1
+
+    @pytest.mark.asyncio
+    async def test_retry_after_gives_up_after_max_retries(self):
+        limiter = make_limiter(max_retries=1)
+        callback = AsyncMock(side_effect=RetryAfter(0))
+
+        with pytest.raises(RetryAfter):
+            await send(limiter, callback=callback)
+
+        assert callback.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_group_rate_is_applied_per_chat(self):
+        """Test that a busy group queues while other chats are sent immediately"""
+        limiter = make_limiter(group_per_minute=60)
+        for _ in range(3):
+            await send(limiter, chat_id=-100)
+
+        queued = asyncio.create_task(send(limiter, chat_id=-100))
+        await asyncio.sleep(0.01)
+        assert limiter.queued[PRIORITY_INTERACTIVE] == 1
+        await send(limiter, chat_id=-200)
+        assert not queued.done()
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert limiter.queued[PRIORITY_INTERACTIVE] == 0
+
+    @pytest.mark.asyncio
+    async def test_moderation_is_not_held_by_a_full_group_bucket(self):
+        """Test that bans and deletes skip the per-chat message bucket"""
+        limiter = make_limiter(group_per_minute=1)
+        for _ in range(3):
+            await send(limiter, chat_id=-100)
+
+        await asyncio.wait_for(
+            send(limiter, endpoint="banChatMember", chat_id=-100), 0.1
+        )
+        await asyncio.wait_for(
+            send(limiter, endpoint="deleteMessage", chat_id=-100), 0.1
+        )
+
+        assert limiter.sent == 5
+
+    @pytest.mark.asyncio
+    async def test_edit_flood_wait_pauses_only_its_chat(self):
+        """Test that a flood wait on an edit does not hold back other chats"""
+        limiter = make_limiter()
+        edit = AsyncMock(side_effect=[RetryAfter(1), {"ok": True}])
+
+        edited = asyncio.create_task(
+            send(limiter, endpoint="editMessageText", chat_id=-100, callback=edit)
+        )
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(send(limiter, chat_id=-200), 0.1)
+
+        assert edit.call_count == 1
+        assert limiter._chats[-100].paused_until > limiter._chats[-200].paused_until
+        assert await edited == {"ok": True}
+        assert edit.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_idle_chat_buckets_are_evicted(self):
+        limiter = make_limiter()
+        for chat_id in range(1, 20):
+            await send(limiter, chat_id=chat_id)
+        await asyncio.sleep(0.01)
+
+        await send(limiter, chat_id=1000)
+
+        assert len(limiter._chats) < 19
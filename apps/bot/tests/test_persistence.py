@@ -0,0 +1,205 @@
+import datetime
+import pickle
+import sqlite3
+import threading
+import pytest
+
+from models import Event
+from persistence import SQLitePersistence, dump, load
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "bot_data.sqlite3"), str(tmp_path / "bot_data")
+
+
+def make_persistence(paths, **kwargs):
+    path, pickle_path = paths
+    return SQLitePersistence(path, legacy_pickle_path=pickle_path, **kwargs)
+
+
+class TestValueEncoding:
+    def test_round_trip_keeps_types(self):
+        """Test that tagged JSON restores non-JSON types"""
+        value = {
+            "timers": {-100123: True},
+            "joined": datetime.datetime(2024, 1, 15, 20, 0),
+            "pair": (1, "a"),
+            "ids": {1, 2},
+            "plain": {"__type__": "not a tag"},
+        }
+
+        assert load(dump(value)) == value
+
+    def test_round_trip_event(self):
+        """Test that events are stored field by field"""
+        event = Event(
+            title="Test Event",
+            start_time="2024-01-15T20:00:00",
+            end_time="2024-01-15T23:00:00",
+            location="Venue",
+            url="https://ra.co/events/1",
+            source_id="1",
+        )
+
+        restored = load(dump(event))
+
+        assert restored.start == event.start
+        assert restored.source_id == "1"
+        assert str(restored) == str(event)
+
+    def test_unsupported_values_are_rejected(self):
+        with pytest.raises(TypeError):
+            dump(object())
+
+
+class TestSQLitePersistence:
+    @pytest.mark.asyncio
+    async def test_chat_data_is_loaded_lazily(self, paths):
+        """Test that chat data is only read when a chat is first refreshed"""
+        persistence = make_persistence(paths)
+        await persistence.update_chat_data(1, {"announcement_id": 111})
+        await persistence.flush()
+
+        reopened = make_persistence(paths)
+        assert await reopened.get_chat_data() == {}
+
+        chat_data = {}
+        await reopened.refresh_chat_data(1, chat_data)
+
+        assert chat_data == {"announcement_id": 111}
+
+    @pytest.mark.asyncio
+    async def test_preloaded_chats_are_read_at_startup(self, paths):
+        persistence = make_persistence(paths)
+        await persistence.update_chat_data(-100, {"announcement_id": 111})
+        await persistence.flush()
+
+        reopened = make_persistence(paths, preload_chat_ids=[-100, None])
+
+        assert await reopened.get_chat_data() == {-100: {"announcement_id": 111}}
+
+    @pytest.mark.asyncio
+    async def test_only_changed_keys_are_written(self, paths):
+        """Test that unchanged keys are not rewritten and removed keys are deleted"""
+        persistence = make_persistence(paths)
+        chat_data = {"announcement_id": 111, "@raver": 42, "welcome_42": 7}
+        await persistence.update_chat_data(1, chat_data)
+        assert persistence.rows_written == 3
+
+        chat_data["announcement_id"] = 222
+        del chat_data["welcome_42"]
+        await persistence.update_chat_data(1, chat_data)
+        await persistence.update_chat_data(1, chat_data)
+
+        assert persistence.rows_written == 4
+        assert persistence.rows_deleted == 1
+        await persistence.flush()
+        reopened = make_persistence(paths)
+        restored = {}
+        await reopened.refresh_chat_data(1, restored)
+        assert restored == {"announcement_id": 222, "@raver": 42}
+
+    @pytest.mark.asyncio
+    async def test_update_before_load_keeps_stored_keys(self, paths):
+        """Test that writing a chat that was never read does not lose its data"""
+        persistence = make_persistence(paths)
+        await persistence.update_chat_data(1, {"announcement_id": 111})
+        await persistence.flush()
+
+        reopened = make_persistence(paths)
+        await reopened.update_chat_data(1, {"welcome_42": 7})
+        await reopened.flush()
+
+        restored = {}
+        await make_persistence(paths).refresh_chat_data(1, restored)
+        assert restored == {"announcement_id": 111, "welcome_42": 7}
+
+    @pytest.mark.asyncio
+    async def test_unsupported_value_is_skipped(self, paths):
+        persistence = make_persistence(paths)
+
+        await persistence.update_bot_data({"ok": 1, "bad": object()})
+
+        assert await make_persistence(paths).get_bot_data() == {"ok": 1}
+
+    @pytest.mark.asyncio
+    async def test_value_that_fails_to_encode_keeps_stored_row(self, paths):
+        """Test that a key whose new value cannot be encoded is not deleted"""
+        persistence = make_persistence(paths)
+        await persistence.update_bot_data({"ok": 1, "settings": {"limit": 3}})
+
+        await persistence.update_bot_data({"ok": 2, "settings": object()})
+
+        assert persistence.rows_deleted == 0
+        assert await make_persistence(paths).get_bot_data() == {
+            "ok": 2,
+            "settings": {"limit": 3},
+        }
+
+    @pytest.mark.asyncio
+    async def test_drop_chat_data_removes_rows(self, paths):
+        persistence = make_persistence(paths)
+        await persistence.update_chat_data(1, {"announcement_id": 111})
+
+        await persistence.drop_chat_data(1)
+
+        restored = {}
+        await make_persistence(paths).refresh_chat_data(1, restored)
+        assert restored == {}
+
+    @pytest.mark.asyncio
+    async def test_database_is_used_off_the_event_loop(self, paths, monkeypatch):
+        """Test that SQLite is opened and written from the worker thread"""
+        threads = []
+        connect = sqlite3.connect
+
+        def recording_connect(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return connect(*args, **kwargs)
+
+        monkeypatch.setattr(sqlite3, "connect", recording_connect)
+        persistence = make_persistence(paths)
+        await persistence.update_chat_data(1, {"announcement_id": 111})
+        await persistence.flush()
+
+        assert threads and threading.get_ident() not in threads
+
+    @pytest.mark.asyncio
+    async def test_database_uses_wal_mode(self, paths):
+        persistence = make_persistence(paths)
+        await persistence.get_bot_data()
+
+        connection = sqlite3.connect(paths[0])
+        mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+        connection.close()
+
+        assert mode == "wal"
+
+    @pytest.mark.asyncio
+    async def test_pickle_file_is_migrated_once(self, paths):
+        """Test that an existing PicklePersistence file is imported on first start"""
+        _, pickle_path = paths
+        legacy = {
+            "bot_data": {"update_timers": {-100: True}},
+            "chat_data": {-100: {"announcement_id": 111, "cache": ["stale"]}},
+            "user_data": {42: {"new_member": True}},
+            "conversations": {},
+            "callback_data": None,
+        }
+        with open(pickle_path, "wb") as file:
+            pickle.dump(legacy, file)
+
+        persistence = make_persistence(paths)
+        assert await persistence.get_bot_data() == {"update_timers": {-100: True}}
+        chat_data = {}
+        await persistence.refresh_chat_data(-100, chat_data)
+        user_data = {}
+        await persistence.refresh_user_data(42, user_data)
+
+        assert chat_data == {"announcement_id": 111}
+        assert user_data == {"new_member": True}
+
+        await persistence.update_bot_data({})
+        await persistence.flush()
+        assert await make_persistence(paths).get_bot_data() == {}
@@ -1,17 +1,139 @@
 import pytest
-from unittest.mock import patch, mock_open, MagicMock
+import asyncio
+import os
+from unittest.mock import patch, MagicMock, AsyncMock
 import json
-from ra import get_ra_event, process_ra_event
+from fetch_cache import provider_cache
+from ra import (
+    QueryTemplate,
+    RaEventLoader,
+    get_ra_event,
+    get_ra_events,
+    process_ra_event,
+)
+
+TEMPLATE = {
+    "operationName": "GET_EVENT",
+    "variables": {"id": "__ID__"},
+    "query": "query GET_EVENT($id: ID!) { event(id: $id) { id title venue { name } }}",
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_provider_cache():
+    provider_cache.clear()
+    yield
+    provider_cache.clear()
+
+
+@pytest.fixture
+def query_template(tmp_path, monkeypatch):
+    path = tmp_path / "template.json"
+    path.write_text(json.dumps(TEMPLATE))
+    template = QueryTemplate(str(path))
+    monkeypatch.setattr("ra.query_template", template)
+    return template
+
+
+def ra_response(data):
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = data
+    return response
+
+
+class TestQueryTemplate:
+    def test_template_is_read_once(self, query_template):
+        """Test that an unchanged template file is not re-read"""
+        assert query_template.load()
+
+        with patch("ra.open") as mock_open:
+            assert query_template.load()
+
+        mock_open.assert_not_called()
+        assert query_template.selection == "{ id title venue { name } }"
+
+    def test_template_reloads_when_file_changes(self, query_template):
+        """Test that a new mtime triggers a reload"""
+        query_template.load()
+        updated = dict(
+            TEMPLATE, query=TEMPLATE["query"].replace("title", "title content")
+        )
+        with open(query_template.path, "w") as file:
+            json.dump(updated, file)
+        stat = os.stat(query_template.path)
+        os.utime(query_template.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        assert query_template.load()
+
+        assert query_template.selection == "{ id title content venue { name } }"
+
+    def test_invalid_template_keeps_last_good_one(self, query_template):
+        """Test that a broken edit does not replace a valid template"""
+        query_template.load()
+        with open(query_template.path, "w") as file:
+            file.write('{"query": "query { other }", "variables": {}}')
+        stat = os.stat(query_template.path)
+        os.utime(query_template.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        assert query_template.load()
+        assert query_template.payload == TEMPLATE
+
+    def test_missing_template_fails_to_load(self, tmp_path):
+        """Test that a missing template file is reported"""
+        assert not QueryTemplate(str(tmp_path / "missing.json")).load()
+
+    def test_batch_aliases_each_event(self, query_template):
+        """Test that a batch query selects each event under its own alias"""
+        query_template.load()
+
+        payload, aliases = query_template.batch(["1", "2"])
+
+        assert aliases == {"e0": "1", "e1": "2"}
+        assert payload["variables"] == {"id0": "1", "id1": "2"}
+        assert payload["query"] == (
+            "query GET_EVENTS($id0: ID!, $id1: ID!) { "
+            "e0: event(id: $id0) { id title venue { name } } "
+            "e1: event(id: $id1) { id title venue { name } } }"
+        )
+
+
+class TestGetRaEvents:
+    @pytest.mark.usefixtures("query_template")
+    @patch("ra.http_client.post", new_callable=AsyncMock)
+    async def test_get_ra_events_uses_one_request(self, mock_post):
+        """Test that several IDs are resolved by one aliased request"""
+        mock_post.return_value = ra_response(
+            {"data": {"e0": {"title": "One"}, "e1": None}}
+        )
+
+        result = await get_ra_events(["1", "2"])
+
+        assert result == {"1": {"title": "One"}, "2": None}
+        mock_post.assert_called_once()
+
+    @pytest.mark.usefixtures("query_template")
+    @patch("ra.http_client.post", new_callable=AsyncMock)
+    async def test_loader_coalesces_concurrent_lookups(self, mock_post):
+        """Test that lookups made together share one batched request"""
+        mock_post.return_value = ra_response(
+            {"data": {"e0": {"title": "One"}, "e1": {"title": "Two"}}}
+        )
+        loader = RaEventLoader()
+
+        results = await asyncio.gather(
+            loader.load("1"), loader.load("2"), loader.load("1")
+        )
+
+        assert [result["title"] for result in results] == ["One", "Two", "One"]
+        mock_post.assert_called_once()
+        assert loader.batches == 1
 
 
 class TestGetRaEvent:
-    @patch(
-        "ra.open",
-        new_callable=mock_open,
-        read_data='{"query": "test", "variables": {}}',
-    )
-    @patch("ra.requests.post")
-    def test_get_ra_event_success(self, mock_post, mock_file):
+    @pytest.mark.usefixtures("query_template")
+    @patch("ra.http_client.post", new_callable=AsyncMock)
+    async def test_get_ra_event_success(self, mock_post):
         """Test successful RA event retrieval"""
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -28,47 +150,37 @@ class TestGetRaEvent:
         }
         mock_post.return_value = mock_response
 
-        result = get_ra_event("12345")
+        result = await get_ra_event("12345")
 
         assert result["title"] == "Test Event"
         assert result["content"] == "Test description"
         assert mock_post.called
 
-    @patch(
-        "ra.open",
-        new_callable=mock_open,
-        read_data='{"query": "test", "variables": {}}',
-    )
-    @patch("ra.requests.post")
-    def test_get_ra_event_http_error(self, mock_post, mock_file):
+    @pytest.mark.usefixtures("query_template")
+    @patch("ra.http_client.post", new_callable=AsyncMock)
+    async def test_get_ra_event_http_error(self, mock_post):
         """Test RA event retrieval with HTTP error"""
-        import requests
+        import httpx
 
         mock_response = MagicMock()
         mock_response.status_code = 404
-        mock_response.raise_for_status.side_effect = (
-            requests.exceptions.RequestException("Not found")
-        )
+        mock_response.raise_for_status.side_effect = httpx.HTTPError("Not found")
         mock_post.return_value = mock_response
 
-        result = get_ra_event("12345")
+        result = await get_ra_event("12345")
 
         assert result is None
 
-    @patch(
-        "ra.open",
-        new_callable=mock_open,
-        read_data='{"query": "test", "variables": {}}',
-    )
-    @patch("ra.requests.post")
-    def test_get_ra_event_no_data(self, mock_post, mock_file):
+    @pytest.mark.usefixtures("query_template")
+    @patch("ra.http_client.post", new_callable=AsyncMock)
+    async def test_get_ra_event_no_data(self, mock_post):
         """Test RA event retrieval with no data in response"""
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {"errors": ["Some error"]}
         mock_post.return_value = mock_response
 
-        result = get_ra_event("12345")
+        result = await get_ra_event("12345")
 
         assert result is None
 
@@ -79,7 +191,7 @@ class TestProcessRaEvent:
         """Test processing RA event with valid URL"""
         url = "https://ra.co/events/12345"
 
-        with patch("ra.get_ra_event") as mock_get:
+        with patch("ra.get_ra_event", new_callable=AsyncMock) as mock_get:
             mock_get.return_value = {
                 "title": "Test Event",
                 "content": "Test description",
@@ -112,9 +224,29 @@ class TestProcessRaEvent:
         """Test processing RA event when API returns no data"""
         url = "https://ra.co/events/12345"
 
-        with patch("ra.get_ra_event") as mock_get:
+        with patch("ra.get_ra_event", new_callable=AsyncMock) as mock_get:
             mock_get.return_value = None
 
             event = await process_ra_event(url)
 
             assert event is None
+
+    @pytest.mark.asyncio
+    async def test_process_ra_event_reuses_cached_event(self):
+        """Test that a repeated link is served from the provider cache"""
+        with patch("ra.get_ra_event", new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = {
+                "title": "Test Event",
+                "content": "Test description",
+                "startTime": "2024-01-15T20:00:00.000",
+                "endTime": "2024-01-15T23:00:00.000",
+                "venue": {"name": "Test Venue"},
+            }
+
+            first = await process_ra_event("https://ra.co/events/12345")
+            second = await process_ra_event("https://ra.co/events/12345?ref=share")
+
+            mock_get.assert_called_once_with("12345")
+            assert second.title == "Test Event"
+            assert second.url == "https://ra.co/events/12345?ref=share"
+            assert first.url == "https://ra.co/events/12345"
@@ -0,0 +1,90 @@
+import pytest
+from unittest.mock import patch
+
+from rate_limit import RateLimiter, RateLimitPolicy, parse_policies
+
+
+def make_limiter(**policies):
+    return RateLimiter(
+        {command: RateLimitPolicy(*policy) for command, policy in policies.items()}
+    )
+
+
+class TestParsePolicies:
+    def test_parses_scope_capacity_and_period(self):
+        policies = parse_policies("createevent=user:3/60, /rave=chat:2/30")
+
+        assert set(policies) == {"createevent", "rave"}
+        assert policies["createevent"].scope == "user"
+        assert policies["rave"].capacity == 2
+        assert policies["rave"].period_seconds == 30
+
+    def test_invalid_entries_are_skipped(self):
+        policies = parse_policies("rave=room:2/30,calendar=chat:x/60,,help=chat:1/5")
+
+        assert set(policies) == {"help"}
+
+
+class TestRateLimiter:
+    @pytest.mark.asyncio
+    async def test_bucket_empties_and_refills(self):
+        """Test that a key is limited after its capacity and recovers over time"""
+        limiter = make_limiter(createevent=("user", 3, 60))
+
+        with patch("rate_limit.time.monotonic", return_value=100.0):
+            results = [await limiter.check("createevent", user_id=1) for _ in range(4)]
+        assert results == [True, True, True, False]
+
+        with patch("rate_limit.time.monotonic", return_value=120.0):
+            assert await limiter.check("createevent", user_id=1) is True
+            assert await limiter.check("createevent", user_id=1) is False
+
+        assert limiter.allowed == {"createevent": 4}
+        assert limiter.limited == {"createevent": 2}
+
+    @pytest.mark.asyncio
+    async def test_chat_scope_is_shared_by_users(self):
+        limiter = make_limiter(rave=("chat", 1, 60))
+
+        assert await limiter.check("rave", user_id=1, chat_id=-100) is True
+        assert await limiter.check("rave", user_id=2, chat_id=-100) is False
+        assert await limiter.check("rave", user_id=2, chat_id=-200) is True
+
+    @pytest.mark.asyncio
+    async def test_commands_without_policy_are_not_limited(self):
+        limiter = make_limiter()
+
+        assert all([await limiter.check("help", user_id=1) for _ in range(10)])
+        assert len(limiter) == 0
+
+    @pytest.mark.asyncio
+    async def test_idle_buckets_are_evicted(self):
+        """Test that buckets idle for a full period are dropped"""
+        limiter = make_limiter(createevent=("user", 3, 60))
+
+        with patch("rate_limit.time.monotonic", return_value=100.0):
+            for user_id in range(50):
+                await limiter.check("createevent", user_id=user_id)
+        assert len(limiter) == 50
+
+        with patch("rate_limit.time.monotonic", return_value=200.0):
+            await limiter.check("createevent", user_id=1000)
+
+        assert len(limiter) == 1
+        assert limiter.evicted == 50
+
+    @pytest.mark.asyncio
+    async def test_shared_store_buckets(self, tmp_path):
+        """Test that limiters backed by one store share their buckets"""
+        from shared_state import SharedStateStore
+
+        path = str(tmp_path / "shared_state.sqlite3")
+        policies = {"rave": RateLimitPolicy("chat", 2, 60)}
+        first = RateLimiter(policies, store=SharedStateStore(path))
+        second = RateLimiter(policies, store=SharedStateStore(path))
+
+        assert await first.check("rave", chat_id=-100) is True
+        assert await second.check("rave", chat_id=-100) is True
+        assert await first.check("rave", chat_id=-100) is False
+        assert first.limited == {"rave": 1}
+        assert len(first) == 0
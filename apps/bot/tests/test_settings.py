@@ -68,3 +68,12 @@ def test_announcement_configuration_malformed_integer_raises_value_error(monkeyp
 
     with pytest.raises(ValueError):
         reload_settings(monkeypatch, interval="not-a-number")
+
+
+def test_concurrency_configuration_parses_environment(monkeypatch):
+    monkeypatch.setenv("CONCURRENT_UPDATES", "16")
+    monkeypatch.setenv("MAX_PENDING_UPDATES", "512")
+    settings = reload_settings(monkeypatch)
+
+    assert settings.ConcurrencyConfiguration.max_concurrent_updates == 16
+    assert settings.ConcurrencyConfiguration.max_pending_updates == 512
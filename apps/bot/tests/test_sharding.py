@@ -0,0 +1,115 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+from telegram.ext import ApplicationHandlerStop
+
+import sharding
+from sharding import HashRing, ShardRouter, get_update_chat_id
+
+
+@pytest.fixture
+def two_shards(monkeypatch):
+    monkeypatch.setattr(sharding.ShardConfiguration, "count", 2)
+    monkeypatch.setattr(sharding.ShardConfiguration, "index", 0)
+    monkeypatch.setattr(sharding, "shard_ring", HashRing(2))
+
+
+class TestHashRing:
+    def test_chats_are_spread_over_shards(self):
+        ring = HashRing(4)
+
+        counts = [0] * 4
+        for chat_id in range(-1000, 0):
+            counts[ring.get_shard(chat_id)] += 1
+
+        assert all(count > 100 for count in counts)
+
+    def test_adding_a_shard_moves_few_chats(self):
+        """Test that growing the ring keeps most chats on their shard"""
+        before, after = HashRing(4), HashRing(5)
+
+        moved = sum(
+            before.get_shard(chat_id) != after.get_shard(chat_id)
+            for chat_id in range(1000)
+        )
+
+        assert moved < 400
+
+
+class TestUpdateRouting:
+    def test_chat_id_is_taken_from_the_update(self):
+        assert get_update_chat_id({"message": {"chat": {"id": -100}}}) == -100
+        assert (
+            get_update_chat_id(
+                {"callback_query": {"message": {"chat": {"id": -200}}, "from": {}}}
+            )
+            == -200
+        )
+        assert get_update_chat_id({"inline_query": {"from": {"id": 42}}}) == 42
+        assert get_update_chat_id({"update_id": 1}) is None
+
+    @pytest.mark.asyncio
+    async def test_router_forwards_to_owning_shard(self):
+        router = ShardRouter(["http://w0/telegram", "http://w1/telegram"], "secret")
+        update = {"update_id": 1, "message": {"chat": {"id": -100}}}
+
+        with patch("sharding.http_client.post", new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = MagicMock(status_code=200)
+            assert await router.dispatch(update) == 200
+
+        shard = router.ring.get_shard(-100)
+        assert mock_post.call_args.args[0] == router.worker_urls[shard]
+        assert mock_post.call_args.kwargs["json"] == update
+        assert router.forwarded[shard] == 1
+
+    @pytest.mark.asyncio
+    async def test_unreachable_shard_returns_bad_gateway(self):
+        router = ShardRouter(["http://w0/telegram"], "secret")
+
+        with patch("sharding.http_client.post", new_callable=AsyncMock) as mock_post:
+            mock_post.side_effect = httpx.ConnectError("refused")
+            assert await router.dispatch({"update_id": 1}) == 502
+
+
+class TestShardOwnership:
+    def test_single_process_owns_everything(self):
+        assert sharding.owns_chat(-100)
+        assert sharding.shard_key("onboarding_deadlines") == "onboarding_deadlines"
+
+    def test_shard_keys_and_ownership(self, two_shards):
+        owned = [chat_id for chat_id in range(-50, 0) if sharding.owns_chat(chat_id)]
+
+        assert 0 < len(owned) < 50
+        assert sharding.shard_key("onboarding_deadlines") == (
+            "onboarding_deadlines_shard0"
+        )
+
+    @pytest.mark.asyncio
+    async def test_foreign_updates_are_dropped(self, two_shards):
+        from telegram import Update
+
+        foreign = next(c for c in range(-50, 0) if not sharding.owns_chat(c))
+        update = MagicMock(spec=Update)
+        update.update_id = 1
+        update.effective_chat.id = foreign
+
+        with pytest.raises(ApplicationHandlerStop):
+            await sharding.drop_foreign_update(update, MagicMock())
+
+    @pytest.mark.asyncio
+    async def test_admin_values_use_shared_store_when_sharded(
+        self, two_shards, tmp_path
+    ):
+        from shared_state import SharedStateStore
+
+        store = SharedStateStore(str(tmp_path / "shared.sqlite3"))
+        bot_data = {}
+        with patch("sharding.shared_state", store):
+            await sharding.update_admin_value(
+                bot_data, "update_timers", lambda timers: {**timers, -100: True}, {}
+            )
+            assert await sharding.get_admin_value(bot_data, "update_timers") == {
+                -100: True
+            }
+        assert bot_data == {}
@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+import sqlite3
+import time
+import pytest
+from unittest.mock import patch
+
+from shared_state import SharedStateStore
+
+
+def make_store(tmp_path):
+    return SharedStateStore(str(tmp_path / "shared_state.sqlite3"))
+
+
+class TestSharedStateStore:
+    @pytest.mark.asyncio
+    async def test_values_round_trip_between_connections(self, tmp_path):
+        """Test that a value written by one shard is read by another"""
+        writer = make_store(tmp_path)
+        await writer.put("calendar", {"window_start": datetime.date(2024, 1, 15)})
+
+        reader = make_store(tmp_path)
+
+        assert await reader.get("calendar") == {
+            "window_start": datetime.date(2024, 1, 15)
+        }
+        assert await reader.get("missing", "default") == "default"
+
+    @pytest.mark.asyncio
+    async def test_expired_values_are_ignored(self, tmp_path):
+        store = make_store(tmp_path)
+        with patch("shared_state.time.time", return_value=1000.0):
+            await store.put("lease", "shard-1", ttl_seconds=10)
+            assert await store.get("lease") == "shard-1"
+
+        with patch("shared_state.time.time", return_value=1011.0):
+            assert await store.get("lease") is None
+
+    @pytest.mark.asyncio
+    async def test_update_applies_change_to_stored_value(self, tmp_path):
+        first, second = make_store(tmp_path), make_store(tmp_path)
+
+        await first.update("timers", lambda timers: {**timers, -100: True}, default={})
+        await second.update("timers", lambda timers: {**timers, -200: True}, default={})
+
+        assert await first.get("timers") == {-100: True, -200: True}
+
+    @pytest.mark.asyncio
+    async def test_take_token_is_shared(self, tmp_path):
+        """Test that shards draw from one bucket"""
+        first, second = make_store(tmp_path), make_store(tmp_path)
+
+        with patch("shared_state.time.time", return_value=1000.0):
+            results = [
+                await store.take_token("rate:rave:-100", 3, 3 / 60)
+                for store in (first, second, first, second)
+            ]
+        assert results == [True, True, True, False]
+
+        with patch("shared_state.time.time", return_value=1020.0):
+            assert await second.take_token("rate:rave:-100", 3, 3 / 60) is True
+
+    @pytest.mark.asyncio
+    async def test_locked_store_does_not_block_the_loop(self, tmp_path):
+        """Test that waiting for another shard's write lock happens off the loop"""
+        store = make_store(tmp_path)
+        await store.put("warm", True)
+        other = sqlite3.connect(str(tmp_path / "shared_state.sqlite3"))
+        other.isolation_level = None
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            taking = asyncio.create_task(store.take_token("rate:rave:-100", 3, 3 / 60))
+            start = time.monotonic()
+            await asyncio.sleep(0.05)
+            assert time.monotonic() - start < 0.5
+            assert not taking.done()
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+
+        assert await taking is True
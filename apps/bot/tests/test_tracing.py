@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import pytest
+from unittest.mock import MagicMock
+
+from telegram import Update
+
+from tracing import Tracer, describe_update, span, traced
+from utils import JsonFormatter, correlation_id
+
+
+class TestSpans:
+    def test_spans_outside_a_trace_are_skipped(self):
+        """Test that span() is a no-op when no update is being traced"""
+        with span("idle") as current:
+            assert current is None
+
+    @pytest.mark.asyncio
+    async def test_nested_spans_record_their_parent(self):
+        """Test that spans nest, including across tasks created inside them"""
+        tracer = Tracer(history=10, max_spans=50)
+
+        @traced("fetch")
+        async def fetch():
+            with span("http.ra", path="/graphql"):
+                await asyncio.sleep(0)
+
+        with tracer.trace("update /createevent") as trace:
+            with span("handler.createevent") as handler:
+                await asyncio.create_task(fetch())
+
+        names = {item.name: item for item in trace.spans}
+        assert names["handler.createevent"].parent_id == trace.root.span_id
+        assert names["fetch"].parent_id == handler.span_id
+        assert names["http.ra"].parent_id == names["fetch"].span_id
+        assert names["http.ra"].attributes == {"path": "/graphql"}
+        assert all(item.duration is not None for item in trace.spans)
+
+    @pytest.mark.asyncio
+    async def test_tasks_outliving_the_trace_add_no_spans(self):
+        """Test that a background task does not add spans to a recorded trace"""
+        tracer = Tracer(history=10, max_spans=50)
+        finished = asyncio.Event()
+
+        async def background():
+            await finished.wait()
+            with span("flush") as current:
+                return current
+
+        with tracer.trace("update join") as trace:
+            task = asyncio.create_task(background())
+        finished.set()
+
+        assert await task is None
+        assert [item.name for item in trace.spans] == ["update join"]
+
+    def test_errors_are_recorded_on_the_span(self):
+        """Test that an exception leaving a span is noted and re-raised"""
+        tracer = Tracer(history=10, max_spans=50)
+
+        with pytest.raises(ValueError):
+            with tracer.trace("update"):
+                with span("broken"):
+                    raise ValueError("boom")
+
+        trace = tracer.recent[-1]
+        assert trace.spans[1].error == "ValueError"
+        assert trace.root.error == "ValueError"
+
+    def test_spans_beyond_the_limit_are_dropped(self):
+        """Test that a trace keeps at most max_spans spans"""
+        tracer = Tracer(history=10, max_spans=3)
+
+        with tracer.trace("update") as trace:
+            for _ in range(5):
+                with span("step"):
+                    pass
+
+        assert len(trace.spans) == 3
+        assert trace.to_dict()["dropped_spans"] == 3
+
+
+class TestTracer:
+    def test_correlation_id_is_set_during_the_trace(self):
+        """Test that log records inside a trace carry its correlation ID"""
+        tracer = Tracer(history=10, max_spans=50)
+
+        with tracer.trace("update") as trace:
+            assert correlation_id.get() == trace.correlation_id
+
+        assert correlation_id.get() is None
+
+    def test_slowest_returns_longest_recent_traces(self):
+        """Test that only the most recent traces are kept, slowest first"""
+        tracer = Tracer(history=3, max_spans=50)
+        for duration in (5, 1, 3, 2):
+            with tracer.trace(f"update {duration}") as trace:
+                pass
+            trace.root.duration = duration
+
+        assert [trace.name for trace in tracer.slowest(2)] == [
+            "update 3",
+            "update 2",
+        ]
+
+    def test_finished_trace_is_logged_with_spans(self):
+        """Test that the trace record carries every span as structured fields"""
+        tracer = Tracer(history=10, max_spans=50)
+        records = []
+        handler = logging.Handler()
+        handler.emit = lambda record: records.append(JsonFormatter().format(record))
+        logger = logging.getLogger("utils")
+        logger.addHandler(handler)
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            with tracer.trace("update /rave", chat_id=-100) as trace:
+                with span("handler.rave"):
+                    pass
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+
+        output = json.loads(records[-1])
+        assert output["correlation_id"] == trace.correlation_id
+        assert output["trace"]["name"] == "update /rave"
+        assert [item["name"] for item in output["trace"]["spans"]] == [
+            "update /rave",
+            "handler.rave",
+        ]
+        assert output["trace"]["spans"][0]["attributes"] == {"chat_id": -100}
+
+
+class TestDescribeUpdate:
+    def test_command_updates_are_named_by_command(self):
+        """Test that command updates are named after the command without the bot"""
+        update = MagicMock(spec=Update)
+        update.update_id = 7
+        update.effective_chat.id = -100
+        update.effective_user.id = 1
+        update.callback_query = None
+        update.effective_message.text = "/createevent@ravebot https://ra.co/events/1"
+
+        name, attributes = describe_update(update)
+
+        assert name == "update /createevent"
+        assert attributes == {"update_id": 7, "chat_id": -100, "user_id": 1}
@@ -0,0 +1,210 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from telegram import Update
+
+from tracing import tracer
+from update_processor import (
+    ChatOrderedUpdateProcessor,
+    PriorityGate,
+    TracedUpdateProcessor,
+    PRIORITY_ADMIN,
+    PRIORITY_DEFAULT,
+)
+
+
+def make_update(chat_id, user_id=1, text="hello"):
+    update = MagicMock(spec=Update)
+    update.effective_chat.id = chat_id
+    update.effective_user.id = user_id
+    update.effective_message.text = text
+    update.callback_query = None
+    return update
+
+
+async def record(log, name, delay=0.01):
+    log.append(f"start {name}")
+    await asyncio.sleep(delay)
+    log.append(f"end {name}")
+
+
+class TestPriorityGate:
+    @pytest.mark.asyncio
+    async def test_priority_gate_admits_lower_priority_first(self):
+        """Test that waiting high-priority acquirers jump the queue"""
+        gate = PriorityGate(1)
+        await gate.acquire()
+        order = []
+
+        async def waiter(name, priority):
+            await gate.acquire(priority)
+            order.append(name)
+            gate.release()
+
+        tasks = [
+            asyncio.create_task(waiter("chatter1", PRIORITY_DEFAULT)),
+            asyncio.create_task(waiter("chatter2", PRIORITY_DEFAULT)),
+            asyncio.create_task(waiter("admin", PRIORITY_ADMIN)),
+        ]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["admin", "chatter1", "chatter2"]
+        assert gate.idle
+
+    @pytest.mark.asyncio
+    async def test_priority_gate_skips_cancelled_waiters(self):
+        """Test that a cancelled waiter does not leak a slot"""
+        gate = PriorityGate(1)
+        await gate.acquire()
+        task = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        gate.release()
+
+        assert gate.idle
+
+
+class TestChatOrderedUpdateProcessor:
+    @pytest.mark.asyncio
+    async def test_same_chat_updates_keep_order(self):
+        """Test that updates from one chat run sequentially in arrival order"""
+        processor = ChatOrderedUpdateProcessor(4)
+        log = []
+
+        await asyncio.gather(
+            processor.process_update(make_update(1), record(log, "join")),
+            processor.process_update(make_update(1), record(log, "whois")),
+        )
+
+        assert log == ["start join", "end join", "start whois", "end whois"]
+
+    @pytest.mark.asyncio
+    async def test_different_chats_run_in_parallel(self):
+        """Test that updates from different chats overlap"""
+        processor = ChatOrderedUpdateProcessor(4)
+        log = []
+
+        await asyncio.gather(
+            processor.process_update(make_update(1), record(log, "a")),
+            processor.process_update(make_update(2), record(log, "b")),
+        )
+
+        assert log[:2] == ["start a", "start b"]
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit_is_respected(self):
+        """Test that no more than the configured number of updates run at once"""
+        processor = ChatOrderedUpdateProcessor(2)
+        running = 0
+        peak = 0
+
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(
+            *(processor.process_update(make_update(chat), work()) for chat in range(6))
+        )
+
+        assert peak == 2
+        assert processor.running == 0
+        assert processor.queued == 0
+
+    @pytest.mark.asyncio
+    async def test_admin_command_jumps_ahead_of_other_chats(self):
+        """Test that an admin command takes the next free slot before other chats"""
+        processor = ChatOrderedUpdateProcessor(1, admin_id=42)
+        log = []
+
+        await asyncio.gather(
+            processor.process_update(make_update(1), record(log, "first")),
+            processor.process_update(make_update(2), record(log, "chatter")),
+            processor.process_update(
+                make_update(3, user_id=42, text="/kick @spammer"),
+                record(log, "kick"),
+            ),
+        )
+
+        assert [entry for entry in log if entry.startswith("start")] == [
+            "start first",
+            "start kick",
+            "start chatter",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_admin_command_keeps_arrival_order_in_its_chat(self):
+        """Test that a queued admin /kick waits for earlier updates in the chat"""
+        processor = ChatOrderedUpdateProcessor(2, admin_id=42)
+        log = []
+
+        await asyncio.gather(
+            processor.process_update(make_update(1), record(log, "join")),
+            processor.process_update(
+                make_update(1, text="#whois"), record(log, "whois")
+            ),
+            processor.process_update(
+                make_update(1, user_id=42, text="/kick @newcomer"),
+                record(log, "kick"),
+            ),
+        )
+
+        assert [entry for entry in log if entry.startswith("start")] == [
+            "start join",
+            "start whois",
+            "start kick",
+        ]
+
+    def test_get_priority_ignores_admin_chatter(self):
+        """Test that only admin commands are prioritised"""
+        processor = ChatOrderedUpdateProcessor(2, admin_id=42)
+
+        assert processor.get_priority(make_update(1, user_id=42)) == PRIORITY_DEFAULT
+        assert (
+            processor.get_priority(make_update(1, user_id=42, text="/status"))
+            == PRIORITY_ADMIN
+        )
+        assert (
+            processor.get_priority(make_update(1, user_id=7, text="/status"))
+            == PRIORITY_DEFAULT
+        )
+
+    def test_invalid_limit_raises_value_error(self):
+        with pytest.raises(ValueError):
+            ChatOrderedUpdateProcessor(0)
+
+
+class TestTracedUpdates:
+    @pytest.mark.asyncio
+    async def test_each_update_gets_its_own_trace(self):
+        """Test that updates are traced, including time spent queued"""
+        processor = ChatOrderedUpdateProcessor(4)
+        log = []
+
+        await processor.process_update(
+            make_update(1, text="/rave"), record(log, "rave")
+        )
+
+        trace = tracer.recent[-1]
+        assert trace.name == "update /rave"
+        assert [span.name for span in trace.spans[1:]] == ["queue.chat", "queue.slot"]
+
+    @pytest.mark.asyncio
+    async def test_sequential_processor_traces_updates(self):
+        """Test that one-at-a-time processing also traces each update"""
+        processor = TracedUpdateProcessor(1)
+        log = []
+
+        await processor.process_update(
+            make_update(1, text="/help"), record(log, "help")
+        )
+
+        assert log == ["start help", "end help"]
+        assert tracer.recent[-1].name == "update /help"
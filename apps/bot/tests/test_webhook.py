@@ -0,0 +1,79 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import MagicMock
+
+from telegram import Bot, Update
+
+from webhook import WebhookServer
+
+SECRET = "s3cret"
+
+# Recorded update: a member joining the group
+JOIN_UPDATE = {
+    "update_id": 100,
+    "message": {
+        "message_id": 6,
+        "date": 1700000000,
+        "chat": {"id": -100, "type": "supergroup", "title": "Ravers"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Raver"},
+        "new_chat_members": [{"id": 42, "is_bot": False, "first_name": "Raver"}],
+    },
+}
+
+
+@pytest.fixture
+async def server():
+    application = MagicMock()
+    application.bot = Bot("1:token")
+    application.update_queue = asyncio.Queue()
+    server = WebhookServer(application, SECRET, host="127.0.0.1", port=0)
+    await server.start()
+    yield server
+    await server.stop()
+
+
+async def post(server, body, secret=SECRET, path="/telegram", method="POST"):
+    async with httpx.AsyncClient() as client:
+        return await client.request(
+            method,
+            f"http://127.0.0.1:{server.bound_port}{path}",
+            json=body,
+            headers={"X-Telegram-Bot-Api-Secret-Token": secret},
+        )
+
+
+class TestWebhookServer:
+    @pytest.mark.asyncio
+    async def test_recorded_update_is_queued(self, server):
+        response = await post(server, JOIN_UPDATE)
+
+        assert response.status_code == 200
+        update = server.application.update_queue.get_nowait()
+        assert isinstance(update, Update)
+        assert update.effective_message.new_chat_members[0].id == 42
+        assert server.accepted == 1
+
+    @pytest.mark.asyncio
+    async def test_wrong_secret_is_rejected(self, server):
+        response = await post(server, JOIN_UPDATE, secret="guess")
+
+        assert response.status_code == 403
+        assert server.application.update_queue.empty()
+        assert server.rejected == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_path_and_method(self, server):
+        assert (await post(server, JOIN_UPDATE, path="/other")).status_code == 404
+        assert (await post(server, None, method="GET")).status_code == 405
+
+    @pytest.mark.asyncio
+    async def test_invalid_body_is_rejected(self, server):
+        response = await post(server, {"not": "an update"})
+
+        assert response.status_code == 400
+        assert server.application.update_queue.empty()
+
+    def test_secret_token_is_required(self):
+        with pytest.raises(ValueError):
+            WebhookServer(MagicMock(), "")
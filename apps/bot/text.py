@@ -4,6 +4,10 @@ success_message = "Спасибо {name}! Очень приятно познак
 
 help_message = "Вот ссылка на полезную информацию про группу: https://npdgm.notion.site/npdgm/Nice-People-Dancing-to-Good-Music-3525966262c64a9e931a9d7b1dcda7e3"
 
+flood_welcome_message = "Привет {name}! Добро пожаловать в нашу группу. <b>Чтобы остаться, представьтесь в чате сообщением с тегом #whois в течении пары часов.</b>"
+
+welcome_more_members_message = "{names} и ещё {count}"
+
 warn_message = "{name} все ещё не представились. У тебя есть еще полчаса прежде чем мы распрощаемся."
 
 no_event_url_message = "Вы ссылку на ивент забыли."
@@ -45,3 +49,15 @@ configured_announcement_set_message = (
 )
 
 configured_announcement_unset_message = "Автообновление закрепленного анонса управляется настройками деплоя и не отключается через /unset."
+
+stale_events_message = (
+    "\n<i>⚠️ Список мог устареть: последнее обновление {last_update}</i>"
+)
+
+bulk_import_progress_message = "⏳ Добавляю ивенты: {done}/{total}"
+
+bulk_import_summary_message = "Готово! Добавлено: {created}, уже были в календаре: {duplicates}, не получилось: {failed}."
+
+bulk_import_limit_message = (
+    "За раз можно добавить не больше {limit} ссылок, пропущено: {skipped}."
+)
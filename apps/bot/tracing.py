@@ -0,0 +1,209 @@
+import contextlib
+import contextvars
+import functools
+import itertools
+import time
+import uuid
+from collections import deque
+
+from telegram import Update
+
+from settings import TracingConfiguration
+from utils import correlation_id, logger
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed step of a trace; ``parent_id`` links it to the enclosing step."""
+
+    def __init__(self, trace: "Trace", name: str, parent_id, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = next(trace._span_ids)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: "float | None" = None
+        self.error: "str | None" = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self) -> dict:
+        data = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset_ms": round((self.start - self.trace.root.start) * 1000, 1),
+            "duration_ms": (
+                None if self.duration is None else round(self.duration * 1000, 1)
+            ),
+        }
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class Trace:
+    """Spans recorded while handling one update, under one correlation ID."""
+
+    def __init__(self, name: str, attributes: dict, max_spans: int):
+        self.correlation_id = uuid.uuid4().hex[:16]
+        self.max_spans = max_spans
+        self.spans: list[Span] = []
+        self.dropped = 0
+        self._span_ids = itertools.count()
+        self.root = Span(self, name, None, attributes)
+        self.spans.append(self.root)
+        self.finished_at: "float | None" = None
+
+    @property
+    def name(self) -> str:
+        return self.root.name
+
+    @property
+    def duration(self) -> float:
+        if self.root.duration is None:
+            return time.perf_counter() - self.root.start
+        return self.root.duration
+
+    def add_span(self, name: str, parent_id, attributes: dict) -> "Span | None":
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return None
+        span = Span(self, name, parent_id, attributes)
+        self.spans.append(span)
+        return span
+
+    def to_dict(self) -> dict:
+        data = {
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000, 1),
+            "spans": [span.to_dict() for span in self.spans],
+        }
+        if self.dropped:
+            data["dropped_spans"] = self.dropped
+        return data
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Time the block as a child of the current span.
+
+    Outside of a trace the block runs untimed and ``None`` is yielded.
+    Tasks created inside the block inherit it as their parent; once the
+    update's trace has been recorded, spans they open are no longer added.
+    """
+    parent = _current_span.get()
+    current = (
+        None
+        if parent is None or parent.trace.finished_at is not None
+        else parent.trace.add_span(name, parent.span_id, attributes)
+    )
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+
+
+def traced(name: str):
+    """Decorator running an async function inside ``span(name)``."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def describe_update(update: object) -> "tuple[str, dict]":
+    """Trace name and attributes for an incoming update."""
+    if not isinstance(update, Update):
+        return "update", {}
+    attributes = {"update_id": update.update_id}
+    if update.effective_chat is not None:
+        attributes["chat_id"] = update.effective_chat.id
+    if update.effective_user is not None:
+        attributes["user_id"] = update.effective_user.id
+    message = update.effective_message
+    if update.callback_query is not None:
+        return "update callback_query", attributes
+    if message is not None and message.text and message.text.startswith("/"):
+        command = message.text.split(maxsplit=1)[0].split("@", 1)[0]
+        return f"update {command}", attributes
+    if message is not None and message.new_chat_members:
+        return "update join", attributes
+    return "update message" if message is not None else "update", attributes
+
+
+class Tracer:
+    """Gives every update a correlation ID and records its spans.
+
+    A finished trace is logged as one record with every span as structured
+    fields (see ``utils.JsonFormatter``), and the most recent ones are kept
+    so the slowest can be inspected with /traces.
+    """
+
+    def __init__(self, history: "int | None" = None, max_spans: "int | None" = None):
+        self.history = TracingConfiguration.history if history is None else history
+        self.max_spans = (
+            TracingConfiguration.max_spans if max_spans is None else max_spans
+        )
+        self.recent: deque[Trace] = deque(maxlen=self.history)
+        self.completed = 0
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **attributes):
+        trace = Trace(name, attributes, self.max_spans)
+        span_token = _current_span.set(trace.root)
+        id_token = correlation_id.set(trace.correlation_id)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.root.error = type(e).__name__
+            raise
+        finally:
+            trace.root.finish()
+            trace.finished_at = time.time()
+            self.record(trace)
+            _current_span.reset(span_token)
+            correlation_id.reset(id_token)
+
+    def trace_update(self, update: object):
+        name, attributes = describe_update(update)
+        return self.trace(name, **attributes)
+
+    def record(self, trace: Trace):
+        self.completed += 1
+        self.recent.append(trace)
+        logger.info(
+            f"Trace {trace.name} took {trace.duration * 1000:.0f} ms "
+            f"({len(trace.spans)} spans)",
+            extra={"fields": {"trace": trace.to_dict()}},
+        )
+
+    def slowest(self, limit: int = 5) -> "list[Trace]":
+        return sorted(self.recent, key=lambda trace: trace.duration, reverse=True)[
+            :limit
+        ]
+
+
+tracer = Tracer()
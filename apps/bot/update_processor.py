@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import itertools
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor, SimpleUpdateProcessor
+
+from tracing import span, tracer
+from utils import logger
+
+PRIORITY_ADMIN = 0
+PRIORITY_DEFAULT = 1
+
+
+class PriorityGate:
+    """Counting gate that admits waiters by priority, FIFO within a priority.
+
+    Lower priority values are admitted first. With a limit of 1 it works as a
+    lock that keeps arrival order for equal priorities.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and self.waiting == 0
+
+    async def acquire(self, priority: int = PRIORITY_DEFAULT):
+        if self.active < self.limit and self.waiting == 0:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.waiting += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Cancelled entries stay in the heap and are skipped by release().
+                self.waiting -= 1
+            else:
+                # The slot was handed over right before cancellation.
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot straight to the next waiter; active stays the same.
+                self.waiting -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping their order within a chat.
+
+    Updates from different chats (or users, for updates without a chat) run in
+    parallel, up to ``max_concurrent_updates`` at a time. Updates that share a
+    chat run one after another in arrival order, whoever sent them. Commands
+    sent by the admin skip ahead of ordinary updates waiting for one of the
+    global concurrency slots.
+
+    The base class semaphore only bounds how many updates may be pending at
+    once; the real concurrency limit is applied after the per-chat ordering so
+    updates waiting on a busy chat do not hold slots other chats could use.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        max_pending_updates: int = 256,
+        admin_id: "int | None" = None,
+    ):
+        super().__init__(max(max_concurrent_updates, max_pending_updates))
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self.concurrency_limit = max_concurrent_updates
+        self.admin_id = admin_id
+        self._slots = PriorityGate(max_concurrent_updates)
+        self._lanes: dict = {}
+
+    @property
+    def running(self) -> int:
+        return self._slots.active
+
+    @property
+    def queued(self) -> int:
+        return self._slots.waiting + sum(lane.waiting for lane in self._lanes.values())
+
+    def get_priority(self, update: object) -> int:
+        if not isinstance(update, Update) or self.admin_id is None:
+            return PRIORITY_DEFAULT
+        user = update.effective_user
+        message = update.effective_message
+        if (
+            user is not None
+            and user.id == self.admin_id
+            and message is not None
+            and message.text
+            and message.text.startswith("/")
+        ):
+            return PRIORITY_ADMIN
+        return PRIORITY_DEFAULT
+
+    @staticmethod
+    def get_ordering_key(update: object):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return f"user_{update.effective_user.id}"
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        with tracer.trace_update(update):
+            priority = self.get_priority(update)
+            key = self.get_ordering_key(update)
+            if key is None:
+                await self._run(coroutine, priority)
+                return
+
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = PriorityGate(1)
+            with span("queue.chat"):
+                # Strict arrival order within a chat: join, #whois, /kick
+                await lane.acquire()
+            try:
+                await self._run(coroutine, priority)
+            finally:
+                lane.release()
+                if lane.idle and self._lanes.get(key) is lane:
+                    del self._lanes[key]
+
+    async def _run(self, coroutine, priority: int):
+        with span("queue.slot"):
+            await self._slots.acquire(priority)
+        try:
+            await coroutine
+        finally:
+            self._slots.release()
+
+    async def initialize(self):
+        logger.info(
+            f"Concurrent update processing enabled (limit {self.concurrency_limit})"
+        )
+
+    async def shutdown(self):
+        self._lanes.clear()
+
+
+class TracedUpdateProcessor(SimpleUpdateProcessor):
+    """PTB's one-at-a-time processing, with each update in its own trace."""
+
+    async def do_process_update(self, update, coroutine):
+        with tracer.trace_update(update):
+            await coroutine
@@ -1,8 +1,11 @@
-import logging, datetime, sys, json
+import logging, datetime, sys, json, contextvars
 from urllib.parse import urlparse, urlunparse
 
 from settings import LoggingConfiguration
 
+# Set by tracing for the update being handled; added to every JSON log record
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
 
 # Custom JSON formatter for structured logging
 class JsonFormatter(logging.Formatter):
@@ -13,6 +16,13 @@ class JsonFormatter(logging.Formatter):
             "logger": record.name,
             "message": record.getMessage(),
         }
+        current_correlation_id = correlation_id.get()
+        if current_correlation_id is not None:
+            log_data["correlation_id"] = current_correlation_id
+        # Structured fields passed as logger.info(..., extra={"fields": {...}})
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            log_data.update(fields)
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
         return json.dumps(log_data)
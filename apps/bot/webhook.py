@@ -0,0 +1,193 @@
+import asyncio
+import hmac
+import json
+import signal
+
+from telegram import Update
+from telegram.ext import Application
+
+from settings import ShardConfiguration, WebhookConfiguration
+from utils import logger
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+# Telegram updates are small; anything larger is not an update
+MAX_BODY_BYTES = 1024 * 1024
+REQUEST_TIMEOUT_SECONDS = 10
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    502: "Bad Gateway",
+}
+
+
+class WebhookServer:
+    """Minimal HTTP server that accepts updates pushed by Telegram.
+
+    Each POST to ``path`` must carry the secret token given to setWebhook in
+    the ``X-Telegram-Bot-Api-Secret-Token`` header. Accepted updates go to the
+    application's update queue, exactly like updates fetched by polling, so
+    recorded updates can be replayed locally with any HTTP client.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        secret_token: str,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        path: str = "/telegram",
+    ):
+        if not secret_token:
+            raise ValueError("A webhook secret token is required")
+        self.application = application
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server: "asyncio.base_events.Server | None" = None
+        self.accepted = 0
+        self.rejected = 0
+
+    @property
+    def bound_port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Webhook server listening on {self.host}:{self.bound_port}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status = await asyncio.wait_for(
+                self._process(reader), REQUEST_TIMEOUT_SECONDS
+            )
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning(f"Malformed webhook request: {e}")
+            status = 400
+        if status == 200:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+        try:
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                "Content-Length: 0\r\nConnection: close\r\n\r\n".encode("ascii")
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _process(self, reader: asyncio.StreamReader) -> int:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise ValueError("bad request line")
+        method, target, _ = request_line
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if target.split("?", 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if not hmac.compare_digest(
+            headers.get(SECRET_TOKEN_HEADER, "").encode(), self.secret_token.encode()
+        ):
+            logger.warning("Rejected webhook request with a wrong secret token")
+            return 403
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_BYTES:
+            return 413
+
+        try:
+            data = json.loads(await reader.readexactly(length))
+        except json.JSONDecodeError as e:
+            logger.warning(f"Webhook body is not JSON: {e}")
+            return 400
+        return await self.dispatch(data)
+
+    async def dispatch(self, data) -> int:
+        """Hand one decoded update to the application; returns the HTTP status."""
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except (TypeError, KeyError, AttributeError) as e:
+            logger.warning(f"Webhook body is not a Telegram update: {e}")
+            return 400
+        if update is None:
+            return 400
+        await self.application.update_queue.put(update)
+        return 200
+
+
+async def serve_webhook(application: Application, stop_signals=None):
+    """Run the application with updates pushed to an embedded webhook server.
+
+    Mirrors ``Application.run_polling``: post_init runs after initialisation,
+    and post_stop and post_shutdown run on the way out. The webhook is only
+    registered with Telegram when ``WEBHOOK_URL`` is set and the bot is not
+    sharded, so the server can be run locally and fed recorded updates.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in stop_signals or (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = WebhookServer(
+        application,
+        WebhookConfiguration.secret_token,
+        host=WebhookConfiguration.listen,
+        port=WebhookConfiguration.port,
+        path=WebhookConfiguration.path,
+    )
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await server.start()
+        if WebhookConfiguration.url and ShardConfiguration.count == 1:
+            # Sharded workers are registered by the router instead. Pending
+            # updates are delivered once the webhook is set; stale commands
+            # among them are skipped by is_old_command.
+            await application.bot.set_webhook(
+                WebhookConfiguration.url,
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=WebhookConfiguration.secret_token,
+                drop_pending_updates=False,
+            )
+            logger.info(f"Webhook registered at {WebhookConfiguration.url}")
+        else:
+            logger.warning("WEBHOOK_URL is not set; webhook not registered")
+        await application.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application: Application):
+    asyncio.run(serve_webhook(application))